@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+"""
+Local stand-in for github with scriptable faults, to see how the crawler
+copes with throttling, flaky servers and slow networks (see
+`fault_harness.py`).
+It serves a search page with links to `repos` repositories, and a page with
+language stats for each of them. It runs in its own thread (with its own
+event loop), so it keeps answering even while the crawler's loop is blocked.
+Run on its own, it serves without faults until killed, printing its url
+first (see `regression.py`).
+
+Usage:
+    fake_github.py [--repos=N] [--page-size=BYTES] [--seed=N]
+    fake_github.py (-h | --help)
+
+Options:
+    -h --help          show this screen.
+    --repos=N          repositories in the search results [default: 100]
+    --page-size=BYTES  size of the repository pages [default: 20000]
+    --seed=N           seed for the random choices [default: 1]
+"""
+
+import asyncio
+import random
+import sys
+import threading
+import time
+
+from collections import Counter
+
+from aiohttp import web
+from docopt import docopt
+
+
+SEARCH_ITEM = """
+<li class="repo-list-item hx_hit-repo">
+  <div class="f4"><a href="/{owner}/{repo}">{owner}/{repo}</a></div>
+</li>
+"""
+
+REPO_PAGE = """<!DOCTYPE html>
+<html><body>
+<article class="markdown-body">{padding}</article>
+<h2 class="h4 mb-3">Languages</h2>
+<ul class="list-style-none">
+  <li class="d-inline"><a href="/{owner}/{repo}/search?l=python">
+    <span class="text-bold mr-1">Python</span><span>{python:.1f}%</span>
+  </a></li>
+  <li class="d-inline"><a href="/{owner}/{repo}/search?l=shell">
+    <span class="text-bold mr-1">Shell</span><span>{shell:.1f}%</span>
+  </a></li>
+</ul>
+</body></html>
+"""
+
+
+class Faults:
+    """
+    What goes wrong, and how often. Every request gets, in this order:
+    - a delay drawn from `latency`: None, `('const', seconds)`,
+      `('uniform', low, high)` or `('lognormal', median, sigma)`
+    - a 429 if it comes during a throttling burst: for `burst_time` seconds
+      out of every `burst_every`
+    - a 503 with probability `error_rate`
+    - its connection reset halfway through the body with probability
+      `reset_rate`
+    - its body trickled in `trickle_chunks` pieces over `trickle_time`
+      seconds with probability `trickle_rate`
+    """
+
+    def __init__(
+            self, latency=None, burst_every=0, burst_time=0, error_rate=0,
+            reset_rate=0, trickle_rate=0, trickle_time=1, trickle_chunks=10):
+        self.latency = latency
+        self.burst_every = burst_every
+        self.burst_time = burst_time
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.trickle_rate = trickle_rate
+        self.trickle_time = trickle_time
+        self.trickle_chunks = trickle_chunks
+
+    def delay(self, rng):
+        if not self.latency:
+            return 0
+        kind, *params = self.latency
+        if kind == 'const':
+            return params[0]
+        elif kind == 'uniform':
+            return rng.uniform(*params)
+        elif kind == 'lognormal':
+            median, sigma = params
+            return median * rng.lognormvariate(0, sigma)
+        raise ValueError(f'unknown latency distribution `{kind}`')
+
+    def throttled(self, elapsed):
+        return bool(self.burst_every) and \
+            elapsed % self.burst_every < self.burst_time
+
+
+class FakeGitHub:
+    """
+    The server. Use it as a context manager (or call `start` and `stop`);
+    `url` is what to use as the crawler's `gh_url`.
+    `stats` counts the requests by outcome, and `ok_paths` has the paths
+    that were fully served at least once
+    """
+
+    def __init__(self, repos=100, faults=None, page_size=20000, seed=1):
+        self.repos = [(f'user{i}', f'repo{i}') for i in range(repos)]
+        self.faults = faults or Faults()
+        self.page_size = page_size
+        self.rng = random.Random(seed)
+        self.stats = Counter()
+        self.ok_paths = set()
+        self.url = None
+        self.loop = None
+        self.runner = None
+        self.thread = None
+        self.started = None
+
+    def search_page(self):
+        items = ''.join(
+            SEARCH_ITEM.format(owner=owner, repo=repo)
+            for owner, repo in self.repos)
+        return (
+            f'<div class="codesearch-results"><div>'
+            f'<ul class="repo-list">{items}</ul></div></div>')
+
+    def repo_page(self, owner, repo):
+        rng = random.Random(f'{owner}/{repo}')
+        python = rng.uniform(50, 100)
+        return REPO_PAGE.format(
+            owner=owner, repo=repo, python=python, shell=100 - python,
+            padding='lorem ipsum ' * (self.page_size // 12))
+
+    async def handle(self, request):
+        self.stats['requests'] += 1
+        if request.path == '/robots.txt':
+            # where the crawler warms up its connections
+            return web.Response(text='User-agent: *\n')
+        if request.path == '/search':
+            body = self.search_page()
+        elif len(parts := request.path.strip('/').split('/')) == 2:
+            body = self.repo_page(*parts)
+        else:
+            self.stats['404'] += 1
+            return web.Response(status=404)
+
+        faults = self.faults
+        if delay := faults.delay(self.rng):
+            await asyncio.sleep(delay)
+        if faults.throttled(time.monotonic() - self.started):
+            self.stats['429'] += 1
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        if self.rng.random() < faults.error_rate:
+            self.stats['503'] += 1
+            return web.Response(status=503)
+
+        data = body.encode('utf-8')
+        response = web.StreamResponse(
+            headers={'Content-Type': 'text/html; charset=utf-8'})
+        response.content_length = len(data)
+        await response.prepare(request)
+        if self.rng.random() < faults.reset_rate:
+            self.stats['reset'] += 1
+            await response.write(data[:len(data) // 2])
+            request.transport.close()
+            return response
+        # counted before the last write, or the client could be done with it
+        # before it's counted
+        self.stats['200'] += 1
+        new_path = request.path not in self.ok_paths
+        self.ok_paths.add(request.path)
+        try:
+            if self.rng.random() < faults.trickle_rate:
+                self.stats['trickle'] += 1
+                step = -(-len(data) // faults.trickle_chunks)
+                for i in range(0, len(data), step):
+                    await response.write(data[i:i + step])
+                    await asyncio.sleep(
+                        faults.trickle_time / faults.trickle_chunks)
+            else:
+                await response.write(data)
+            await response.write_eof()
+        except (ConnectionError, asyncio.CancelledError):
+            # the client gave up on it
+            self.stats['200'] -= 1
+            self.stats['aborted'] += 1
+            if new_path:
+                self.ok_paths.discard(request.path)
+            raise
+        return response
+
+    def wasted_requests(self):
+        """
+        Requests that didn't get the crawler anything new: failed ones and
+        repeated fetches of the same page
+        """
+        return self.stats['requests'] - len(self.ok_paths)
+
+    def start(self):
+        ready = threading.Event()
+        self.loop = asyncio.new_event_loop()
+
+        async def serve():
+            app = web.Application()
+            app.router.add_get('/{tail:.*}', self.handle)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            self.url = f'http://127.0.0.1:{port}'
+            self.started = time.monotonic()
+            ready.set()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(serve())
+            self.loop.run_forever()
+            self.loop.run_until_complete(self.runner.cleanup())
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    arguments = docopt(__doc__)
+    with FakeGitHub(
+            int(arguments['--repos']), page_size=int(arguments['--page-size']),
+            seed=int(arguments['--seed'])) as gh:
+        print(gh.url, flush=True)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""
+Fault-injection harness
+
+Crawl a local fake github (see `fake_github.py`) under different fault
+scenarios with different backoff strategies, and compare how long every
+crawl took, how many of its requests were wasted (failed or repeated), and
+for how long its event loop was blocked (nothing else could make progress
+meanwhile).
+The backoff waits, retry budget and circuit breaker timeouts of the crawler
+are multiplied by `--time-scale`, so a scenario takes seconds instead of
+minutes. The faults themselves are not scaled.
+
+Usage:
+    fault_harness.py [SCENARIO...] [--strategy=NAME]... [--repos=N]
+                     [--time-scale=X] [--seed=N] [--log-level=LEVEL]
+    fault_harness.py --list
+    fault_harness.py (-h | --help)
+
+Options:
+    -h --help          show this screen.
+    --list             list the scenarios and strategies.
+    --strategy=NAME    backoff strategy to use, can be repeated (all of them
+                       by default).
+    --repos=N          repositories in the search results [default: 100]
+    --time-scale=X     multiply the crawler's waits by X [default: 0.01]
+    --seed=N           seed for the faults [default: 1]
+    --log-level=LEVEL  log level of the crawler [default: critical]
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import sys
+import time
+
+from docopt import docopt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_github import FakeGitHub, Faults  # noqa: E402
+from gh_search import fetchers, metrics, proxies  # noqa: E402
+from gh_search.utils import gh_search_iter  # noqa: E402
+
+
+SCENARIOS = {
+    'clean': {},
+    'latency': {'latency': ('lognormal', 0.05, 1)},
+    'throttled': {'burst_every': 1, 'burst_time': 0.3},
+    'errors': {'error_rate': 0.1},
+    'resets': {'reset_rate': 0.05},
+    'trickle': {'trickle_rate': 0.2, 'trickle_time': 0.5},
+    'mixed': {
+        'latency': ('uniform', 0, 0.05), 'burst_every': 2, 'burst_time': 0.2,
+        'error_rate': 0.03, 'reset_rate': 0.02, 'trickle_rate': 0.05,
+        'trickle_time': 0.5},
+}
+
+# settings of `gh_search.fetchers` for every strategy, in unscaled seconds
+STRATEGIES = {
+    'blocking': {'BLOCKING_BACKOFF': True},
+    'async': {'BLOCKING_BACKOFF': False},
+    'async-capped': {'BLOCKING_BACKOFF': False, 'MAX_BACKOFF': 8},
+}
+
+# settings of `gh_search.fetchers` that are multiplied by the time scale
+SCALED = ('BACKOFF_BASE', 'MAX_BACKOFF', 'RETRY_BUDGET')
+
+HEARTBEAT = 0.005  # seconds between checks of the event loop
+STALL = 0.01  # a heartbeat this late means the loop was blocked
+
+
+class LoopMonitor:
+    """
+    Heartbeat on the event loop, adding up for how long it was blocked
+    """
+
+    def __init__(self):
+        self.blocked = 0
+        self.longest = 0
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(HEARTBEAT)
+            if (late := loop.time() - start - HEARTBEAT) > STALL:
+                self.blocked += late
+                self.longest = max(self.longest, late)
+
+
+@contextlib.contextmanager
+def configured(module, **values):
+    """
+    Set some module level settings, and put the old ones back at the end
+    """
+    old = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            setattr(module, name, value)
+
+
+async def crawl(gh_url, monitor):
+    heartbeat = asyncio.ensure_future(monitor.run())
+    try:
+        return [
+            result async for result in gh_search_iter(
+                ['fake'], 'repositories', gh_url)]
+    finally:
+        heartbeat.cancel()
+
+
+def run(scenario, strategy, repos, time_scale, seed):
+    """
+    Crawl a fake github with the faults of `scenario`, backing off with
+    `strategy`, and return a row of the report
+    """
+    settings = {name: getattr(fetchers, name) for name in SCALED}
+    settings.update(STRATEGIES[strategy])
+    settings.update({name: settings[name] * time_scale for name in SCALED})
+    proxies.set_proxies(
+        [None], reset_timeout=proxies.RESET_TIMEOUT * time_scale)
+    metrics.reset()
+    monitor = LoopMonitor()
+    results, gave_up = [], False
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    faults = Faults(**SCENARIOS[scenario])
+    with FakeGitHub(repos, faults, seed=seed) as gh, \
+            configured(fetchers, **settings):
+        start = time.monotonic()
+        try:
+            results = loop.run_until_complete(crawl(gh.url, monitor))
+        except fetchers.FetchError:  # the search page could not be fetched
+            gave_up = True
+        seconds = time.monotonic() - start
+    loop.close()
+
+    return (
+        f'{scenario:10} {strategy:13} {seconds:8.2f} '
+        f'{len(results):>5}/{repos:<5} {gh.stats["requests"]:8} '
+        f'{gh.wasted_requests():7} {monitor.blocked:9.2f} '
+        f'{monitor.longest * 1000:9.0f} {metrics.get("retries"):7} '
+        f'{"yes" if gave_up else "no":>7}')
+
+
+def main():
+    arguments = docopt(__doc__)
+    if arguments['--list']:
+        print('scenarios:')
+        for name, faults in SCENARIOS.items():
+            print(f'    {name:13} {faults}')
+        print('strategies:')
+        for name, settings in STRATEGIES.items():
+            print(f'    {name:13} {settings}')
+        return 0
+
+    scenarios = arguments['SCENARIO'] or list(SCENARIOS)
+    strategies = arguments['--strategy'] or list(STRATEGIES)
+    if unknown := set(scenarios) - set(SCENARIOS):
+        print(f'unknown scenarios: {", ".join(sorted(unknown))}')
+        return 1
+    if unknown := set(strategies) - set(STRATEGIES):
+        print(f'unknown strategies: {", ".join(sorted(unknown))}')
+        return 1
+
+    logging.basicConfig(level=arguments['--log-level'].upper())
+    # the fake github is local, whatever proxy is set must not be used
+    for name in ('HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy'):
+        os.environ.pop(name, None)
+
+    repos, time_scale, seed = (
+        int(arguments['--repos']), float(arguments['--time-scale']),
+        int(arguments['--seed']))
+    # the first crawl pays for the imports, it's not shown
+    run('clean', strategies[0], repos, time_scale, seed)
+
+    print(f'{"scenario":10} {"strategy":13} {"seconds":>8} {"found":>11} '
+          f'{"requests":>8} {"wasted":>7} {"blocked s":>9} '
+          f'{"stall ms":>9} {"retries":>7} {"gave up":>7}')
+    for scenario in scenarios:
+        for strategy in strategies:
+            print(run(scenario, strategy, repos, time_scale, seed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
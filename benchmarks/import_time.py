@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Import time benchmark
+
+Measure how long every phase of the crawler takes to import (using
+`python -X importtime`) and check it against a time budget. It also checks
+that the heavy dependencies are only loaded by the phases that use them.
+The modules imported by the interpreter on its own (`site` and friends) are
+not counted.
+
+Usage:
+    import_time.py [--repeat=N] [--scale=X] [--top=N]
+    import_time.py (-h | --help)
+
+Options:
+    -h --help   show this screen.
+    --repeat=N  runs of every phase, the median is used [default: 7]
+    --scale=X   multiply all the budgets by X, for slow machines [default: 1]
+    --top=N     show the N slowest modules of every phase [default: 5]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+from docopt import docopt
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('aiohttp', 'bs4', 'requests')
+
+# name: (python arguments, budget in ms, modules that must not be loaded)
+PHASES = {
+    'cli': (['gh_search.py', '--version'], 30, HEAVY + ('asyncio',)),
+    'search': (['-c', 'import gh_search.utils'], 80, HEAVY),
+    'sharded': (['-c', 'import gh_search.sharded'], 100, HEAVY),
+    'reparse': (['-c', 'import gh_search.reparse'], 60, HEAVY),
+    'parse': (
+        ['-c', 'from gh_search.parse_html import make_soup; make_soup("")'],
+        150, ('aiohttp', 'requests')),
+}
+
+
+def import_times(args):
+    """
+    Run python with `args` and return the `(self, cumulative)` import times
+    (in us) of every module it imports, and the names of the top level ones
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        text=True, check=True)
+    times, top_level = {}, []
+    for line in process.stderr.splitlines()[1:]:
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative))
+        if not name.startswith('  '):  # nested imports are already counted
+            top_level.append(name.strip())
+    return times, top_level
+
+
+def measure(args, startup, repeat):
+    """
+    Median import time (in ms) of a phase, the modules it loads and how long
+    each one takes on its own
+    """
+    totals, self_times = [], {}
+    for _ in range(repeat):
+        times, top_level = import_times(args)
+        own = [name for name in top_level if name not in startup]
+        totals.append(sum(times[name][1] for name in own) / 1000)
+        for name, (self_us, _) in times.items():
+            if name not in startup:
+                self_times.setdefault(name, []).append(self_us / 1000)
+    slowest = sorted(
+        ((statistics.median(ms), name) for name, ms in self_times.items()),
+        reverse=True)
+    return statistics.median(totals), set(self_times), slowest
+
+
+def main():
+    arguments = docopt(__doc__)
+    repeat = int(arguments['--repeat'])
+    scale = float(arguments['--scale'])
+    top = int(arguments['--top'])
+
+    startup = set(import_times(['-c', 'pass'])[0])
+
+    failed = False
+    for phase, (args, budget, forbidden) in PHASES.items():
+        budget *= scale
+        total, modules, slowest = measure(args, startup, repeat)
+        loaded = sorted(
+            name for name in modules if name.split('.')[0] in forbidden)
+        ok = total <= budget and not loaded
+        failed = failed or not ok
+        print(
+            f'{phase:8} {total:7.1f} ms  (budget {budget:.0f} ms)  '
+            f'{"ok" if ok else "FAIL"}')
+        for ms, name in slowest[:top]:
+            print(f'    {ms:7.1f} ms  {name}')
+        if loaded:
+            print(f'    loads {", ".join(loaded)}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+Parser benchmark
+
+Time what happens to every fetched page until it's parsed, on a parse cache
+miss and on a hit, with the pages as the fetchers used to give them (decoded
+to a str, which is encoded again for the parse cache key and the archive)
+and as they give them now (utf-8 bytes, only decoded by the parser). The
+last row is what handing the bytes to bs4 would cost: it detects their
+encoding even when it's given.
+Pages are synthetic repo pages (see `transfer.py`) with a github footer, so
+they have some non-ascii characters, as the real ones.
+
+Usage:
+    parse.py [--pages=N] [--repeat=N]
+    parse.py (-h | --help)
+
+Options:
+    -h --help    show this screen.
+    --pages=N    number of pages [default: 200]
+    --repeat=N   runs of every mode, the best one is shown [default: 5]
+"""
+
+import hashlib
+import os
+import random
+import sys
+import time
+
+from docopt import docopt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.transfer import synthetic_page  # noqa: E402
+from gh_search.parse_cache import cache_key  # noqa: E402
+from gh_search.parse_html import (  # noqa: E402
+    _archived, _lang_stats, make_soup, parse_repo_page)
+
+
+FOOTER = '<footer>© 2023 GitHub, Inc. · Terms · Privacy</footer>'
+
+
+def str_miss(body):
+    content = body.decode('utf-8')
+    cache_key(parse_repo_page, content)
+    hashlib.sha256(content.encode('utf-8'))  # archived
+    parse_repo_page(content)
+
+
+def str_hit(body):
+    content = body.decode('utf-8')
+    cache_key(parse_repo_page, content)
+    hashlib.sha256(content.encode('utf-8'))
+
+
+def bytes_miss(body):
+    cache_key(parse_repo_page, body)
+    hashlib.sha256(body)
+    parse_repo_page(body)
+
+
+def bytes_hit(body):
+    cache_key(parse_repo_page, body)
+    hashlib.sha256(body)
+
+
+def bs4_miss(body):
+    from bs4 import BeautifulSoup
+
+    cache_key(parse_repo_page, body)
+    hashlib.sha256(body)
+    soup = BeautifulSoup(body, 'html.parser', from_encoding='utf-8')
+    # what `parse_repo_page` does with its soup
+    _lang_stats(soup), _archived(soup)
+
+
+def best_times(steps, bodies, repeat):
+    """
+    Best seconds per page of every step, running them in turn on every
+    repeat so they all see the same noise
+    """
+    times = [[] for _ in steps]
+    for _ in range(repeat):
+        for step, step_times in zip(steps, times):
+            start = time.perf_counter()
+            for body in bodies:
+                step(body)
+            step_times.append(time.perf_counter() - start)
+    return [min(step_times) / len(bodies) for step_times in times]
+
+
+def main():
+    arguments = docopt(__doc__)
+    n, repeat = int(arguments['--pages']), int(arguments['--repeat'])
+    rng = random.Random(42)
+    bodies = [
+        synthetic_page(rng).replace('</body>', f'{FOOTER}</body>').encode()
+        for _ in range(n)]
+    make_soup('')  # import bs4 before timing anything
+
+    modes = [
+        ('miss', 'str (old)', str_miss), ('miss', 'bytes', bytes_miss),
+        ('miss', 'bytes to bs4', bs4_miss),
+        ('hit', 'str (old)', str_hit), ('hit', 'bytes', bytes_hit)]
+    size = sum(map(len, bodies)) / n
+    print(f'{n} pages of {size / 1024:.1f}KB on average, best of {repeat}')
+    print(f'{"cache":6} {"pages as":13} {"ms/page":>8} {"saved µs/page":>14}')
+    old = {}
+    seconds = best_times([step for _, _, step in modes], bodies, repeat)
+    for (cache, label, _), mode_seconds in zip(modes, seconds):
+        old.setdefault(cache, mode_seconds)
+        print(f'{cache:6} {label:13} {mode_seconds * 1000:8.3f} '
+              f'{(old[cache] - mode_seconds) * 1e6:14.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
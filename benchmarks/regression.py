@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+"""
+Performance regression guard
+
+Run a fixed scenario of the crawler and the parsers against local fixtures
+`--repeat` times, and compare the median of every measure with the one in a
+baseline file. A measure regresses when it gets worse than the baseline by
+more than `--threshold` (relative) and by more than the spread (IQR) of both
+sets of runs, so noise alone doesn't make it fail.
+The measures are:
+
+crawl.throughput
+: repo pages per second crawling a local fake github (`fake_github.py`,
+  running in its own process)
+
+crawl.latency
+: ms per repo page request in that crawl
+
+crawl.memory
+: peak MB allocated by the crawl (with tracemalloc, in separate runs)
+
+parse.repo, parse.search
+: ms to parse a synthetic repo page or a search page
+
+Use `save` to run the scenario and store its results as the new baseline.
+Baselines depend on the machine, so compare runs made on the same one.
+
+Usage:
+    regression.py [save] [--baseline=FILE] [--repeat=N] [--threshold=X]
+                  [--repos=N]
+    regression.py (-h | --help)
+
+Options:
+    -h --help        show this screen.
+    --baseline=FILE  baseline file [default: benchmarks/baseline.json]
+    --repeat=N       runs of the scenario [default: 5]
+    --threshold=X    relative regression tolerated [default: 0.1]
+    --repos=N        repositories in the crawl [default: 200]
+"""
+
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from docopt import docopt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_github import FakeGitHub  # noqa: E402
+from benchmarks.transfer import synthetic_page  # noqa: E402
+from gh_search import metrics, parse_cache, proxies  # noqa: E402
+from gh_search.parse_html import parse_links, parse_repo_page  # noqa: E402
+from gh_search.utils import gh_search_iter  # noqa: E402
+
+
+# measure: True if higher is better
+MEASURES = {
+    'crawl.throughput': True,
+    'crawl.latency': False,
+    'crawl.memory': False,
+    'parse.repo': False,
+    'parse.search': False,
+}
+
+PARSE_PAGES = 100
+PAGE_SIZE = 50000
+SEED = 42
+
+
+def start_fake_github(repos):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'fake_github.py'),
+         f'--repos={repos}', f'--page-size={PAGE_SIZE}', f'--seed={SEED}'],
+        stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+def crawl(gh_url, repos):
+    """
+    Crawl the fake github once, and return how long it took
+    """
+    async def collect():
+        return [
+            result async for result in gh_search_iter(
+                ['fake'], 'repositories', gh_url)]
+
+    proxies.set_proxies([None])
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    start = time.perf_counter()
+    found = loop.run_until_complete(collect())
+    seconds = time.perf_counter() - start
+    loop.close()
+    if len(found) != repos:
+        raise RuntimeError(f'found {len(found)} repos instead of {repos}')
+    return seconds
+
+
+def crawl_run(gh_url, repos):
+    metrics.reset()
+    seconds = crawl(gh_url, repos)
+    return {
+        'crawl.throughput': repos / seconds,
+        'crawl.latency': metrics.get('fetch.repo.seconds')
+        / metrics.get('fetch.repo.requests') * 1000,
+    }
+
+
+def crawl_memory_run(gh_url, repos):
+    tracemalloc.start()
+    try:
+        crawl(gh_url, repos)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'crawl.memory': peak / 1e6}
+
+
+def parse_run(repo_pages, search_pages):
+    start = time.perf_counter()
+    for page in repo_pages:
+        parse_repo_page(page)
+    repo_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for page in search_pages:
+        parse_links(page, 'repositories', 'https://github.com')
+    search_seconds = time.perf_counter() - start
+    return {
+        'parse.repo': repo_seconds / len(repo_pages) * 1000,
+        'parse.search': search_seconds / len(search_pages) * 1000,
+    }
+
+
+def summarize(values):
+    """
+    Median and interquartile range of some runs
+    """
+    if len(values) < 2:
+        return {'median': values[0], 'iqr': 0}
+    q1, _, q3 = statistics.quantiles(values, n=4)
+    return {'median': statistics.median(values), 'iqr': q3 - q1}
+
+
+def run_scenario(repeat, repos):
+    rng = random.Random(SEED)
+    # as the fetchers give them
+    repo_pages = [synthetic_page(rng).encode() for _ in range(PARSE_PAGES)]
+    search_pages = [FakeGitHub(10).search_page().encode()] * PARSE_PAGES
+    # every run must do the same work
+    parse_cache.configure(max_entries=0)
+    for name in ('HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy'):
+        os.environ.pop(name, None)
+
+    process, gh_url = start_fake_github(repos)
+    try:
+        crawl(gh_url, repos)  # warm up: imports, connections
+        runs = []
+        for i in range(repeat):
+            run = crawl_run(gh_url, repos)
+            run.update(crawl_memory_run(gh_url, repos))
+            run.update(parse_run(repo_pages, search_pages))
+            runs.append(run)
+            print(f'run {i + 1}/{repeat}', file=sys.stderr)
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        name: summarize([run[name] for run in runs]) for name in MEASURES}
+
+
+def regressed(name, baseline, current, threshold):
+    """
+    How much worse (relative) `current` is than `baseline`, if it's a
+    regression
+    """
+    worse = current['median'] - baseline['median']
+    if MEASURES[name]:
+        worse = -worse
+    noise = baseline['iqr'] + current['iqr']
+    if worse > threshold * baseline['median'] and worse > noise:
+        return worse / baseline['median']
+    return None
+
+
+def machine():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count()}
+
+
+def main():
+    arguments = docopt(__doc__)
+    repeat, repos = int(arguments['--repeat']), int(arguments['--repos'])
+    threshold = float(arguments['--threshold'])
+    path = os.path.join(ROOT, arguments['--baseline'])
+
+    results = run_scenario(repeat, repos)
+
+    if arguments['save']:
+        with open(path, 'w') as fh:
+            json.dump({
+                'machine': machine(),
+                'repeat': repeat,
+                'repos': repos,
+                'measures': results}, fh, indent=2)
+            fh.write('\n')
+        print(f'baseline saved to {path}')
+        for name, result in results.items():
+            print(f'{name:18} {result["median"]:10.3f} '
+                  f'± {result["iqr"]:.3f}')
+        return 0
+
+    try:
+        with open(path) as fh:
+            baseline = json.load(fh)
+    except FileNotFoundError:
+        print(f'no baseline in {path}, make one with `regression.py save`')
+        return 1
+    if baseline['machine'] != machine():
+        print(f'the baseline was made on another machine: '
+              f'{baseline["machine"]}')
+    if baseline['repos'] != repos:
+        print(f'the baseline crawled {baseline["repos"]} repos, not {repos}')
+
+    failed = False
+    print(f'{"measure":18} {"baseline":>18} {"current":>18} {"change":>8}')
+    for name, current in results.items():
+        if (base := baseline['measures'].get(name)) is None:
+            print(f'{name:18} {"-":>18}')
+            continue
+        change = current['median'] / base['median'] - 1
+        worse = regressed(name, base, current, threshold)
+        failed = failed or worse is not None
+        print(f'{name:18} {base["median"]:10.3f} ± {base["iqr"]:5.3f} '
+              f'{current["median"]:10.3f} ± {current["iqr"]:5.3f} '
+              f'{change:+8.1%}{"  REGRESSED" if worse is not None else ""}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""
+Output benchmark
+
+Write synthetic repository results with every available serializer, in
+pretty and compact mode, through the buffered writer the crawler uses, and
+show the throughput of each one. The first row is the old way of writing
+the output: `json.dumps` of the whole list at once.
+
+Usage:
+    serialize.py [--records=N] [--repeat=N]
+    serialize.py (-h | --help)
+
+Options:
+    -h --help    show this screen.
+    --records=N  number of records [default: 200000]
+    --repeat=N   runs of every mode, the best one is shown [default: 3]
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gh_search.output import SERIALIZERS, OutputWriter  # noqa: E402
+from gh_search.records import RepoResult, to_json  # noqa: E402
+
+
+LANGUAGES = ['Python', 'Rust', 'Go', 'C', 'JavaScript', 'HTML', 'CSS', 'Shell']
+
+
+def synthetic_records(n, rng):
+    records = []
+    for i in range(n):
+        languages = rng.sample(LANGUAGES, rng.randint(0, 4))
+        percents = [rng.random() for _ in languages]
+        records.append(RepoResult(
+            f'https://github.com/user{i % 5000}/repo{i}',
+            {language: round(100 * percent / sum(percents), 1)
+             for language, percent in zip(languages, percents)}))
+    return records
+
+
+def write_dumps(records, path):
+    with open(path, 'w') as fh:
+        fh.write(json.dumps(records, indent=2, default=to_json))
+
+
+def write_with(serializer, pretty):
+    def write(records, path):
+        with OutputWriter(path, pretty, serializer) as writer:
+            for record in records:
+                writer.write(record)
+    return write
+
+
+def best_time(write, records, path, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        write(records, path)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    arguments = docopt(__doc__)
+    n, repeat = int(arguments['--records']), int(arguments['--repeat'])
+    records = synthetic_records(n, random.Random(42))
+
+    modes = [('json.dumps (old)', write_dumps)]
+    for name in SERIALIZERS:
+        for pretty in (True, False):
+            label = f'{name} {"pretty" if pretty else "compact"}'
+            modes.append((label, write_with(name, pretty)))
+
+    print(f'{n} records, best of {repeat}')
+    print(f'{"mode":18} {"seconds":>8} {"records/s":>11} {"MB/s":>7} '
+          f'{"size":>8}')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'out.json')
+        for label, write in modes:
+            seconds = best_time(write, records, path, repeat)
+            size = os.path.getsize(path)
+            print(f'{label:18} {seconds:8.3f} {n / seconds:11,.0f} '
+                  f'{size / 1e6 / seconds:7.1f} {size / 1e6:6.1f}MB')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""
+Transfer benchmark
+
+Compress a set of pages with every encoding the crawler negotiates and show
+the bandwidth saved, and how long it takes to decompress them the way the
+fetchers do (streaming, in chunks).
+The pages are the ones in a crawl archive (`ARCHIVE_DIR`), or synthetic
+repository pages if no archive is given.
+
+Usage:
+    transfer.py [ARCHIVE_DIR] [--pages=N] [--price-per-gb=PRICE]
+    transfer.py (-h | --help)
+
+Options:
+    -h --help             show this screen.
+    --pages=N             number of pages to use [default: 200]
+    --price-per-gb=PRICE  bandwidth price, to show the money saved per
+                          million pages [default: 0]
+"""
+
+import gzip
+import os
+import random
+import sys
+import time
+import zlib
+
+from docopt import docopt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gh_search import transfer  # noqa: E402
+from gh_search.archive import Archive  # noqa: E402
+from gh_search.fetchers import CHUNK_SIZE  # noqa: E402
+
+
+LANGUAGES = ['Python', 'Rust', 'Go', 'C', 'JavaScript', 'HTML', 'CSS', 'Shell']
+
+
+def synthetic_page(rng):
+    """
+    Something shaped like a github repository page: lots of markup around a
+    file list, a readme and the language stats
+    """
+    files = '\n'.join(
+        f'<div role="row" class="Box-row Box-row--focus-gray py-2 d-flex '
+        f'position-relative js-navigation-item"><div role="gridcell" '
+        f'class="mr-3 flex-shrink-0"><svg aria-label="File" height="16" '
+        f'viewBox="0 0 16 16" width="16"></svg></div><div role="rowheader" '
+        f'class="flex-auto min-width-0 col-md-2 mr-3"><a class="js-navigation'
+        f'-open Link--primary" href="/foo/bar/blob/main/'
+        f'{rng.getrandbits(40):x}.py">{rng.getrandbits(40):x}.py</a></div>'
+        f'</div>'
+        for _ in range(rng.randint(5, 60)))
+    readme = ' '.join(
+        f'{rng.getrandbits(24):x}' for _ in range(rng.randint(100, 2000)))
+    languages = '\n'.join(
+        f'<li class="d-inline"><a class="d-inline-flex flex-items-center '
+        f'flex-nowrap Link--secondary no-underline text-small mr-3" '
+        f'href="/foo/bar/search?l={language}"><span class="color-fg-default '
+        f'text-bold mr-1">{language}</span><span>{rng.random() * 100:.1f}%'
+        f'</span></a></li>'
+        for language in rng.sample(LANGUAGES, rng.randint(1, 5)))
+    return (
+        f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+        f'<title>foo/bar</title></head><body><div class="application-main">'
+        f'{files}<article class="markdown-body">{readme}</article>'
+        f'<h2 class="h4 mb-3">Languages</h2><ul class="list-style-none">'
+        f'{languages}</ul></div></body></html>')
+
+
+def load_pages(archive_dir, n):
+    if archive_dir:
+        archive = Archive(archive_dir)
+        shas = list(dict.fromkeys(
+            entry['sha256'] for entry in archive.entries()))
+        return [archive.load(sha).encode('utf-8') for sha in shas[:n]]
+    rng = random.Random(42)
+    return [synthetic_page(rng).encode('utf-8') for _ in range(n)]
+
+
+def encoders():
+    yield 'identity', lambda data: data
+    yield 'gzip', lambda data: gzip.compress(data, compresslevel=6)
+    yield 'deflate', lambda data: zlib.compress(data, 6)
+    if transfer.brotli:
+        yield 'br', lambda data: transfer.brotli.compress(data, quality=4)
+
+
+def decode_time(encoding, bodies):
+    start = time.perf_counter()
+    for body in bodies:
+        decoder = transfer.decoder(encoding)
+        for i in range(0, len(body), CHUNK_SIZE):
+            decoder.decompress(body[i:i + CHUNK_SIZE])
+        decoder.flush()
+    return time.perf_counter() - start
+
+
+def main():
+    arguments = docopt(__doc__)
+    pages = load_pages(arguments['ARCHIVE_DIR'], int(arguments['--pages']))
+    price = float(arguments['--price-per-gb'])
+    if not pages:
+        print('no pages to compress')
+        return 1
+
+    raw_size = sum(map(len, pages))
+    source = arguments['ARCHIVE_DIR'] or 'synthetic pages'
+    print(f'{len(pages)} pages from {source}, {raw_size / len(pages):.0f} '
+          'bytes per page')
+    print(f'accept-encoding: {transfer.ACCEPT_ENCODING}')
+    print(f'{"encoding":10} {"bytes/page":>11} {"saved":>7} '
+          f'{"decode MB/s":>12} {"$ saved/1M pages":>17}')
+    for encoding, encode in encoders():
+        bodies = [encode(page) for page in pages]
+        size = sum(map(len, bodies))
+        saved = 1 - size / raw_size
+        seconds = decode_time(encoding, bodies)
+        money = (raw_size - size) / len(pages) * 1e6 / 1e9 * price
+        print(f'{encoding:10} {size / len(pages):11.0f} {saved:7.1%} '
+              f'{raw_size / seconds / 1e6:12.1f} {money:17.2f}')
+    if not transfer.brotli:
+        print('(install brotli to negotiate `br` too)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
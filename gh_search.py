@@ -4,24 +4,115 @@
 Github Search Crawler
 
 Usage:
-    gh_search.py INPUT_FILE [--output=OUT_FILE | -o OUT_FILE] [--verbose | --quiet]
+    gh_search.py INPUT_FILE [--output=OUT_FILE | -o OUT_FILE] [--compact]
+                 [--split]
+                 [--limit=N] [--owner=OWNER]... [--match=REGEX]
+                 [--export=PATH [--export-format=FORMAT]] [--archive=DIR]
+                 [--aggregate=DIR [--aggregate-only]]
+                 [--parse-cache=FILE] [--metrics=FILE]
+                 [--seen=FILE [--seen-type=TYPE] [--seen-fp-rate=P]]
+                 [--deadline=SECONDS] [--recrawl=FILE [--recrawl-budget=N]]
+                 [--enrich=NAME] [--warm=N] [--verbose | --quiet]
+    gh_search.py INPUT_FILE --plan [--split] [--limit=N] [--archive=DIR]
+                 [--parse-cache=FILE] [--metrics=FILE] [--enrich=NAME]
+                 [--verbose | --quiet]
+    gh_search.py INPUT_FILE --schema [--enrich=NAME]
+    gh_search.py coordinate QUEUE_DIR INPUT_FILE... [--shard-size=N]
+                 [--verbose | --quiet]
+    gh_search.py work QUEUE_DIR [--workers=N] [--proxy=PROXY]...
+                 [--archive=DIR] [--parse-cache=FILE] [--verbose | --quiet]
+    gh_search.py collect QUEUE_DIR [--output=OUT_FILE | -o OUT_FILE]
+                 [--compact] [--verbose | --quiet]
+    gh_search.py reparse ARCHIVE_DIR [--output=OUT_FILE | -o OUT_FILE]
+                 [--compact] [--workers=N] [--verbose | --quiet]
+    gh_search.py snapshot export SNAPSHOT [--archive=DIR] [--parse-cache=FILE]
+                 [--recrawl=FILE] [--max-age=DAYS] [--query=QUERY]...
+                 [--verbose | --quiet]
+    gh_search.py snapshot import SNAPSHOT [--archive=DIR] [--parse-cache=FILE]
+                 [--recrawl=FILE] [--verbose | --quiet]
     gh_search.py (-h | --help)
     gh_search.py --version
 
 Options:
     -h --help                      show this screen.
     -o OUT_FILE --output=OUT_FILE  specify the output file (by default, stdout)
+    --compact                      write the output without any whitespace
+    --split                        split the search in sub-queries to get all the
+                                   results instead of only the first page
+    --limit=N                      only return the first N results
+    --owner=OWNER                  only return results owned by OWNER (can be
+                                   used more than once)
+    --match=REGEX                  only return results whose url matches REGEX
+    --export=PATH                  also export the language stats of the repos
+                                   to PATH while crawling
+    --export-format=FORMAT         format of the export: `tsv` or `csv` (long
+                                   format) or `columns` (binary columnar
+                                   directory) [default: tsv]
+    --aggregate=DIR                also write tables with the repos and the
+                                   language share of every owner, and the
+                                   repos using every language, to DIR
+    --aggregate-only               only write the aggregate tables, without
+                                   keeping the results in memory
+    --archive=DIR                  archive every fetched page in DIR
+    --parse-cache=FILE             keep the parse results in FILE too, so
+                                   unchanged pages are not parsed again in
+                                   later runs
+    --metrics=FILE                 write the metrics of the run to FILE (or read
+                                   the ones of a previous run, with `--plan`)
+    --plan                         don't crawl, only estimate how many requests,
+                                   bytes and time the search would take (only
+                                   the first search page is fetched, or taken
+                                   from the archive)
+    --seen=FILE                    skip the links seen in previous runs using
+                                   the same FILE, and save the new ones to it
+    --seen-type=TYPE               how to store the seen links: `exact` (64 bit
+                                   hashes) or `bloom` (bloom filter)
+                                   [default: exact]
+    --seen-fp-rate=P               false positive rate of the bloom filter
+                                   [default: 0.001]
+    --deadline=SECONDS             stop crawling after SECONDS and write the
+                                   results found so far (the exit status is
+                                   then 2, as they are incomplete)
+    --recrawl=FILE                 keep the change history of every repo in
+                                   FILE, and only fetch again the ones likely
+                                   to have changed (the stats of the rest are
+                                   taken from FILE)
+    --recrawl-budget=N             recrawl at most N known repos in this run
+    --enrich=NAME                  also fetch the page of every issue or wiki
+                                   result and add its details to the output
+                                   (`issue` or `wiki`)
+    --warm=N                       open N connections to github through every
+                                   proxy while searching, so the pages of the
+                                   results are fetched on open connections (0
+                                   to not open any) [default: 4]
+    --schema                       don't search, only print the JSON schema of
+                                   the output
+    --max-age=DAYS                 only export what was fetched or parsed in
+                                   the last DAYS days
+    --query=QUERY                  only export the pages found by the search
+                                   for the keywords in QUERY (can be used more
+                                   than once)
+    --shard-size=N                 repo urls per shard [default: 50]
+    --workers=N                    number of worker processes (by default, 4
+                                   for `work` and one per core for `reparse`)
+    --proxy=PROXY                  proxy for the workers, instead of the ones
+                                   in the input files (can be used more than
+                                   once)
     --verbose                      print more logging info
     --quiet                        print less logging info
 """  # noqa
 
 
+import contextlib
 import logging
+import re
 import sys
 
 from docopt import docopt
 
-from gh_search.utils import set_proxy, read_input, write_output, gh_search
+# every command imports the modules it needs when it runs, so `--help` is
+# instant and a command doesn't pay for loading the others (see
+# benchmarks/import_time.py)
 
 
 VERSION = '0.0.1'
@@ -30,6 +121,292 @@ NAME = 'Github Search Crawler'
 GH_URL = 'https://github.com'
 
 
+def _positive_int(arguments, option):
+    value = arguments[option]
+    if value is None:
+        return None
+    elif not value.isdigit() or int(value) < 1:
+        logging.error(f'invalid {option.lstrip("-")}: `{value}`')
+        sys.exit(1)
+    else:
+        return int(value)
+
+
+def search(arguments):
+    from gh_search import deadline, fetchers, metrics, parse_cache, transfer
+    from gh_search.aggregate import Aggregator
+    from gh_search.fetchers import FetchError, handshake_summary
+    from gh_search.archive import set_archive
+    from gh_search.enrich import get_enricher
+    from gh_search.export import EXPORTERS, open_exporter
+    from gh_search.output import OutputWriter
+    from gh_search.recrawl import RecrawlSchedule
+    from gh_search.seen import SEEN_SETS, open_seen, save_seen
+    from gh_search.utils import set_proxy, read_input, gh_search
+
+    limit = _positive_int(arguments, '--limit')
+    deadline_seconds = _positive_int(arguments, '--deadline')
+    recrawl_budget = _positive_int(arguments, '--recrawl-budget')
+    if not arguments['--warm'].isdigit():
+        logging.error(f'invalid warm: `{arguments["--warm"]}`')
+        return 1
+
+    export_format = arguments['--export-format']
+    if export_format not in EXPORTERS:
+        logging.error(f'invalid export format: `{export_format}`')
+        return 1
+
+    pattern = arguments['--match']
+    try:
+        pattern = pattern and re.compile(pattern)
+    except re.error as e:
+        logging.error(f'invalid match: `{arguments["--match"]}`: {e}')
+        return 1
+
+    if arguments['--aggregate-only'] and not arguments['--aggregate']:
+        logging.error('--aggregate-only needs --aggregate')
+        return 1
+
+    seen_type = arguments['--seen-type']
+    if seen_type not in SEEN_SETS:
+        logging.error(f'invalid seen type: `{seen_type}`')
+        return 1
+    try:
+        fp_rate = float(arguments['--seen-fp-rate'])
+    except ValueError:
+        fp_rate = None
+    if fp_rate is None or not 0 < fp_rate < 1:
+        logging.error(
+            f'invalid false positive rate: `{arguments["--seen-fp-rate"]}`')
+        return 1
+
+    [infile] = arguments['INPUT_FILE']
+    keywords, proxies, page_type = read_input(infile)
+
+    if arguments['--export'] and page_type != 'repositories':
+        logging.error('only repository searches can be exported')
+        return 1
+    if arguments['--aggregate'] and page_type != 'repositories':
+        logging.error('only repository searches can be aggregated')
+        return 1
+    if arguments['--recrawl'] and page_type != 'repositories':
+        logging.error('only repository searches can be recrawled')
+        return 1
+    try:
+        enricher = get_enricher(arguments['--enrich'], page_type)
+    except ValueError as e:
+        logging.error(e)
+        return 1
+
+    with contextlib.ExitStack() as stack:
+        callbacks = []
+        if arguments['--export']:
+            exporter = stack.enter_context(
+                open_exporter(arguments['--export'], export_format))
+            callbacks.append(exporter.write)
+        if arguments['--aggregate']:
+            aggregator = Aggregator()
+            callbacks.append(aggregator.add)
+        else:
+            aggregator = None
+        # the results are written as they come instead of kept until the end
+        if arguments['--aggregate-only']:
+            writer = None
+        else:
+            writer = stack.enter_context(OutputWriter(
+                arguments['--output'], pretty=not arguments['--compact']))
+
+        async def on_result(result):
+            for callback in callbacks:
+                callback(result)
+            if writer is not None:
+                # waits for the writer thread without blocking the crawl
+                await writer.write_async(result)
+
+        set_proxy(proxies)
+        set_archive(arguments['--archive'])
+        parse_cache.configure(path=arguments['--parse-cache'])
+        if arguments['--seen']:
+            seen_kwargs = {'fp_rate': fp_rate} if seen_type == 'bloom' else {}
+            seen = open_seen(arguments['--seen'], seen_type, **seen_kwargs)
+        else:
+            seen = None
+        if arguments['--recrawl']:
+            schedule = RecrawlSchedule(arguments['--recrawl'], recrawl_budget)
+            stack.callback(schedule.close)
+        else:
+            schedule = None
+        deadline.set_deadline(deadline_seconds)
+        # nothing else runs in this loop, so a throttled crawl can back off
+        # blocking it all
+        fetchers.BLOCKING_BACKOFF = True
+        try:
+            incomplete = gh_search(
+                keywords, page_type, GH_URL,
+                split=arguments['--split'],
+                limit=limit,
+                owners=arguments['--owner'],
+                pattern=pattern,
+                on_result=on_result,
+                seen=seen,
+                schedule=schedule,
+                enricher=enricher,
+                keep=False,
+                warm=int(arguments['--warm'])).incomplete
+        except FetchError as e:
+            logging.error(e)
+            return 1
+        if not arguments['--quiet'] and schedule is not None:
+            sys.stderr.write('\n'.join(schedule.summary()) + '\n')
+
+    if aggregator is not None:
+        aggregator.write(arguments['--aggregate'])
+    if seen is not None:
+        save_seen(seen, arguments['--seen'])
+
+    if incomplete:
+        found = writer.count if writer is not None else aggregator.repos
+        logging.warning(
+            f'the deadline was reached, only `{found}` results were '
+            'found and they are incomplete')
+        metrics.incr('deadline.expired')
+
+    metrics.log_summary()
+    if arguments['--metrics']:
+        metrics.dump(arguments['--metrics'])
+    if not arguments['--quiet'] and (summary := handshake_summary()):
+        sys.stderr.write('\n'.join(summary) + '\n')
+    if not arguments['--quiet'] and (summary := transfer.summary()):
+        sys.stderr.write('\n'.join(summary) + '\n')
+
+    return 2 if incomplete else 0
+
+
+def plan_cmd(arguments):
+    from gh_search import metrics, parse_cache
+    from gh_search.archive import set_archive
+    from gh_search.enrich import get_enricher
+    from gh_search.estimate import estimate, summary
+    from gh_search.fetchers import FetchError
+    from gh_search.utils import set_proxy, read_input
+
+    limit = _positive_int(arguments, '--limit')
+    [infile] = arguments['INPUT_FILE']
+    keywords, proxies, page_type = read_input(infile)
+    try:
+        enricher = get_enricher(arguments['--enrich'], page_type)
+    except ValueError as e:
+        logging.error(e)
+        return 1
+
+    set_proxy(proxies)
+    set_archive(arguments['--archive'])
+    parse_cache.configure(path=arguments['--parse-cache'])
+    previous = metrics.load(arguments['--metrics']) \
+        if arguments['--metrics'] else {}
+    try:
+        plan = estimate(
+            keywords, page_type, GH_URL, len(proxies),
+            split=arguments['--split'],
+            limit=limit,
+            previous=previous,
+            enrich=enricher is not None)
+    except FetchError as e:
+        logging.error(e)
+        return 1
+    sys.stdout.write('\n'.join(summary(plan)) + '\n')
+    return 0
+
+
+def schema_cmd(arguments):
+    import json
+    from gh_search.enrich import get_enricher, output_schema
+    from gh_search.utils import read_input
+
+    [infile] = arguments['INPUT_FILE']
+    _, _, page_type = read_input(infile)
+    try:
+        enricher = get_enricher(arguments['--enrich'], page_type)
+    except ValueError as e:
+        logging.error(e)
+        return 1
+    sys.stdout.write(
+        json.dumps(output_schema(page_type, enricher), indent=2) + '\n')
+    return 0
+
+
+def coordinate_cmd(arguments):
+    from gh_search.sharded import coordinate
+    from gh_search.utils import read_input
+
+    queries, all_proxies = [], []
+    for infile in arguments['INPUT_FILE']:
+        keywords, proxies, page_type = read_input(infile)
+        queries.append((keywords, page_type))
+        all_proxies.extend(proxies)
+    coordinate(
+        arguments['QUEUE_DIR'], queries, list(dict.fromkeys(all_proxies)),
+        _positive_int(arguments, '--shard-size'))
+    return 0
+
+
+def work_cmd(arguments):
+    from gh_search.sharded import run_workers
+
+    counts, crashed = run_workers(
+        arguments['QUEUE_DIR'], GH_URL,
+        _positive_int(arguments, '--workers') or 4,
+        arguments['--proxy'] or None,
+        arguments['--archive'],
+        arguments['--parse-cache'])
+    unfinished = counts.get('pending') or counts.get('claimed')
+    return 1 if counts.get('failed') or crashed or unfinished else 0
+
+
+def collect_cmd(arguments):
+    from gh_search.sharded import collect
+    from gh_search.utils import write_output
+
+    write_output(
+        collect(arguments['QUEUE_DIR']), arguments['--output'],
+        pretty=not arguments['--compact'])
+    return 0
+
+
+def reparse_cmd(arguments):
+    from gh_search.reparse import reparse
+    from gh_search.utils import write_output
+
+    result = reparse(
+        arguments['ARCHIVE_DIR'], _positive_int(arguments, '--workers'))
+    write_output(
+        result, arguments['--output'], pretty=not arguments['--compact'])
+    return 0
+
+
+def snapshot_cmd(arguments):
+    from gh_search.snapshot import export_snapshot, import_snapshot, summary
+
+    stores = {
+        'archive_path': arguments['--archive'],
+        'parse_cache_path': arguments['--parse-cache'],
+        'recrawl_path': arguments['--recrawl']}
+    try:
+        if arguments['export']:
+            counts = export_snapshot(
+                arguments['SNAPSHOT'], **stores,
+                max_age=_positive_int(arguments, '--max-age'),
+                queries=arguments['--query'])
+        else:
+            counts = import_snapshot(arguments['SNAPSHOT'], **stores)
+    except (OSError, ValueError) as e:
+        logging.error(e)
+        return 1
+    if not arguments['--quiet']:
+        sys.stderr.write('\n'.join(summary(counts)) + '\n')
+    return 0
+
+
 def main():
     arguments = docopt(__doc__, version=f'{NAME} {VERSION}')
 
@@ -41,15 +418,22 @@ def main():
     else:
         logging.getLogger().setLevel(logging.WARNING)
 
-    infile = arguments['INPUT_FILE']
-    keywords, proxies, page_type = read_input(infile)
-
-    set_proxy(proxies)
-    result = gh_search(keywords, page_type, GH_URL)
-
-    write_output(result, arguments['--output'])
-
-    return 0
+    if arguments['coordinate']:
+        return coordinate_cmd(arguments)
+    elif arguments['work']:
+        return work_cmd(arguments)
+    elif arguments['collect']:
+        return collect_cmd(arguments)
+    elif arguments['reparse']:
+        return reparse_cmd(arguments)
+    elif arguments['snapshot']:
+        return snapshot_cmd(arguments)
+    elif arguments['--plan']:
+        return plan_cmd(arguments)
+    elif arguments['--schema']:
+        return schema_cmd(arguments)
+    else:
+        return search(arguments)
 
 
 if __name__ == '__main__':
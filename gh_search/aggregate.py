@@ -0,0 +1,108 @@
+"""
+Running aggregates of the repository results by owner and by language, so
+the summaries don't need the whole output in memory
+"""
+
+import csv
+import os
+
+from collections import Counter, defaultdict
+
+from gh_search.records import LANGUAGES
+
+
+OWNERS_FILE = 'owners.tsv'
+LANGUAGES_FILE = 'languages.tsv'
+OWNERS_HEADER = ('owner', 'repos', 'language', 'share')
+LANGUAGES_HEADER = ('language', 'repos', 'primary', 'share')
+
+
+class OwnerStats:
+
+    __slots__ = ('repos', 'with_stats', 'percents')
+
+    def __init__(self):
+        self.repos = 0
+        self.with_stats = 0
+        self.percents = Counter()  # language id -> sum of percents
+
+
+class Aggregator:
+    """
+    Update the aggregates with every repository result as it comes (`add` can
+    be the `on_result` of `gh_search.utils.gh_search`), keeping only:
+
+    - for every owner, how many repos it has and the sum of the percents of
+      every language in them
+    - for every language, how many repos use it, in how many it's the main
+      one and the sum of its percents
+
+    so memory depends on the number of owners and languages, not of repos.
+    The language share of an owner is the mean of its percents over the
+    owner's repos with language stats, so every repo weights the same
+    """
+
+    def __init__(self):
+        self.owners = defaultdict(OwnerStats)
+        self.language_repos = Counter()
+        self.language_primary = Counter()
+        self.language_percents = Counter()
+        self.repos = 0
+        self.with_stats = 0
+
+    def add(self, result):
+        self.repos += 1
+        owner = self.owners[result.owner or '']
+        owner.repos += 1
+        if not result.lang_ids:
+            return
+        owner.with_stats += 1
+        self.with_stats += 1
+        for lang_id, percent in zip(result.lang_ids, result.percents):
+            owner.percents[lang_id] += percent
+            self.language_repos[lang_id] += 1
+            self.language_percents[lang_id] += percent
+        primary, _ = max(
+            zip(result.lang_ids, result.percents), key=lambda stat: stat[1])
+        self.language_primary[primary] += 1
+
+    def owner_rows(self):
+        """
+        `(owner, repos, language, share)` rows, by owner and then by share.
+        Owners whose repos have no language stats get a single row without
+        language
+        """
+        for name in sorted(self.owners):
+            owner = self.owners[name]
+            if not owner.with_stats:
+                yield name, owner.repos, '', ''
+            for lang_id, total in owner.percents.most_common():
+                yield (
+                    name, owner.repos, LANGUAGES.name(lang_id),
+                    round(total / owner.with_stats, 2))
+
+    def language_rows(self):
+        """
+        `(language, repos, primary, share)` rows, by number of repos. The
+        share is the mean percent of the language over all the repos with
+        language stats
+        """
+        for lang_id, repos in self.language_repos.most_common():
+            yield (
+                LANGUAGES.name(lang_id), repos,
+                self.language_primary[lang_id],
+                round(self.language_percents[lang_id] / self.with_stats, 2))
+
+    def write(self, path):
+        """
+        Write the summary tables to the `path` directory, as `owners.tsv`
+        and `languages.tsv`
+        """
+        os.makedirs(path, exist_ok=True)
+        for name, header, rows in (
+                (OWNERS_FILE, OWNERS_HEADER, self.owner_rows()),
+                (LANGUAGES_FILE, LANGUAGES_HEADER, self.language_rows())):
+            with open(os.path.join(path, name), 'w', newline='') as fh:
+                writer = csv.writer(fh, delimiter='\t', lineterminator='\n')
+                writer.writerow(header)
+                writer.writerows(rows)
@@ -0,0 +1,191 @@
+"""
+Archive of the raw fetched pages, so they can be parsed again offline
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+INDEX_FILE = 'index.jsonl'
+BLOBS_DIR = 'blobs'
+
+logger = logging.getLogger(__name__)
+
+
+class Archive:
+    """
+    Store every fetched page as a gzipped blob named after the sha256 of its
+    content (so identical pages are only stored once), plus an append-only
+    index with a json line for every fetch, a bit like WARC:
+
+    index.jsonl
+    blobs/
+      3a/
+        3a7bd3e2360a3d29eea436fcfb7e44c735d117c42d1c1835420b6b9942dd4f1b.gz
+      ...
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, BLOBS_DIR), exist_ok=True)
+        self.lock = threading.Lock()
+
+    def blob_path(self, sha):
+        return os.path.join(self.path, BLOBS_DIR, sha[:2], f'{sha}.gz')
+
+    def store(self, url, kind, content, **meta):
+        """
+        Store a page (as a str or utf-8 bytes) and return its hash. `kind` is
+        the kind of page (`search` or `repo`) and any extra `meta` needed to
+        parse it again is kept in the index
+        """
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        sha = hashlib.sha256(data).hexdigest()
+        if not self.has_blob(sha):
+            self._write_blob(sha, gzip.compress(data))
+
+        entry = {
+            'url': url,
+            'kind': kind,
+            'sha256': sha,
+            'fetched_at': time.time(),
+            **meta}
+        line = json.dumps(entry) + '\n'
+        with self.lock:
+            # a single small append, so concurrent writers don't mix lines
+            with open(os.path.join(self.path, INDEX_FILE), 'a') as fh:
+                fh.write(line)
+        return sha
+
+    def has_blob(self, sha):
+        return os.path.exists(self.blob_path(sha))
+
+    def _write_blob(self, sha, compressed):
+        # write and rename, so there are never half written blobs
+        blob_path = self.blob_path(sha)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path))
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(compressed)
+        os.replace(tmp_path, blob_path)
+
+    @staticmethod
+    def check_blob(sha, compressed):
+        """
+        Raise ValueError unless an already gzipped blob (from another
+        archive) really hashes to `sha`
+        """
+        try:
+            data = gzip.decompress(compressed)
+        except (OSError, EOFError) as e:
+            raise ValueError(f'blob `{sha}` is corrupt: {e}')
+        if hashlib.sha256(data).hexdigest() != sha:
+            raise ValueError(f'blob `{sha}` doesn\'t match its hash')
+
+    def add_blob(self, sha, compressed, check=True):
+        """
+        Store an already gzipped blob (from another archive), checking that
+        its content really hashes to `sha` unless `check` is unset (because
+        it's been checked already). Return whether it was new
+        """
+        if self.has_blob(sha):
+            return False
+        if check:
+            self.check_blob(sha, compressed)
+        self._write_blob(sha, compressed)
+        return True
+
+    def read_blob(self, sha):
+        """
+        A blob as it's stored, gzipped
+        """
+        with open(self.blob_path(sha), 'rb') as fh:
+            return fh.read()
+
+    def load(self, sha):
+        with open(self.blob_path(sha), 'rb') as fh:
+            return gzip.decompress(fh.read()).decode('utf-8')
+
+    def find(self, url, kind, **meta):
+        """
+        Content of the last page archived for `url` with the given `kind` and
+        `meta`, or None if there isn't any
+        """
+        sha = None
+        for entry in self.entries():
+            if entry['url'] == url and entry['kind'] == kind and all(
+                    entry.get(key) == value for key, value in meta.items()):
+                sha = entry['sha256']
+        return sha and self.load(sha)
+
+    def entries(self):
+        """
+        Iterate over the index entries, in the order they were fetched
+        """
+        try:
+            with open(os.path.join(self.path, INDEX_FILE)) as fh:
+                for line in fh:
+                    if line.strip():
+                        yield json.loads(line)
+        except FileNotFoundError:
+            return
+
+    def merge(self, entries):
+        """
+        Add index entries (from another archive) that are not in this one
+        yet, and return how many were added. The index is rewritten in the
+        order the pages were fetched, so `find` still gets the latest page
+        """
+        with self.lock:
+            current = list(self.entries())
+            known = {_entry_key(entry) for entry in current}
+            new = [
+                entry for entry in dict(
+                    (_entry_key(entry), entry) for entry in entries).values()
+                if _entry_key(entry) not in known]
+            if not new:
+                return 0
+            merged = sorted(current + new, key=lambda e: e['fetched_at'])
+            index_path = os.path.join(self.path, INDEX_FILE)
+            tmp_path = f'{index_path}.tmp'
+            with open(tmp_path, 'w') as fh:
+                for entry in merged:
+                    fh.write(json.dumps(entry) + '\n')
+            os.replace(tmp_path, index_path)
+        return len(new)
+
+
+def _entry_key(entry):
+    return entry['url'], entry['kind'], entry['sha256'], entry['fetched_at']
+
+
+_archive = None
+
+
+def set_archive(path):
+    """
+    Archive every page fetched from now on in `path` (None to stop archiving)
+    """
+    global _archive
+    _archive = Archive(path) if path else None
+    if _archive:
+        logger.info(f'archiving fetched pages in `{path}`')
+
+
+def archive_page(url, kind, content, **meta):
+    if _archive:
+        _archive.store(url, kind, content, **meta)
+
+
+def find_archived(url, kind, **meta):
+    """
+    Last archived page for `url` (see `Archive.find`), or None if there isn't
+    any or nothing is being archived
+    """
+    return _archive.find(url, kind, **meta) if _archive else None
@@ -0,0 +1,73 @@
+"""
+Global deadline for a crawl, after which it stops and returns what it has
+"""
+
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+_deadline = None
+_expired = False
+
+
+def set_deadline(seconds):
+    """
+    Stop crawling `seconds` from now (None for no deadline)
+    """
+    global _deadline, _expired
+    _deadline = None if seconds is None else time.monotonic() + seconds
+    _expired = False
+    if seconds is not None:
+        logger.info(f'crawl deadline in `{seconds}` seconds')
+
+
+def time_left():
+    """
+    Seconds until the deadline, or None if there isn't one
+    """
+    if _deadline is None:
+        return None
+    return max(_deadline - time.monotonic(), 0)
+
+
+def clamp(seconds):
+    """
+    The given amount of seconds, or whatever is left until the deadline if
+    that's less
+    """
+    left = time_left()
+    return seconds if left is None else min(seconds, left)
+
+
+def check():
+    """
+    Raise DeadlineExceeded if the deadline has been reached
+    """
+    if time_left() == 0:
+        expire()
+        raise DeadlineExceeded('crawl deadline reached')
+
+
+def expire():
+    """
+    Record that some work was dropped because of the deadline, so the
+    results are incomplete
+    """
+    global _expired
+    if not _expired:
+        logger.warning('crawl deadline reached, cancelling outstanding work')
+    _expired = True
+
+
+def expired():
+    """
+    Whether the deadline was reached before the crawl was done
+    """
+    return _expired
@@ -0,0 +1,87 @@
+"""
+Opt-in enrichment of issue and wiki results: fetch the page of every result
+and add the details parsed from it to the output, the same way the language
+stats are added to repository results
+"""
+
+from gh_search.parse_html import parse_issue_page, parse_wiki_page
+from gh_search.records import DetailResult
+
+
+class Enricher:
+    """
+    Adds what `parser` gets from the page of every result of a `page_type`
+    search to its `extra`. The pages are fetched, archived and accounted as
+    the `name` kind of page. `fields` declares what it adds, as JSON schema
+    properties
+    """
+
+    def __init__(self, name, page_type, parser, fields):
+        self.name = name
+        self.page_type = page_type
+        self.parser = parser
+        self.fields = fields
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name!r})'
+
+    def enrich(self, result, details):
+        return DetailResult(result.url, details)
+
+
+ENRICHERS = {
+    'issue': Enricher('issue', 'issues', parse_issue_page, {
+        'title': {'type': 'string'},
+        'state': {
+            'type': ['string', 'null'],
+            'enum': ['open', 'closed', 'merged', None]},
+        'labels': {'type': 'array', 'items': {'type': 'string'}},
+        'comments': {'type': 'integer'}}),
+    'wiki': Enricher('wiki', 'wikis', parse_wiki_page, {
+        'title': {'type': 'string'},
+        'revisions': {'type': 'integer'}}),
+}
+
+
+def get_enricher(name, page_type):
+    """
+    The enricher called `name`, checking that it's for `page_type` searches.
+    None if there's no `name`
+    """
+    if name is None:
+        return None
+    if (enricher := ENRICHERS.get(name)) is None:
+        raise ValueError(f'unknown enricher: `{name}`')
+    if enricher.page_type != page_type:
+        raise ValueError(
+            f'the `{name}` enricher is for {enricher.page_type} searches')
+    return enricher
+
+
+def output_schema(page_type, enricher=None):
+    """
+    JSON schema of the output of a `page_type` search, with the fields added
+    by the `enricher`, if any
+    """
+    extra = None
+    if page_type == 'repositories':
+        extra = {
+            'owner': {'type': 'string'},
+            'language_stats': {
+                'type': 'object',
+                'additionalProperties': {'type': 'number'}}}
+    elif enricher is not None:
+        extra = {'owner': {'type': 'string'}, **enricher.fields}
+
+    item = {
+        'type': 'object',
+        'properties': {'url': {'type': 'string'}},
+        'required': ['url']}
+    if extra is not None:
+        item['properties']['extra'] = {
+            'type': 'object',
+            'properties': extra}
+    return {
+        '$schema': 'https://json-schema.org/draft/2020-12/schema',
+        'type': 'array',
+        'items': item}
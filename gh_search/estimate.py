@@ -0,0 +1,147 @@
+"""
+Dry-run estimate of what a search will take: requests, bytes and wall time.
+Only the first page of search results is needed (and it's taken from the
+archive if it's there), no repository page is fetched
+"""
+
+import datetime
+import logging
+import math
+
+from gh_search import fetchers, planner
+from gh_search.archive import find_archived
+from gh_search.parse_cache import parse
+from gh_search.parse_html import parse_links, parse_result_count
+
+
+# rough guesses of how fast github lets a single ip go before throttling it,
+# in requests per second
+SEARCH_RATE_LIMIT = 10 / 60
+REPO_RATE_LIMIT = 5
+
+# used when there are no metrics of previous runs
+DEFAULT_LATENCY = {'search': 1.0, 'repo': 0.5}  # seconds
+DEFAULT_PAGE_BYTES = {'search': 30000, 'repo': 40000}  # transferred
+
+logger = logging.getLogger(__name__)
+
+
+def observed(previous, kind):
+    """
+    `(latency, bytes_per_page, requests_per_page)` of a `kind` of page
+    (`search` or `repo`) from the metrics of a previous run (see
+    `gh_search.metrics`), or the defaults if it didn't fetch any
+    """
+    requests = previous.get(f'fetch.{kind}.requests', 0)
+    pages = previous.get(f'transfer.{kind}.pages', 0)
+    if not requests or not pages:
+        return DEFAULT_LATENCY[kind], DEFAULT_PAGE_BYTES[kind], 1
+    return (
+        previous.get(f'fetch.{kind}.seconds', 0) / requests,
+        previous.get(f'transfer.{kind}.wire_bytes', 0) / pages,
+        requests / pages)
+
+
+def search_pages(count, split):
+    """
+    Search pages fetched for a search with `count` results. Without `split`
+    it's only the first one. With it, the planner probes a binary tree of
+    slices until they hold at most MAX_RESULTS each, and then fetches the
+    rest of the pages of every slice
+    """
+    if not split:
+        return 1
+    slices = max(math.ceil(count / planner.MAX_RESULTS), 1)
+    pages = math.ceil(count / planner.RESULTS_PER_PAGE)
+    return 2 * slices - 1 + max(pages - slices, 0)
+
+
+def phase_time(requests, latency, concurrency, rate_limit, n_proxies):
+    """
+    Seconds it takes to make `requests` requests, `concurrency` of them at a
+    time and no faster than `rate_limit` per second for every proxy
+    """
+    if not requests:
+        return 0
+    throughput = min(concurrency / latency, rate_limit * n_proxies)
+    return latency + (requests - 1) / throughput
+
+
+def _first_page(keywords, page_type, gh_url):
+    """
+    The first page of search results, from the archive if it's there, and
+    whether it was
+    """
+    params = fetchers.search_params(keywords, page_type)
+    content = find_archived(
+        f'{gh_url}/search', 'search', params=params, gh_url=gh_url)
+    if content is not None:
+        logger.info('using the archived search page')
+        return content, True
+    return fetchers.fetch_search_page(keywords, page_type, gh_url), False
+
+
+def estimate(
+        keywords, page_type, gh_url, n_proxies, split=False, limit=None,
+        previous=None, enrich=False):
+    """
+    Estimate what a search (see `gh_search.utils.gh_search`) will take,
+    using the latency, page sizes and retries seen in the metrics of a
+    `previous` run. Links seen before or filtered out are not known without
+    crawling, so it's an upper bound. With `enrich`, the page of every issue
+    or wiki result is fetched too, and assumed to be like a repo page.
+    Return a dict with the `results`, the
+    `search_requests` and `repo_requests`, the `bytes` transferred and the
+    wall time in `seconds`
+    """
+    previous = previous or {}
+    content, archived = _first_page(keywords, page_type, gh_url)
+    links = parse(parse_links, content, page_type, gh_url)
+    count = max(parse(parse_result_count, content) or 0, len(links)) \
+        if split else len(links)
+    results = count if limit is None else min(count, limit)
+    repo_pages = results if page_type == 'repositories' or enrich else 0
+    n_search_pages = search_pages(count, split)
+    n_proxies = max(n_proxies, 1)
+
+    search_latency, search_bytes, search_tries = observed(previous, 'search')
+    repo_latency, repo_bytes, repo_tries = observed(previous, 'repo')
+    search_requests = math.ceil(n_search_pages * search_tries)
+    repo_requests = math.ceil(repo_pages * repo_tries)
+    seconds = phase_time(
+        search_requests, search_latency,
+        planner.MAX_WORKERS if split else 1, SEARCH_RATE_LIMIT, n_proxies)
+    seconds += phase_time(
+        repo_requests, repo_latency, fetchers.MAX_CONCURRENCY,
+        REPO_RATE_LIMIT, n_proxies)
+
+    return {
+        'results': results,
+        'search_requests': search_requests,
+        'repo_requests': repo_requests,
+        'bytes': round(
+            n_search_pages * search_bytes + repo_pages * repo_bytes),
+        'seconds': seconds,
+        'archived': archived,
+        'observed': any(
+            previous.get(f'transfer.{kind}.pages')
+            for kind in ('search', 'repo')),
+    }
+
+
+def summary(plan):
+    """
+    Lines describing an estimate
+    """
+    wall_time = datetime.timedelta(seconds=round(plan['seconds']))
+    return [
+        f'{"results":16} {plan["results"]:>12}',
+        f'{"search requests":16} {plan["search_requests"]:>12}',
+        f'{"repo requests":16} {plan["repo_requests"]:>12}',
+        f'{"transferred":16} {plan["bytes"] / 1e6:>9.1f} MB',
+        f'{"wall time":16} {str(wall_time):>12}',
+        'first search page ' + (
+            'taken from the archive' if plan['archived'] else 'fetched'),
+        'latency and sizes ' + (
+            'from previous metrics' if plan['observed'] else 'guessed'),
+    ]
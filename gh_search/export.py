@@ -0,0 +1,197 @@
+"""
+Columnar exports of the repository language stats, meant for analytics
+"""
+
+import csv
+import json
+import mmap
+import os
+import sys
+
+from array import array
+
+from gh_search.records import LANGUAGES, LanguageTable
+
+
+COLUMNS_VERSION = 1
+
+LONG_HEADER = ('repo', 'owner', 'language', 'percent')
+
+
+class LongExporter:
+    """
+    Write the language stats in long format, one row per (repo, language):
+
+    repo    owner   language    percent
+    bar     foo     Rust        99.9
+    bar     foo     C           0.1
+
+    Repos without any language stats don't have any row.
+    Rows are written as results come, so this can be used while crawling
+    """
+
+    def __init__(self, path, delimiter='\t'):
+        self.fh = open(path, 'w', newline='')
+        self.writer = csv.writer(
+            self.fh, delimiter=delimiter, lineterminator='\n')
+        self.writer.writerow(LONG_HEADER)
+
+    def write(self, result):
+        self.writer.writerows(
+            (result.repo, result.owner, language, percent)
+            for language, percent in result.language_stats().items())
+
+    def flush(self):
+        self.fh.flush()
+
+    def close(self):
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ColumnsExporter:
+    """
+    Write the language stats in a compact binary columnar layout. It's a
+    directory with these files:
+
+    meta.json     format version and byte order of the binary columns
+    languages.txt language dictionary, the id of a language is its line number
+    repos.tsv     url, owner and repo name of every repo
+    offsets.u64   where the stats of every repo start in the stat columns,
+                  plus a last entry with where the last one ends (uint64)
+    lang_ids.u16  language id of every stat (uint16)
+    percents.f32  percentage of every stat (float32)
+
+    The columns are only appended to, so they are written as results come and
+    can be read with `ColumnsReader` without copying them
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'meta.json'), 'w') as fh:
+            json.dump(
+                {'version': COLUMNS_VERSION, 'byteorder': sys.byteorder}, fh)
+        self.languages = LanguageTable()
+        self.languages_fh = open(os.path.join(path, 'languages.txt'), 'w')
+        self.repos_fh = open(os.path.join(path, 'repos.tsv'), 'w', newline='')
+        self.repos = csv.writer(
+            self.repos_fh, delimiter='\t', lineterminator='\n')
+        self.offsets_fh = open(os.path.join(path, 'offsets.u64'), 'wb')
+        self.lang_ids_fh = open(os.path.join(path, 'lang_ids.u16'), 'wb')
+        self.percents_fh = open(os.path.join(path, 'percents.f32'), 'wb')
+        self.offset = 0
+        array('Q', [self.offset]).tofile(self.offsets_fh)
+
+    def _language_id(self, lang_id):
+        """
+        Translate a `LANGUAGES` id into an id of this export's dictionary,
+        adding the language to it if it's new
+        """
+        name = LANGUAGES.name(lang_id)
+        if name not in self.languages.ids:
+            self.languages_fh.write(f'{name}\n')
+        return self.languages.id(name)
+
+    def write(self, result):
+        self.repos.writerow((result.url, result.owner, result.repo))
+        array('H', map(self._language_id, result.lang_ids)).tofile(
+            self.lang_ids_fh)
+        result.percents.tofile(self.percents_fh)
+        self.offset += len(result.lang_ids)
+        array('Q', [self.offset]).tofile(self.offsets_fh)
+
+    def _files(self):
+        # offsets last, so readers never see offsets past the written stats
+        return (self.languages_fh, self.repos_fh, self.lang_ids_fh,
+                self.percents_fh, self.offsets_fh)
+
+    def flush(self):
+        for fh in self._files():
+            fh.flush()
+
+    def close(self):
+        for fh in self._files():
+            fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _map_column(path, typecode):
+    """
+    Memory map a binary column and return it as a read only memoryview of the
+    given type, without copying it
+    """
+    with open(path, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:  # empty files can't be mapped
+            return memoryview(array(typecode))
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast(typecode)
+
+
+class ColumnsReader:
+    """
+    Read an export written by `ColumnsExporter`.
+    `offsets`, `lang_ids` and `percents` are memoryviews over the memory
+    mapped files, so nothing is copied until it is actually accessed
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as fh:
+            meta = json.load(fh)
+        if meta['version'] != COLUMNS_VERSION:
+            raise ValueError(f'unsupported export version: {meta["version"]}')
+        if meta['byteorder'] != sys.byteorder:
+            raise ValueError(f'export is {meta["byteorder"]} endian')
+
+        with open(os.path.join(path, 'languages.txt')) as fh:
+            self.languages = fh.read().splitlines()
+        with open(os.path.join(path, 'repos.tsv'), newline='') as fh:
+            self.repos = list(csv.reader(fh, delimiter='\t'))
+
+        self.offsets = _map_column(os.path.join(path, 'offsets.u64'), 'Q')
+        self.lang_ids = _map_column(os.path.join(path, 'lang_ids.u16'), 'H')
+        self.percents = _map_column(os.path.join(path, 'percents.f32'), 'f')
+
+    def __len__(self):
+        # the exporter might have been interrupted in the middle of a write
+        return max(min(len(self.repos), len(self.offsets) - 1), 0)
+
+    def language_stats(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return {
+            self.languages[lang_id]: percent
+            for lang_id, percent in zip(
+                self.lang_ids[start:end], self.percents[start:end])}
+
+    def __getitem__(self, i):
+        url, owner, repo = self.repos[i]
+        return url, owner, repo, self.language_stats(i)
+
+    def close(self):
+        for column in (self.offsets, self.lang_ids, self.percents):
+            column.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+EXPORTERS = {
+    'tsv': LongExporter,
+    'csv': lambda path: LongExporter(path, delimiter=','),
+    'columns': ColumnsExporter}
+
+
+def open_exporter(path, export_format):
+    return EXPORTERS[export_format](path)
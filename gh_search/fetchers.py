@@ -3,109 +3,698 @@ Functions that fetch data using http requests
 """
 
 import asyncio
+import codecs
+import collections
+import functools
 import logging
-import os
 import random
-import sys
 import time
+import weakref
+import zlib
 
-import aiohttp
-import requests
-
+from gh_search import deadline, metrics, proxies, transfer
+from gh_search.archive import archive_page
+from gh_search.parse_cache import parse
 from gh_search.parse_html import parse_links, parse_repo_lang_stats
 
 
+BACKOFF_BASE = 1  # seconds of the first backoff wait
 MAX_BACKOFF = 64
 MAX_TRIES = 10
+MAX_CONCURRENCY = 32
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+RETRY_BUDGET = 120  # seconds a single url can spend being retried
+MAX_BODY_SIZE = 8 * 1024 * 1024  # bytes of a single response
+MAX_INFLIGHT_BYTES = 64 * 1024 * 1024  # bytes being read or not handed over
+CHUNK_SIZE = 64 * 1024
+WARM_CONNECTIONS = 4  # connections opened through every proxy in advance
+KEEPALIVE_TIMEOUT = 60  # seconds an idle connection is kept open
+DNS_CACHE_TTL = 600  # seconds a resolved host is kept
+# set to True for the async fetches to back off with a blocking sleep, so a
+# throttled crawl slows down as a whole instead of only waiting in the fetch
+# being retried. Only for a loop that runs nothing but the crawl (the CLI)
+BLOCKING_BACKOFF = False
 
 logger = logging.getLogger(__name__)
 
 
+class ResponseTooLarge(Exception):
+    pass
+
+
+class FetchError(Exception):
+    """
+    A page could not be fetched, even after retrying it as much as allowed.
+    `status` is the last http status code (None for network errors)
+    """
+
+    def __init__(self, url, status=None):
+        super().__init__(
+            f'gave up on `{url}`, last http status code: `{status}`')
+        self.url = url
+        self.status = status
+
+
+class InflightBytes:
+    """
+    Count the bytes of the responses being read at the same time, and of the
+    pages already read but not handed over yet. Every read reserves room for
+    its whole body before it starts (its Content-Length, or MAX_BODY_SIZE if
+    that's unknown or the body is compressed) and waits while it doesn't fit
+    in `max_bytes`, so a few huge pages slow the crawl down instead of taking
+    all the memory. A read is always let in when no other one is going on,
+    so the pages waiting to be handed over can't stall the crawl
+    """
+
+    def __init__(self, max_bytes=MAX_INFLIGHT_BYTES):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.reading = 0
+        self.waiters = collections.deque()
+
+    def _fits(self, n):
+        return self.used + n <= self.max_bytes or not self.reading
+
+    def _reserve(self, n):
+        self.reading += 1
+        self.add(n)
+
+    async def admit(self, n):
+        """
+        Wait until there is room to read a response of `n` bytes, and
+        reserve it. Every admitted read must be ended with `finish`
+        """
+        if not self.waiters and self._fits(n):
+            self._reserve(n)
+            return
+        metrics.incr('fetch.backpressure_waits')
+        future = asyncio.get_event_loop().create_future()
+        self.waiters.append((future, n))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():  # already reserved
+                self.finish(n)
+            raise
+        finally:
+            if (future, n) in self.waiters:
+                self.waiters.remove((future, n))
+
+    def add(self, n):
+        self.used += n
+        metrics.set_max('fetch.inflight_bytes_peak', self.used)
+
+    def finish(self, reserved, kept=0):
+        """
+        End a read that had `reserved` bytes, keeping `kept` of them counted
+        (its page, until it's handed over and `release`d)
+        """
+        self.reading -= 1
+        self.release(reserved - kept)
+
+    def release(self, n):
+        self.used -= n
+        while self.waiters and self._fits(self.waiters[0][1]):
+            future, n = self.waiters.popleft()
+            if not future.done():
+                self._reserve(n)
+                future.set_result(None)
+
+
+inflight_bytes = InflightBytes()
+
+# sessions made by `make_session`, which leave the decompression to us
+_raw_sessions = weakref.WeakSet()
+
+# seconds every connection opened by `warm_up` took, by proxy (None for the
+# ones that failed)
+_handshakes = collections.defaultdict(list)
+
+_ACCEPT_ENCODING = {'Accept-Encoding': transfer.ACCEPT_ENCODING}
+
+
 def _backoff_wait_time(i):
     """
     Calculate the backoff wait time
     """
-    return min(2**i + random.random(), MAX_BACKOFF)
+    return min(BACKOFF_BASE * (2**i + random.random()), MAX_BACKOFF)
 
 
-def fetch_links(keywords, page_type, gh_url):
+def _retry_wait_time(url, i, started):
     """
-    Given a list of keywords and a type to search, return a list of links
+    Backoff wait time before trying `url` again, or None if that would go over
+    its retry budget. Raise DeadlineExceeded if it would go over the crawl
+    deadline, instead of sleeping for nothing
+    """
+    wait_time = _backoff_wait_time(i)
+    if time.monotonic() - started + wait_time > RETRY_BUDGET:
+        logger.error(f'retry budget for `{url}` used up')
+        metrics.incr('fetch.retry_budget_exhausted')
+        return None
+    if deadline.clamp(wait_time) < wait_time:
+        deadline.expire()
+        raise deadline.DeadlineExceeded(
+            f'crawl deadline reached while retrying `{url}`')
+    return wait_time
+
+
+def _retryable(status):
+    return status == 429 or str(status).startswith('5')
+
+
+def _backoff(url, i, started):
+    """
+    Seconds to wait before trying `url` again, or None if it shouldn't be
+    tried again, because of its own retry budget or the crawl-wide one
+    """
+    if not proxies.get_retry_budget().allow_retry():
+        logger.error(f'crawl retry budget used up, giving up on `{url}`')
+        return None
+    if (wait_time := _retry_wait_time(url, i, started)) is None:
+        return None
+    logger.warning(f'waiting `{wait_time}` before trying again')
+    return wait_time
+
+
+def _observe(kind, started):
+    """
+    Count a request for a `kind` of page (`search` or `repo`) and how long it
+    took, whatever came of it (see `gh_search.estimate`)
+    """
+    metrics.incr(f'fetch.{kind}.requests')
+    metrics.incr(f'fetch.{kind}.seconds', time.monotonic() - started)
+
+
+def _wire_size(response):
+    """
+    Bytes a `requests` response took on the wire, before decompressing it
+    """
+    if (tell := getattr(getattr(response, 'raw', None), 'tell', None)):
+        return tell()
+    return len(response.content)
+
+
+def search_params(keywords, page_type, page=1):
+    """
+    Query string parameters of a page of search results
+    """
+    params = {'q': '+'.join(keywords), 'type': page_type}
+    if page != 1:
+        params['p'] = page
+    return params
+
+
+def fetch_search_page(keywords, page_type, gh_url, page=1):
+    """
+    Given a list of keywords and a type to search, return the HTML content of
+    the given page of search results, as utf-8 bytes.
     Using truncated exponential backoff as explained here:
     https://cloud.google.com/storage/docs/exponential-backoff
+    Raise FetchError if it can't be fetched
     """
+    import requests  # slow to import, only loaded when searching
+
     search_url = f'{gh_url}/search'
-    proxy = os.environ['HTTP_PROXY']
+    params = search_params(keywords, page_type, page)
 
+    pool = proxies.get_pool()
+    proxies.get_retry_budget().first_attempt()
+    started = time.monotonic()
+    status = None
     for i in range(MAX_TRIES):
+        deadline.check()
 
-        logger.info(f'fetching data from `{search_url}` using proxy `{proxy}`')
-        response = requests.get(
-            search_url,
-            params={
-                'q': '+'.join(keywords),
-                'type': page_type})
+        try:
+            proxy = pool.acquire()
+        except proxies.NoProxyAvailable as e:
+            logger.warning(f'cannot fetch `{search_url}`: {e}')
+            status = None
+        else:
+            logger.info(
+                f'fetching data from `{search_url}` using proxy `{proxy}`')
+            url = proxies.proxy_url(proxy)
+            request_started = time.monotonic()
+            try:
+                response = requests.get(
+                    search_url, params=params,
+                    headers={'Accept-Encoding': transfer.ACCEPT_ENCODING},
+                    proxies=url and {'http': url, 'https': url},
+                    timeout=(CONNECT_TIMEOUT, deadline.clamp(READ_TIMEOUT)))
+                _observe('search', request_started)
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                logger.warning(f'request to `{search_url}` failed: {e}')
+                _observe('search', request_started)
+                metrics.incr('fetch.network_errors')
+                pool.record(proxy, ok=False)
+                status = None
+            else:
+                status = response.status_code
+                pool.record(proxy, ok=not _retryable(status))
+                if status == 200:
+                    # github's pages are utf-8, the bytes go to the parser as
+                    # they are
+                    content = response.content
+                    transfer.record(
+                        search_url, proxy, _wire_size(response),
+                        len(content), kind='search')
+                    archive_page(
+                        search_url, 'search', content,
+                        params=params, page_type=page_type, gh_url=gh_url)
+                    return content
+                elif not _retryable(status):
+                    break  # I consider any other status code as an error
 
-        status = response.status_code
+        # exponential backoff
+        if (wait_time := _backoff(search_url, i, started)) is None:
+            break
+        time.sleep(wait_time)
 
-        if status == 429 or str(status).startswith('5'):
-            # exponential backoff
-            wait_time = _backoff_wait_time(i)
-            logger.warning(f'waiting `{wait_time}` before trying again')
-            time.sleep(wait_time)
+    raise FetchError(search_url, status)
 
-        elif status == 200:
-            content = response.content.decode('utf-8')
-            links = parse_links(content, page_type, gh_url)
-            return links
 
-        else:  # I consider any other status code as an error
-            break
+def fetch_links(keywords, page_type, gh_url, page=1):
+    """
+    Given a list of keywords and a type to search, return a list of links
+    """
+    content = fetch_search_page(keywords, page_type, gh_url, page)
+    return parse(parse_links, content, page_type, gh_url)
 
-    logger.error(f'could not retrieve data from `{search_url}`')
-    logger.error(f'http status code: {status}')
-    sys.exit(1)
 
+def utf8_body(data, charset=None):
+    """
+    The body `data` as utf-8 bytes. Only pages declaring another charset
+    (github's don't) are decoded and encoded again, unknown ones are taken
+    as utf-8
+    """
+    try:
+        if charset is None or codecs.lookup(charset).name == 'utf-8':
+            return data
+    except LookupError:
+        return data
+    return data.decode(charset, errors='replace').encode('utf-8')
+
+
+async def read_body(url, response, proxy=None, decompress=True, kind='repo'):
+    """
+    Read the body of a response in chunks and return it as utf-8 bytes, so
+    it's only decoded by the parser, and only on a parse cache miss. Raise
+    ResponseTooLarge as soon as it goes over MAX_BODY_SIZE bytes
+    (decompressed), instead of reading the rest.
+    Room for the body is reserved in `inflight_bytes` before reading it, and
+    the returned body stays counted there until the caller releases it.
+    If `decompress` is set, the body is decompressed here while it's read,
+    otherwise it's expected to be decompressed already (by aiohttp). Both
+    the transferred and the decompressed bytes are accounted for `proxy`
+    and the `kind` of page (see `gh_search.transfer`), or only the
+    decompressed ones if aiohttp decompressed them
+    """
+    if (response.content_length or 0) > MAX_BODY_SIZE:
+        metrics.incr('fetch.too_large')
+        raise ResponseTooLarge(
+            f'`{url}` is `{response.content_length}` bytes long')
+
+    encoding = response.headers.get('Content-Encoding')
+    if encoding or response.content_length is None:
+        reserved = MAX_BODY_SIZE
+    else:
+        reserved = response.content_length
+    await inflight_bytes.admit(reserved)
+
+    decoder = transfer.decoder(encoding if decompress else None)
+    chunks, wire_size, size, body = [], 0, 0, b''
 
-async def fetch_page_async(url, session):
+    def grow(n):
+        nonlocal reserved
+        if n > reserved:  # the Content-Length was wrong, or the charset
+            inflight_bytes.add(n - reserved)
+            reserved = n
+
+    def add(data):
+        nonlocal size
+        size += len(data)
+        if size > MAX_BODY_SIZE:
+            metrics.incr('fetch.too_large')
+            raise ResponseTooLarge(
+                f'`{url}` is more than `{MAX_BODY_SIZE}` bytes long')
+        grow(size)
+        chunks.append(data)
+
+    try:
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            wire_size += len(chunk)
+            # never decompress more than it takes to go over the limit
+            add(decoder.decompress(chunk, MAX_BODY_SIZE - size + 1))
+        add(decoder.flush())
+        # a session that decompresses itself hides the transferred size
+        transfer.record(
+            url, proxy, wire_size if decompress else None, size, kind=kind)
+        body = utf8_body(b''.join(chunks), response.charset)
+        grow(len(body))
+        return body
+    except zlib.error as e:
+        raise transfer.UnsupportedEncoding(f'`{url}` is corrupt: {e}')
+    finally:
+        inflight_bytes.finish(reserved, kept=len(body))
+
+
+async def fetch_page_async(url, session, kind='repo'):
     """
-    Async page fetch with exponential backoff
+    Async page fetch with exponential backoff. `kind` is the kind of page
+    (`repo`, or the name of an enricher) it's archived and accounted as.
+    Raise ResponseTooLarge for pages bigger than MAX_BODY_SIZE, and
+    FetchError if it can't be fetched. The page stays counted in
+    `inflight_bytes` until the caller releases it (see `read_body`)
     """
-    proxy = os.environ['HTTP_PROXY']
+    import aiohttp  # already loaded by whoever made the session
 
+    pool = proxies.get_pool()
+    proxies.get_retry_budget().first_attempt()
+    started = time.monotonic()
+    status = None
     for i in range(MAX_TRIES):
-        logger.info(f'fetching data from `{url}` using proxy `{proxy}`')
-        async with session.get(url) as response:
-            status = response.status
-
-            if status == 429 or str(status).startswith('5'):
-                # exponential backoff
-                wait_time = _backoff_wait_time(i)
-                logger.warning(f'waiting `{wait_time}` before trying again')
-                # I am using a blocking syncronous sleep instead of
-                # asyncio.sleep because I want it to block and slow down all
-                # concurrent requests
-                time.sleep(wait_time)
-
-            elif status == 200:
-                return await response.text()
-
-            else:  # I consider any other status code as an error
+        deadline.check()
+
+        try:
+            proxy = pool.acquire()
+        except proxies.NoProxyAvailable as e:
+            logger.warning(f'cannot fetch `{url}`: {e}')
+            status = None
+        else:
+            logger.info(f'fetching data from `{url}` using proxy `{proxy}`')
+            request_started = time.monotonic()
+            status = None
+            try:
+                async with session.get(
+                        url, proxy=proxies.proxy_url(proxy),
+                        headers=_ACCEPT_ENCODING) as response:
+                    status = response.status
+                    pool.record(proxy, ok=not _retryable(status))
+                    if status == 200:
+                        content = await read_body(
+                            url, response, proxy,
+                            decompress=session in _raw_sessions, kind=kind)
+                        archive_page(url, kind, content)
+                        return content
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f'request to `{url}` failed: {e!r}')
+                metrics.incr('fetch.network_errors')
+                pool.record(proxy, ok=False)
+                status = None
+            except asyncio.CancelledError:
+                if status is None:  # before it could be recorded
+                    pool.release(proxy)
+                raise
+            else:
+                if not _retryable(status):
+                    break  # I consider any other status code as an error
+            finally:
+                _observe(kind, request_started)
+
+        # exponential backoff
+        if (wait_time := _backoff(url, i, started)) is None:
+            break
+        if BLOCKING_BACKOFF:
+            # a blocking syncronous sleep instead of asyncio.sleep, to block
+            # and slow down all concurrent requests
+            time.sleep(wait_time)
+        else:
+            await asyncio.sleep(wait_time)
+
+    raise FetchError(url, status)
+
+
+async def _single_flight(key, inflight, coro_fn):
+    """
+    Run `coro_fn()` only if there isn't already a fetch in flight for `key`,
+    otherwise wait for the result of the existing one.
+    The first caller runs the fetch itself and shares the outcome with the
+    callers waiting for it through a future. If that caller gets cancelled,
+    the next waiter takes over the fetch. Finished fetches are removed from
+    `inflight`, so a failure is not handed to later callers and results are
+    not kept around
+    """
+    while (future := inflight.get(key)) is not None:
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():  # we are the ones being cancelled
+                raise
+
+    future = inflight[key] = asyncio.get_event_loop().create_future()
+    try:
+        result = await coro_fn()
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # don't complain if nobody else was waiting
+        raise
+    except BaseException:
+        future.cancel()
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        del inflight[key]
+
+
+async def iter_pages_async(
+        urls, session, inflight=None, parser=None, limit=None, kind='repo'):
+    """
+    Fetch many pages concurrently, yielding `(index, page)` tuples in the
+    order of `urls` as soon as each page (and all the previous ones) is done.
+    At most MAX_CONCURRENCY requests are made at the same time, and they are
+    started in the order of `urls` so the first ones finish first.
+    Identical urls are only fetched once: all the requests for the same url
+    share a single in-flight fetch. If a `parser` is given, each page is
+    parsed once right after it's fetched and the parsed value is what gets
+    shared and yielded.
+    `inflight` maps urls to their fetches in flight and can be shared
+    between concurrent calls (e.g. between the keyword sets of a batch run)
+    to coalesce those too.
+    Pages that could not be fetched are yielded as their exception. The
+    fetched pages stay counted in `inflight_bytes` until they are parsed, or
+    yielded if there is no `parser`.
+    If `limit` is given, stop as soon as `limit` pages have been fetched
+    successfully, and stop too if the crawl deadline is reached (see
+    `gh_search.deadline`). Whatever is still pending when the iteration stops
+    (because of that or because the caller stopped iterating) is cancelled.
+    The pages are fetched as the given `kind` (see `fetch_page_async`).
+    """
+    if inflight is None:
+        inflight = {}
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    held = {}  # bytes of the fetched pages not yielded yet, by url
+
+    async def fetch(url):
+        async with semaphore:
+            page = await fetch_page_async(url, session, kind)
+        if not parser:
+            held[url] = len(page)
+            return page
+        try:
+            return parser(page)
+        finally:
+            inflight_bytes.release(len(page))
+
+    tasks = [
+        asyncio.ensure_future(
+            _single_flight(url, inflight, lambda url=url: fetch(url)))
+        for url in urls]
+
+    try:
+        succeeded = 0
+        for i, task in enumerate(tasks):
+            if limit is not None and succeeded >= limit:
+                break
+            # the later tasks keep making progress while we wait for this one
+            await asyncio.wait([task], timeout=deadline.time_left())
+            if not task.done():
+                deadline.expire()
                 break
+            if exception := task.exception():
+                yield i, exception
+            else:
+                succeeded += 1
+                inflight_bytes.release(held.pop(urls[i], 0))
+                yield i, task.result()
+    finally:
+        if pending := [task for task in tasks if not task.done()]:
+            logger.info(f'cancelling `{len(pending)}` fetches')
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        inflight_bytes.release(sum(held.values()))
+
+
+def _connection_trace():
+    """
+    aiohttp trace counting the new connections and how long it took to open
+    them (DNS, proxy CONNECT and TLS handshake). The time is also put in the
+    `trace_request_ctx` of the request, if it's a dict
+    """
+    import aiohttp
+
+    async def start(session, context, params):
+        context.connect_started = time.monotonic()
 
-    logger.error(f'could not retrieve data from `{url}`')
-    logger.error(f'http status code: {status}')
-    sys.exit(1)
+    async def end(session, context, params):
+        seconds = time.monotonic() - context.connect_started
+        metrics.incr('fetch.connections')
+        metrics.incr('fetch.connect_seconds', seconds)
+        if isinstance(context.trace_request_ctx, dict):
+            context.trace_request_ctx['connect_seconds'] = seconds
 
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_start.append(start)
+    trace.on_connection_create_end.append(end)
+    return trace
 
-async def fetch_many_pages_async(urls, loop):
-    async with aiohttp.ClientSession(loop=loop, trust_env=True) as session:
-        tasks = [fetch_page_async(url, session) for url in urls]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        return results
+
+def make_session(loop=None):
+    """
+    aiohttp session with the crawler's timeouts, for `iter_pages_async`.
+    It doesn't decompress the responses, so `read_body` can account for the
+    compressed bytes and decompress them itself.
+    Idle connections are kept for KEEPALIVE_TIMEOUT seconds and resolved
+    hosts for DNS_CACHE_TTL, so the ones opened by `warm_up` while
+    searching are still there when the repo pages are fetched
+    """
+    import aiohttp  # slow to import, only loaded when fetching repos
+
+    timeout = aiohttp.ClientTimeout(
+        sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    connector = aiohttp.TCPConnector(
+        loop=loop, keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL)
+    session = aiohttp.ClientSession(
+        loop=loop, connector=connector, trust_env=True, timeout=timeout,
+        auto_decompress=False, trace_configs=[_connection_trace()])
+    _raw_sessions.add(session)
+    return session
+
+
+async def warm_up(session, gh_url, connections=WARM_CONNECTIONS):
+    """
+    Open `connections` keep-alive connections to `gh_url` through every proxy
+    that isn't being skipped, so the first repo requests don't all pay for
+    the handshakes at the same time. They are opened by fetching the small
+    `robots.txt` of `gh_url` that many times at once, each request holding
+    its connection until all of them are done (so each one needs its own),
+    and then left in the pool of `session`, which must be made by
+    `make_session` to time them. Failed ones count against their proxy as
+    any other request.
+    Return (and keep for `handshake_summary`) the seconds every new
+    connection took to open, by proxy, with None for the ones that failed
+    """
+    import aiohttp  # already loaded by whoever made the session
+
+    pool = proxies.get_pool()
+    handshakes = collections.defaultdict(list)
+    warm = [
+        proxy for proxy, state in pool.states().items()
+        if state != proxies.OPEN]
+    if warm and (limit := getattr(session.connector, 'limit', 0)):
+        # the held connections can't wait for each other to be free
+        connections = min(connections, limit // len(warm))
+    pending = len(warm) * connections
+    all_done = asyncio.Event()
+
+    def done():
+        nonlocal pending
+        pending -= 1
+        if pending <= 0:
+            all_done.set()
+
+    async def connect(proxy):
+        context, held = {}, False
+        try:
+            async with session.get(
+                    f'{gh_url}/robots.txt', proxy=proxies.proxy_url(proxy),
+                    allow_redirects=False,
+                    trace_request_ctx=context) as response:
+                # read it all, or the connection can't be used again
+                await response.read()
+                ok = not _retryable(response.status)
+                held = True
+                done()
+                await all_done.wait()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(
+                f'could not open a connection through `{proxy}`: {e!r}')
+            ok = False
+        except asyncio.CancelledError:
+            if held:
+                pool.record(proxy, ok)
+            else:
+                pool.release(proxy)
+            raise
+        if not held:
+            done()
+        pool.record(proxy, ok)
+        metrics.incr('warm_up.connections' if ok else 'warm_up.failures')
+        if not ok:
+            handshakes[proxy].append(None)
+        elif 'connect_seconds' in context:  # not one that was already open
+            handshakes[proxy].append(context['connect_seconds'])
+
+    logger.info(
+        f'opening `{connections}` connections through `{len(warm)}` proxies')
+    await asyncio.gather(*(
+        connect(proxy) for proxy in warm for _ in range(connections)))
+    for proxy, seconds in handshakes.items():
+        _handshakes[proxy].extend(seconds)
+        if opened := sorted(s for s in seconds if s is not None):
+            logger.info(
+                f'opened `{len(opened)}` connections through `{proxy}` in '
+                f'`{1000 * opened[len(opened) // 2]:.0f}` ms (median)')
+    return dict(handshakes)
+
+
+def handshake_summary():
+    """
+    Lines of a table with the connections opened in advance through every
+    proxy and how long their handshakes took
+    """
+    if not _handshakes:
+        return []
+    lines = [f'{"proxy":24} {"opened":>7} {"failed":>7} {"median ms":>10} '
+             f'{"max ms":>7}']
+    for proxy, seconds in sorted(
+            _handshakes.items(), key=lambda x: str(x[0])):
+        opened = sorted(s for s in seconds if s is not None)
+        median = 1000 * opened[len(opened) // 2] if opened else 0
+        slowest = 1000 * opened[-1] if opened else 0
+        lines.append(
+            f'{str(proxy or "direct"):24} {len(opened):7} '
+            f'{len(seconds) - len(opened):7} {median:10.0f} {slowest:7.0f}')
+    return lines
+
+
+async def fetch_many_pages_async(
+        urls, loop, inflight=None, parser=None, limit=None, callback=None):
+    """
+    Fetch many pages concurrently (see `iter_pages_async`) and return them in
+    the same order as `urls`. The pages that were not needed because of the
+    `limit`, or not fetched before the crawl deadline, are returned as None.
+    If a `callback` is given, it's called with the index and the page as soon
+    as each one is done, in order.
+    """
+    pages = [None] * len(urls)
+    async with make_session(loop) as session:
+        async for i, page in iter_pages_async(
+                urls, session, inflight, parser, limit):
+            pages[i] = page
+            if callback:
+                callback(i, page)
+    return pages
 
 
-def fetch_lang_stats(links):
+def fetch_lang_stats(links, inflight=None, limit=None, callback=None):
     loop = asyncio.get_event_loop()
-    pages = loop.run_until_complete(fetch_many_pages_async(links, loop))
-    return map(parse_repo_lang_stats, pages)
+    return loop.run_until_complete(fetch_many_pages_async(
+        links, loop, inflight,
+        parser=functools.partial(parse, parse_repo_lang_stats),
+        limit=limit,
+        callback=callback))
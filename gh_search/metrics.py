@@ -0,0 +1,65 @@
+"""
+Crawl-wide counters, to see what a run did
+"""
+
+import json
+import logging
+import threading
+
+from collections import Counter
+
+
+logger = logging.getLogger(__name__)
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def set_max(name, value):
+    """
+    Keep the highest `value` seen for `name` (e.g. a peak)
+    """
+    with _lock:
+        if value > _counters[name]:
+            _counters[name] = value
+
+
+def get(name):
+    return _counters[name]
+
+
+def snapshot():
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+
+
+def log_summary():
+    for name, value in snapshot().items():
+        logger.info(f'{name}: {value}')
+
+
+def load(path):
+    """
+    Metrics dumped by a previous run, or nothing if there are none
+    """
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def dump(path):
+    logger.info(f'writing metrics to `{path}`')
+    with open(path, 'w') as fh:
+        json.dump(snapshot(), fh, indent=2)
@@ -0,0 +1,211 @@
+"""
+JSON output of the results: pluggable serializers (orjson when it's
+installed, the standard library otherwise) and a buffered writer that
+serializes and writes the records in batches, in a background thread
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import re
+import sys
+import threading
+
+from gh_search.records import to_json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+BATCH_SIZE = 512  # records serialized at once
+MAX_BATCHES = 8  # queued for the writer thread before `write` blocks
+
+_NON_ASCII = re.compile('[^\x00-\x7f]')
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(match):
+    """
+    A non-ascii character escaped as `json.dumps` does it (as a surrogate
+    pair if it's not in the basic plane)
+    """
+    code = ord(match.group())
+    if code < 0x10000:
+        return f'\\u{code:04x}'
+    code -= 0x10000
+    return f'\\u{0xd800 | code >> 10:04x}\\u{0xdc00 | code & 0x3ff:04x}'
+
+
+class JsonSerializer:
+    """
+    Standard library serializer. Non-ascii characters are escaped, as
+    `json.dump` does by default
+    """
+
+    name = 'json'
+
+    def dumps(self, obj, pretty=False):
+        if pretty:
+            data = json.dumps(obj, indent=2, default=to_json)
+        else:
+            data = json.dumps(obj, separators=(',', ':'), default=to_json)
+        return data.encode('ascii')
+
+
+class OrjsonSerializer:
+    """
+    Serializer using orjson, which is several times faster. orjson can't
+    escape non-ascii characters, so they are escaped afterwards (only in the
+    batches that have any), for the output to be the same as with the
+    standard library
+    """
+
+    name = 'orjson'
+
+    def dumps(self, obj, pretty=False):
+        data = orjson.dumps(
+            obj, default=to_json, option=orjson.OPT_INDENT_2 if pretty else 0)
+        if data.isascii():
+            return data
+        return _NON_ASCII.sub(_escape, data.decode('utf-8')).encode('ascii')
+
+
+SERIALIZERS = {'json': JsonSerializer}
+if orjson is not None:
+    SERIALIZERS['orjson'] = OrjsonSerializer
+
+
+def get_serializer(name=None):
+    """
+    The serializer called `name` (a key of SERIALIZERS), or the fastest one
+    available
+    """
+    if name is None:
+        name = 'orjson' if 'orjson' in SERIALIZERS else 'json'
+    if name not in SERIALIZERS:
+        raise ValueError(f'unavailable serializer: `{name}`')
+    return SERIALIZERS[name]()
+
+
+class OutputWriter:
+    """
+    Write records as a JSON array to `path` (or to stdout) as they come:
+    `write` only collects them in batches of `batch_size`, and a background
+    thread serializes every batch with a single call to the `serializer` and
+    writes it. At most MAX_BATCHES are queued, so memory stays bounded if
+    writing is slower than crawling: `write` blocks then, and `write_async`
+    (which can be the `on_result` of `gh_search.utils.gh_search`) waits
+    without blocking the event loop.
+    With `pretty`, the output is the same as `json.dump(records, indent=2)`
+    whatever the serializer, otherwise it has no whitespace at all. It's
+    always ascii, and written as bytes to stdout too
+    """
+
+    def __init__(
+            self, path=None, pretty=True, serializer=None,
+            batch_size=BATCH_SIZE):
+        self.serializer = get_serializer(serializer)
+        self.pretty = pretty
+        self.batch_size = batch_size
+        self.path = path
+        if path:
+            logger.info(f'writing to file: `{path}`')
+            self.fh = open(path, 'wb')
+        else:
+            logger.info('writing to standard output')
+            sys.stdout.flush()
+            # the bytes go straight to stdout, whatever its encoding (but
+            # stdout may have been replaced by something without them)
+            self.fh = getattr(sys.stdout, 'buffer', sys.stdout)
+        self.text = self.fh is sys.stdout
+        self.batch = []
+        self.count = 0
+        self.error = None
+        self.queue = queue.Queue(MAX_BATCHES)
+        self._write(b'[')
+        self.thread = threading.Thread(
+            target=self._run, name='output-writer', daemon=True)
+        self.thread.start()
+
+    def _write(self, data):
+        if self.text:
+            self.fh.write(data.decode('ascii'))
+        else:
+            self.fh.write(data)
+
+    def _run(self):
+        written = 0
+        while (batch := self.queue.get()) is not None:
+            if self.error is not None:
+                continue  # keep taking batches, so `write` never blocks
+            try:
+                # the items of a serialized array, without the brackets
+                items = self.serializer.dumps(batch, self.pretty)
+                if self.pretty:
+                    items = items[2:-2]  # `[\n` and `\n]`
+                    separator = b',\n' if written else b'\n'
+                else:
+                    items = items[1:-1]
+                    separator = b',' if written else b''
+                self._write(separator + items)
+                written += len(batch)
+            except Exception as e:
+                self.error = e
+
+    def _add(self, record):
+        """
+        Add a record to the current batch, and return the batch if it's full
+        """
+        if self.error is not None:
+            raise self.error
+        self.batch.append(record)
+        self.count += 1
+        if len(self.batch) >= self.batch_size:
+            batch, self.batch = self.batch, []
+            return batch
+
+    def _send(self):
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def write(self, record):
+        if (batch := self._add(record)) is not None:
+            self.queue.put(batch)
+
+    async def write_async(self, record):
+        if (batch := self._add(record)) is not None:
+            try:
+                self.queue.put_nowait(batch)
+            except queue.Full:
+                # the writer is behind, wait for it in another thread
+                await asyncio.get_event_loop().run_in_executor(
+                    None, self.queue.put, batch)
+
+    def close(self):
+        """
+        Write what's left and close the array
+        """
+        self._send()
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            if self.error is None:
+                self._write(b'\n]' if self.pretty and self.count else b']')
+        finally:
+            if self.path:
+                self.fh.close()
+            else:
+                self.fh.flush()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
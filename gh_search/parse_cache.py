@@ -0,0 +1,164 @@
+"""
+Memoization of the HTML parsers, keyed by the hash of the parsed content
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from gh_search import metrics
+from gh_search.parse_html import PARSER_VERSION
+
+
+MAX_ENTRIES = 4096
+
+MISSING = object()
+
+logger = logging.getLogger(__name__)
+
+
+class ParseCache:
+    """
+    Two tier cache of parse results: an in-memory LRU of `max_entries` and,
+    if a `path` is given, a SQLite file that survives between runs.
+    Values are kept as json, so callers always get their own copy
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        if path:
+            import sqlite3  # only needed for the disk tier
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.db = sqlite3.connect(
+                path, timeout=60, isolation_level=None,
+                check_same_thread=False)
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS parse_cache '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL)')
+            columns = [
+                row[1] for row in
+                self.db.execute('PRAGMA table_info(parse_cache)')]
+            if 'stored_at' not in columns:  # made by an older version
+                self.db.execute(
+                    'ALTER TABLE parse_cache ADD COLUMN stored_at REAL')
+        else:
+            self.db = None
+
+    def get(self, key):
+        """
+        Return the cached value for `key`, or MISSING
+        """
+        with self.lock:
+            if (value := self.memory.get(key)) is not None:
+                self.memory.move_to_end(key)
+                metrics.incr('parse_cache.memory_hits')
+                return json.loads(value)
+
+            if self.db and (row := self.db.execute(
+                    'SELECT value FROM parse_cache WHERE key = ?',
+                    (key,)).fetchone()):
+                self._remember(key, row[0])
+                metrics.incr('parse_cache.disk_hits')
+                return json.loads(row[0])
+
+        metrics.incr('parse_cache.misses')
+        return MISSING
+
+    def put(self, key, value):
+        value = json.dumps(value)
+        with self.lock:
+            self._remember(key, value)
+            if self.db:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO parse_cache '
+                    '(key, value, stored_at) VALUES (?, ?, ?)',
+                    (key, value, time.time()))
+
+    def items(self, since=None):
+        """
+        Iterate over the `(key, value, stored_at)` of the disk tier, with
+        values as json. With `since`, only the ones stored after it (entries
+        from before `stored_at` was kept are left out then)
+        """
+        query = 'SELECT key, value, stored_at FROM parse_cache'
+        if since is None:
+            yield from self.db.execute(query)
+        else:
+            yield from self.db.execute(
+                f'{query} WHERE stored_at >= ?', (since,))
+
+    def merge(self, entries):
+        """
+        Add `(key, value, stored_at)` entries (from another cache, with values
+        as json) to the disk tier, and return how many were new. Keys depend
+        on the content only, so the ones already here are left as they are
+        """
+        added = 0
+        with self.lock:
+            self.db.execute('BEGIN')
+            try:
+                for entry in entries:
+                    added += self.db.execute(
+                        'INSERT OR IGNORE INTO parse_cache '
+                        '(key, value, stored_at) VALUES (?, ?, ?)',
+                        entry).rowcount
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+        return added
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+
+_cache = ParseCache()
+
+
+def configure(max_entries=MAX_ENTRIES, path=None):
+    """
+    Replace the parse cache. A `max_entries` of 0 and no `path` disables it
+    """
+    global _cache
+    if max_entries or path:
+        _cache = ParseCache(max_entries, path)
+    else:
+        _cache = None
+
+
+def cache_key(parser, content, *args):
+    """
+    Results only depend on the content, the parser (and its version) and the
+    rest of arguments of the parser. The content can be a str or its utf-8
+    bytes, both get the same key
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    digest = hashlib.sha256(content)
+    digest.update(json.dumps(args).encode('utf-8'))
+    return f'{parser.__name__}:{PARSER_VERSION}:{digest.hexdigest()}'
+
+
+def parse(parser, content, *args):
+    """
+    `parser(content, *args)`, but using the cache so unchanged pages are
+    not parsed again
+    """
+    if _cache is None:
+        return parser(content, *args)
+
+    key = cache_key(parser, content, *args)
+    if (value := _cache.get(key)) is MISSING:
+        value = parser(content, *args)
+        _cache.put(key, value)
+    return value
@@ -3,12 +3,31 @@ Functions used in HTML parsing
 """
 
 import logging
-
-from bs4 import BeautifulSoup
+import re
 
 
 logger = logging.getLogger(__name__)
 
+# bump this whenever the output of the parsers changes, so cached results
+# from older versions are not used
+PARSER_VERSION = 1
+
+RESULT_COUNT_PATTERN = re.compile(r'^\s*([\d,]+)\s+\w')
+ARCHIVED_PATTERN = re.compile(r'has been archived')
+COMMENTS_PATTERN = re.compile(r'([\d,]+)\s+comments?\b')
+REVISIONS_PATTERN = re.compile(r'([\d,]+)\s+revisions?\b')
+
+
+def make_soup(content):
+    # bs4 takes a while to import, so it's only loaded once something needs
+    # to be parsed
+    from bs4 import BeautifulSoup
+    if isinstance(content, bytes):
+        # the fetchers always give utf-8 pages: decoding them here is much
+        # faster than letting bs4 detect their encoding
+        content = content.decode('utf-8', errors='replace')
+    return BeautifulSoup(content, 'html.parser')
+
 
 def _could_not_parse(elem, ret_val=None):
     logger.warning('some html data could not be properly parsed...')
@@ -123,7 +142,7 @@ def parse_links(content, page_type, gh_url):
     return a list of links
     """
     hit_getter = HIT_GETTERS[page_type]
-    soup = BeautifulSoup(content, 'html.parser')
+    soup = make_soup(content)
     if codesearch_results := soup.find("div", class_="codesearch-results"):
         hits = hit_getter(codesearch_results)
         links = [
@@ -135,6 +154,35 @@ def parse_links(content, page_type, gh_url):
         return _could_not_parse(soup, [])
 
 
+def parse_result_count(content):
+    """
+    Given the HTML content of a search page, return the total number of
+    results github reports for the query (not only the ones in this page).
+    As far as I can tell, it's in the first <h3> of the `codesearch-results`
+    that starts with a number:
+
+    <div class="codesearch-results">
+      <div>
+        <div>
+          <h3>4,423 repository results</h3>
+        </div>
+        ...
+      </div>
+    </div>
+
+    If there are no results at all, github doesn't show any count and I
+    assume 0
+    """
+    soup = make_soup(content)
+    if codesearch_results := soup.find("div", class_="codesearch-results"):
+        for h3 in codesearch_results.find_all('h3'):
+            if match := RESULT_COUNT_PATTERN.match(h3.text):
+                return int(match.group(1).replace(',', ''))
+        return 0
+    else:
+        return _could_not_parse(soup)
+
+
 def parse_lang_stat(elem):
     """
     Parse a BeautifulSoup object corresponding to an element containing the
@@ -182,7 +230,10 @@ def parse_repo_lang_stats(content):
     If there's no <h2>Languages</h2>, I assume that repo doesn't have language
     stats there won't be any warning
     """
-    soup = BeautifulSoup(content, 'html.parser')
+    return _lang_stats(make_soup(content))
+
+
+def _lang_stats(soup):
     if h2 := soup.find("h2", string="Languages"):
         if (ul := h2.find_next('ul')):
             stats = dict(
@@ -194,3 +245,104 @@ def parse_repo_lang_stats(content):
             return _could_not_parse(soup, dict())
     else:
         return dict()
+
+
+def _archived(soup):
+    """
+    Archived repos have a warning flash on top like:
+
+    <div class="flash flash-warn flash-full ...">
+      This repository has been archived by the owner. It is now read-only.
+    </div>
+    """
+    return any(
+        ARCHIVED_PATTERN.search(div.text)
+        for div in soup.find_all("div", class_="flash-warn"))
+
+
+def parse_repo_page(content):
+    """
+    Parse what the recrawl scheduler needs from a repo HTML content (see
+    `gh_search.recrawl`): a dict with its language stats (as
+    `parse_repo_lang_stats`) under `languages`, and whether it's `archived`
+    """
+    soup = make_soup(content)
+    return {'languages': _lang_stats(soup), 'archived': _archived(soup)}
+
+
+def _header(soup):
+    """
+    Title and meta line of the header of an issue, pull request or wiki page
+    """
+    if (header := soup.find("div", class_="gh-header")) and \
+            (title := header.find(class_="gh-header-title")):
+        meta = header.find(class_="gh-header-meta")
+        return title, meta
+    return None, None
+
+
+def _header_count(meta, pattern):
+    if meta and (match := pattern.search(meta.text)):
+        return int(match.group(1).replace(',', ''))
+    return 0
+
+
+def parse_issue_page(content):
+    """
+    Parse the details of an issue (or pull request) from its HTML content:
+    a dict with its `title`, `state` (`open`, `closed` or `merged`),
+    `labels` and number of `comments`.
+    I assume a structure like so:
+
+    <div class="gh-header">
+      <h1 class="gh-header-title">
+        <span class="js-issue-title markdown-title">(title)</span>
+        <span>#(number)</span>
+      </h1>
+      <div class="gh-header-meta">
+        <span class="State State--open" title="Status: Open">Open</span>
+        (author) opened this issue on (date) · (N) comments
+      </div>
+    </div>
+    ...
+    <a class="IssueLabel" data-name="(label)">(label)</a>
+
+    With no comments, github doesn't show any count and I assume 0
+    """
+    soup = make_soup(content)
+    title, meta = _header(soup)
+    if title is None:
+        return _could_not_parse(soup)
+    if span := title.find("span", class_="js-issue-title"):
+        title = span
+    state = meta and meta.find(class_="State")
+    labels = [
+        label.get('data-name') or label.text.strip()
+        for label in soup.find_all("a", class_="IssueLabel")]
+    return {
+        'title': title.text.strip(),
+        'state': state.text.strip().lower() if state else None,
+        'labels': list(dict.fromkeys(labels)),
+        'comments': _header_count(meta, COMMENTS_PATTERN)}
+
+
+def parse_wiki_page(content):
+    """
+    Parse the details of a wiki page from its HTML content: a dict with its
+    `title` and number of `revisions`.
+    I assume a structure like so:
+
+    <div class="gh-header">
+      <h1 class="gh-header-title">(title)</h1>
+      <div class="gh-header-meta">
+        (author) edited this page on (date) · (N) revisions
+      </div>
+    </div>
+    """
+    soup = make_soup(content)
+    title, meta = _header(soup)
+    if title is None:
+        return _could_not_parse(soup)
+    return {
+        'title': title.text.strip(),
+        'revisions': _header_count(meta, REVISIONS_PATTERN)}
@@ -0,0 +1,209 @@
+"""
+Query planner that splits big searches into disjoint sub-queries
+"""
+
+import logging
+import math
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date
+
+from gh_search.deadline import DeadlineExceeded
+from gh_search.fetchers import FetchError, fetch_links, fetch_search_page
+from gh_search.parse_cache import parse
+from gh_search.parse_html import parse_links, parse_result_count
+
+
+RESULTS_PER_PAGE = 10
+MAX_PAGES = 100  # github doesn't show any page of results after this one
+MAX_RESULTS = RESULTS_PER_PAGE * MAX_PAGES
+MAX_WORKERS = 8
+
+GH_EPOCH = date(2008, 1, 1)  # nothing on github was created before this
+
+logger = logging.getLogger(__name__)
+
+
+def _format_date_range(name, lo, hi):
+    lo, hi = date.fromordinal(lo), date.fromordinal(hi)
+    return f'{name}:{lo.isoformat()}..{hi.isoformat()}'
+
+
+def _format_int_range(name, lo, hi):
+    if hi is None:
+        return f'{name}:>={lo}'
+    else:
+        return f'{name}:{lo}..{hi}'
+
+
+def _dimensions(page_type):
+    """
+    Qualifiers a `page_type` search can be split on, in the order they are
+    tried. Each one is a range of integers (`None` meaning unbounded) so they
+    can all be bisected the same way.
+    The ranges cover everything, so the sub-queries never miss results.
+    Only qualifiers github supports for that type are used: repos can be
+    split by creation date and stars, issues only by creation date and
+    wikis only by update date
+    """
+    dates = (
+        GH_EPOCH.toordinal(), date.today().toordinal(), _format_date_range)
+    if page_type == 'repositories':
+        return (
+            ('created', *dates),
+            ('stars', 0, None, _format_int_range))
+    elif page_type == 'issues':
+        return (('created', *dates),)
+    elif page_type == 'wikis':
+        return (('updated', *dates),)
+    else:
+        raise ValueError(f'invalid type: `{page_type}`')
+
+
+def _split_range(lo, hi):
+    """
+    Split a range in two disjoint halves. Return None if it can't be split
+    """
+    if hi is None:
+        mid = lo * 2 + 10
+    elif lo < hi:
+        mid = (lo + hi + 1) // 2
+    else:
+        return None
+    return (lo, mid - 1), (mid, hi)
+
+
+def split_slice(slice_):
+    """
+    Split a slice (a tuple with a range for every dimension) in two disjoint
+    slices along the first dimension that can still be split.
+    Return None if the slice can't be split any more
+    """
+    for i, (lo, hi) in enumerate(slice_):
+        if halves := _split_range(lo, hi):
+            return tuple(
+                slice_[:i] + (half,) + slice_[i + 1:]
+                for half in halves)
+    return None
+
+
+def slice_qualifiers(slice_, dimensions):
+    """
+    Return the search qualifiers for a given slice. Dimensions that are not
+    restricted at all are left out
+    """
+    return [
+        fmt(name, lo, hi)
+        for (lo, hi), (name, full_lo, full_hi, fmt) in zip(slice_, dimensions)
+        if (lo, hi) != (full_lo, full_hi)]
+
+
+def _page_count(count):
+    """
+    Number of pages github will show for a given number of results
+    """
+    return min(math.ceil(count / RESULTS_PER_PAGE), MAX_PAGES)
+
+
+def _probe(keywords, page_type, gh_url, slice_, dimensions):
+    """
+    Fetch the first page of a slice and return its estimated result count
+    together with the links in that page
+    """
+    query = keywords + slice_qualifiers(slice_, dimensions)
+    content = fetch_search_page(query, page_type, gh_url)
+    links = parse(parse_links, content, page_type, gh_url)
+    count = parse(parse_result_count, content)
+    return max(count or 0, len(links)), links
+
+
+def plan_slices(keywords, page_type, gh_url, max_workers=MAX_WORKERS):
+    """
+    Split a search into disjoint slices whose results github can fully show.
+    Slices are probed in parallel and the ones that are still too big are
+    refined until they fit in MAX_RESULTS (or can't be split any further).
+    Return a list of `(qualifiers, count, first_page_links)` sorted so that
+    the oldest (and then least starred) slices come first (see
+    `_dimensions`).
+    Slices that could not be probed before the crawl deadline, or at all,
+    are left out. Raise FetchError if not even the whole search can be
+    probed
+    """
+    dimensions = _dimensions(page_type)
+    full = tuple((lo, hi) for _, lo, hi, _ in dimensions)
+    planned = []
+
+    with ThreadPoolExecutor(max_workers) as pool:
+
+        def submit(slice_):
+            future = pool.submit(
+                _probe, keywords, page_type, gh_url, slice_, dimensions)
+            pending[future] = slice_
+
+        pending = {}
+        submit(full)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                slice_ = pending.pop(future)
+                try:
+                    count, links = future.result()
+                except DeadlineExceeded:
+                    continue
+                except FetchError as e:
+                    if slice_ == full:
+                        raise
+                    logger.error(f'leaving a slice out: {e}')
+                    continue
+                if count <= MAX_RESULTS:
+                    planned.append((slice_, count, links))
+                elif halves := split_slice(slice_):
+                    logger.info(f'refining slice with `{count}` results')
+                    for half in halves:
+                        submit(half)
+                else:
+                    query = ' '.join(slice_qualifiers(slice_, dimensions))
+                    logger.warning(
+                        f'slice `{query}` has `{count}` results and '
+                        'cannot be split any more, it will be truncated')
+                    planned.append((slice_, count, links))
+
+    return [
+        (slice_qualifiers(slice_, dimensions), count, links)
+        for slice_, count, links in sorted(
+            planned, key=lambda x: [
+                (lo, math.inf if hi is None else hi) for lo, hi in x[0]])]
+
+
+def fetch_links_planned(keywords, page_type, gh_url, max_workers=MAX_WORKERS):
+    """
+    Like `fetch_links`, but splitting the search into sub-queries to get
+    around the limited number of result pages github shows for each query,
+    and walking all the pages of each sub-query.
+    Sub-queries and pages are fetched in parallel, and the resulting links
+    are merged removing duplicates. The pages not fetched before the crawl
+    deadline, or that could not be fetched, are skipped.
+    """
+    slices = plan_slices(keywords, page_type, gh_url, max_workers)
+    logger.info(f'search split in `{len(slices)}` slices')
+
+    with ThreadPoolExecutor(max_workers) as pool:
+        slice_pages = [
+            (first_page_links, [
+                pool.submit(
+                    fetch_links, keywords + qualifiers, page_type, gh_url,
+                    page)
+                for page in range(2, _page_count(count) + 1)])
+            for qualifiers, count, first_page_links in slices]
+        links = []
+        for first_page_links, futures in slice_pages:
+            links.extend(first_page_links)
+            for future in futures:
+                try:
+                    links.extend(future.result())
+                except DeadlineExceeded:
+                    continue
+                except FetchError as e:
+                    logger.error(f'skipping a page of results: {e}')
+
+    return list(dict.fromkeys(links))
@@ -0,0 +1,219 @@
+"""
+Proxy pool with a circuit breaker for every proxy, and the crawl-wide retry
+budget
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+
+from gh_search import metrics
+
+
+FAILURE_THRESHOLD = 5  # consecutive failures before a proxy is skipped
+RESET_TIMEOUT = 30  # seconds before trying a skipped proxy again
+RETRY_RATIO = 0.2  # retries allowed for every first attempt
+MIN_RETRIES = 10  # so small crawls can still retry
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+logger = logging.getLogger(__name__)
+
+
+class NoProxyAvailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for a proxy. It's closed (requests go through) until
+    `failure_threshold` requests in a row fail, then it opens (requests are
+    not even tried) for `reset_timeout` seconds. After that it's half-open: a
+    single trial request goes through and closes it again if it works, or
+    opens it for another `reset_timeout` if it doesn't. A trial that is
+    cancelled (see `release_trial`), or never recorded for another
+    `reset_timeout`, lets another request be the trial
+    """
+
+    def __init__(
+            self, name, failure_threshold=FAILURE_THRESHOLD,
+            reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.trial_started_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Whether a request can go through. In the half-open state, only the
+        first caller gets to make the trial request
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.state == OPEN and \
+                    now - self.opened_at >= self.reset_timeout:
+                logger.info(f'trying proxy `{self.name}` again')
+                self.state = HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == CLOSED:
+                return True
+            elif self.state == HALF_OPEN and (
+                    not self.trial_in_flight
+                    or now - self.trial_started_at >= self.reset_timeout):
+                self.trial_in_flight = True
+                self.trial_started_at = now
+                return True
+            else:
+                return False
+
+    def release_trial(self):
+        """
+        A request that went through was cancelled before knowing whether it
+        worked. If it was the trial, the next request gets to be the trial
+        """
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.trial_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                logger.info(f'proxy `{self.name}` is working again')
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (
+                    self.state == CLOSED
+                    and self.failures >= self.failure_threshold):
+                logger.warning(
+                    f'proxy `{self.name}` keeps failing, skipping it for '
+                    f'`{self.reset_timeout}` seconds')
+                metrics.incr('proxies.breaker_opened')
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+
+class ProxyPool:
+    """
+    Spread requests randomly between the proxies whose circuit breakers
+    let them through. A None proxy means a direct connection (or whatever is
+    set in the environment)
+    """
+
+    def __init__(self, proxies, **breaker_kwargs):
+        self.breakers = {
+            proxy: CircuitBreaker(proxy, **breaker_kwargs)
+            for proxy in proxies}
+
+    def acquire(self):
+        """
+        Pick a proxy for a request. Raise NoProxyAvailable if all of them are
+        being skipped
+        """
+        proxies = list(self.breakers)
+        for proxy in random.sample(proxies, len(proxies)):
+            if self.breakers[proxy].allow():
+                return proxy
+        metrics.incr('proxies.unavailable')
+        raise NoProxyAvailable('all the proxies are failing')
+
+    def record(self, proxy, ok):
+        """
+        Record whether a request through `proxy` worked
+        """
+        if ok:
+            self.breakers[proxy].record_success()
+        else:
+            metrics.incr('proxies.failures')
+            self.breakers[proxy].record_failure()
+
+    def release(self, proxy):
+        """
+        Record that a request through `proxy` was cancelled before knowing
+        whether it worked
+        """
+        self.breakers[proxy].release_trial()
+
+    def states(self):
+        return {
+            proxy: breaker.state for proxy, breaker in self.breakers.items()}
+
+
+class RetryBudget:
+    """
+    Crawl-wide limit on retries: at most `ratio` retries for every first
+    attempt (plus `min_retries`), so when everything starts failing the
+    retries don't multiply the load
+    """
+
+    def __init__(self, ratio=RETRY_RATIO, min_retries=MIN_RETRIES):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.attempts = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def first_attempt(self):
+        with self.lock:
+            self.attempts += 1
+
+    def allow_retry(self):
+        with self.lock:
+            if self.retries >= self.min_retries + self.ratio * self.attempts:
+                metrics.incr('retries.denied')
+                return False
+            self.retries += 1
+            metrics.incr('retries')
+            return True
+
+
+def proxy_url(proxy):
+    """
+    Url of a proxy given as `host:port`, as the http clients want it
+    """
+    if proxy is None or '://' in proxy:
+        return proxy
+    return f'http://{proxy}'
+
+
+_pool = None
+_retry_budget = None
+
+
+def set_proxies(proxies, **breaker_kwargs):
+    """
+    Use the given proxies for the requests from now on, with fresh circuit
+    breakers (made with `breaker_kwargs`) and retry budget. With None, the
+    proxy in `HTTP_PROXY` (if any) is used once something is fetched
+    """
+    global _pool, _retry_budget
+    _pool = ProxyPool(proxies, **breaker_kwargs) if proxies else None
+    _retry_budget = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProxyPool([os.environ.get('HTTP_PROXY')])
+    return _pool
+
+
+def get_retry_budget():
+    global _retry_budget
+    if _retry_budget is None:
+        _retry_budget = RetryBudget()
+    return _retry_budget
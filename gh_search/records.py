@@ -0,0 +1,147 @@
+"""
+Compact in-memory records for the search results
+"""
+
+import re
+import sys
+
+from array import array
+
+
+LINK_PATTERN = re.compile(
+    r'^(http(s)?://)?(www\.)?github\.com/+([^\/]+)/+([^\/]+)')
+
+
+def parse_link(link):
+    """
+    Get the owner and the repo name of a given github link (which can be a
+    repo, an issue, a wiki page...). Both are None if the link is not a github
+    link
+    """
+    if match := LINK_PATTERN.search(link):
+        return sys.intern(match.group(4)), match.group(5)
+    else:
+        return None, None
+
+
+class LanguageTable:
+    """
+    Gives every language name a small integer id, so each record only needs
+    to store those ids instead of its own copy of every name
+    """
+
+    __slots__ = ('names', 'ids')
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def id(self, name):
+        if (lang_id := self.ids.get(name)) is None:
+            lang_id = self.ids[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return lang_id
+
+    def name(self, lang_id):
+        return self.names[lang_id]
+
+
+LANGUAGES = LanguageTable()
+
+
+class Result:
+    """
+    A search result. The owner and the repo are parsed once from the link
+    when the record is created
+    """
+
+    __slots__ = ('url', 'owner', 'repo')
+
+    def __init__(self, url):
+        self.url = url
+        self.owner, self.repo = parse_link(url)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.url!r})'
+
+    def to_json(self):
+        return {'url': self.url}
+
+
+class RepoResult(Result):
+    """
+    A repository search result. The language stats are stored as two parallel
+    arrays: the ids of the languages (in `LANGUAGES`) and their percentages
+    as float32
+    """
+
+    __slots__ = ('lang_ids', 'percents')
+
+    def __init__(self, url, language_stats=None, languages=LANGUAGES):
+        super().__init__(url)
+        self.lang_ids = array('H')
+        self.percents = array('f')
+        if language_stats:
+            self.set_language_stats(language_stats, languages)
+
+    def set_language_stats(self, language_stats, languages=LANGUAGES):
+        self.lang_ids = array('H', map(languages.id, language_stats))
+        self.percents = array('f', language_stats.values())
+
+    def language_stats(self, languages=LANGUAGES):
+        # float32 can't hold values like 47.2 exactly, 6 significant digits
+        # is what it can represent without noise
+        return {
+            languages.name(lang_id): float(f'{percent:.6g}')
+            for lang_id, percent in zip(self.lang_ids, self.percents)}
+
+    def to_json(self):
+        return {
+            'url': self.url,
+            'extra': {
+                'owner': self.owner,
+                'language_stats': self.language_stats()
+            }
+        }
+
+
+class DetailResult(Result):
+    """
+    An issue or wiki search result with the `details` an enricher parsed
+    from its page (see `gh_search.enrich`)
+    """
+
+    __slots__ = ('details',)
+
+    def __init__(self, url, details=None):
+        super().__init__(url)
+        self.details = details
+
+    def to_json(self):
+        if self.details is None:
+            return {'url': self.url}
+        return {
+            'url': self.url,
+            'extra': {'owner': self.owner, **self.details}
+        }
+
+
+def make_result(link, page_type):
+    if page_type == 'repositories':
+        return RepoResult(link)
+    else:
+        return Result(link)
+
+
+def to_json(record):
+    """
+    Serialize a record into JSON-compatible objects. Meant to be used as the
+    `default` of `json.dump`, so records are only converted when writing them
+    """
+    if isinstance(record, Result):
+        return record.to_json()
+    raise TypeError(
+        f'Object of type {type(record).__name__} is not JSON serializable')
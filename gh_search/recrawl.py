@@ -0,0 +1,260 @@
+"""
+Recrawl scheduler: only fetch again the repos whose language stats are
+likely to have changed since the last time
+"""
+
+import json
+import logging
+import math
+import os
+import time
+
+from collections import Counter
+
+from gh_search import metrics
+
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+MIN_INTERVAL = HOUR
+MAX_INTERVAL = 180 * DAY
+ARCHIVED_INTERVAL = 90 * DAY  # at least, they can still be unarchived
+PRIOR_PERIOD = 7 * DAY  # every repo starts as if it changed once in this
+CHANGE_PROBABILITY = 0.5  # fetch again once it's this likely to have changed
+
+REPO_COLUMNS = (
+    'url', 'languages', 'archived', 'first_fetched', 'last_fetched',
+    'fetches', 'changes', 'next_fetch')
+
+logger = logging.getLogger(__name__)
+
+
+def change_rate(fetches, changes, observed):
+    """
+    Changes per second of a repo fetched `fetches` times over `observed`
+    seconds, whose stats were different from the previous fetch `changes`
+    times. Only whether it changed between two fetches is known, not how
+    many times, so this is the estimator for a Poisson process from Cho and
+    Garcia-Molina's "Estimating frequency of change", which doesn't go to
+    infinity when it changes every time. An extra interval of PRIOR_PERIOD
+    with a change is added, so repos fetched once or never seen changing
+    don't get a rate of 0
+    """
+    intervals = fetches
+    changed = changes + 1
+    mean_interval = (observed + PRIOR_PERIOD) / intervals
+    return -math.log(
+        (intervals - changed + 0.5) / (intervals + 0.5)) / mean_interval
+
+
+def stale_probability(rate, elapsed):
+    """
+    Probability that a repo changing at `rate` changed in `elapsed` seconds
+    """
+    return 1 - math.exp(-rate * elapsed)
+
+
+def next_interval(rate, archived=False):
+    """
+    Seconds until a repo has changed with CHANGE_PROBABILITY
+    """
+    interval = -math.log(1 - CHANGE_PROBABILITY) / rate
+    if archived:
+        interval = max(interval, ARCHIVED_INTERVAL)
+    return min(max(interval, MIN_INTERVAL), MAX_INTERVAL)
+
+
+class RecrawlSchedule:
+    """
+    Change history of every repo, kept in a SQLite file (or in memory, without
+    a `path`): its last language stats, when it was fetched, how many times
+    and how many of those they had changed, and when to fetch it next. Every
+    change is also kept in the `changes` table.
+    A run asks which repos to fetch with `select`, reuses the stored stats
+    (`languages`) of the rest and records every fetch with `observe`. At most
+    `budget` known repos are recrawled in the run (new repos are always
+    fetched, they have no stats to reuse)
+    """
+
+    def __init__(self, path=None, budget=None):
+        import sqlite3  # not needed unless scheduling
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(
+            path or ':memory:', timeout=60, isolation_level=None,
+            check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS repos ('
+            'url TEXT PRIMARY KEY, languages TEXT NOT NULL, '
+            'archived INTEGER NOT NULL, first_fetched REAL NOT NULL, '
+            'last_fetched REAL NOT NULL, fetches INTEGER NOT NULL, '
+            'changes INTEGER NOT NULL, next_fetch REAL NOT NULL)')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS changes ('
+            'url TEXT NOT NULL, changed_at REAL NOT NULL, '
+            'languages TEXT NOT NULL)')
+        self.budget = budget
+        self.counts = Counter()
+        self.stale = 0
+
+    def _row(self, url):
+        return self.db.execute(
+            'SELECT languages, archived, first_fetched, last_fetched, '
+            'fetches, changes, next_fetch FROM repos WHERE url = ?',
+            (url,)).fetchone()
+
+    def languages(self, url):
+        """
+        Last language stats of a repo, or None if it was never fetched
+        """
+        if row := self._row(url):
+            return json.loads(row[0])
+        return None
+
+    def select(self, urls, now=None):
+        """
+        Which of `urls` to fetch: the new ones, and the ones that are due,
+        most likely to have changed first, while there's budget left.
+        The rest are counted as reused, with the probability that their
+        stored stats are stale by now
+        """
+        now = time.time() if now is None else now
+        new, due, reused = [], [], []
+        for url in dict.fromkeys(urls):
+            if (row := self._row(url)) is None:
+                new.append(url)
+                continue
+            _, _, first_fetched, last_fetched, fetches, changes, \
+                next_fetch = row
+            rate = change_rate(fetches, changes, last_fetched - first_fetched)
+            stale = stale_probability(rate, now - last_fetched)
+            (due if next_fetch <= now else reused).append((stale, url))
+
+        due.sort(reverse=True)
+        if self.budget is not None:
+            if len(due) > self.budget:
+                logger.info(
+                    f'`{len(due)}` repos due, only recrawling `{self.budget}`')
+                reused.extend(due[self.budget:])
+                due = due[:self.budget]
+            self.budget -= len(due)
+
+        selected = {
+            'new': len(new), 'recrawled': len(due), 'reused': len(reused)}
+        self.counts.update(selected)
+        for name, count in selected.items():
+            metrics.incr(f'recrawl.{name}', count)
+        self.stale += sum(stale for stale, _ in reused)
+        return new + [url for _, url in due]
+
+    def observe(self, url, languages, archived=False, now=None):
+        """
+        Record a fetch of a repo and plan the next one
+        """
+        now = time.time() if now is None else now
+        if row := self._row(url):
+            old_languages, _, first_fetched, _, fetches, changes, _ = row
+            changed = json.loads(old_languages) != languages
+            fetches, changes = fetches + 1, changes + changed
+        else:
+            first_fetched, fetches, changes, changed = now, 1, 0, True
+        if changed:
+            if row:
+                self.counts['changed'] += 1
+                metrics.incr('recrawl.changed')
+            self.db.execute(
+                'INSERT INTO changes (url, changed_at, languages) '
+                'VALUES (?, ?, ?)',
+                (url, now, json.dumps(languages)))
+
+        rate = change_rate(fetches, changes, now - first_fetched)
+        self.db.execute(
+            'INSERT OR REPLACE INTO repos (url, languages, archived, '
+            'first_fetched, last_fetched, fetches, changes, next_fetch) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (url, json.dumps(languages), int(archived), first_fetched, now,
+             fetches, changes, now + next_interval(rate, archived)))
+
+    def history(self, since=None):
+        """
+        Iterate over every repo (fetched after `since`, if given) as a dict
+        with its row, and its changes under `history` as a list of
+        `[changed_at, languages]`
+        """
+        query = (
+            'SELECT url, languages, archived, first_fetched, last_fetched, '
+            'fetches, changes, next_fetch FROM repos')
+        rows = self.db.execute(query).fetchall() if since is None else \
+            self.db.execute(
+                f'{query} WHERE last_fetched >= ?', (since,)).fetchall()
+        for row in rows:
+            repo = dict(zip(REPO_COLUMNS, row))
+            repo['languages'] = json.loads(repo['languages'])
+            repo['archived'] = bool(repo['archived'])
+            repo['history'] = [
+                [changed_at, json.loads(languages)]
+                for changed_at, languages in self.db.execute(
+                    'SELECT changed_at, languages FROM changes '
+                    'WHERE url = ? ORDER BY changed_at', (row[0],))]
+            yield repo
+
+    def merge(self, repos):
+        """
+        Add repos as given by `history` (from another schedule), and return
+        how many were added. A repo fetched later here is kept as it is, but
+        the changes that weren't known are added either way
+        """
+        added = 0
+        self.db.execute('BEGIN')
+        try:
+            for repo in repos:
+                added += self._merge_repo(repo)
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+        return added
+
+    def _merge_repo(self, repo):
+        url = repo['url']
+        known = {
+            changed_at for (changed_at,) in self.db.execute(
+                'SELECT changed_at FROM changes WHERE url = ?', (url,))}
+        for changed_at, languages in repo['history']:
+            if changed_at not in known:
+                self.db.execute(
+                    'INSERT INTO changes (url, changed_at, languages) '
+                    'VALUES (?, ?, ?)',
+                    (url, changed_at, json.dumps(languages)))
+
+        if (row := self._row(url)) and row[3] >= repo['last_fetched']:
+            return False
+        self.db.execute(
+            'INSERT OR REPLACE INTO repos (url, languages, archived, '
+            'first_fetched, last_fetched, fetches, changes, next_fetch) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (url, json.dumps(repo['languages']), int(repo['archived']),
+             repo['first_fetched'], repo['last_fetched'], repo['fetches'],
+             repo['changes'], repo['next_fetch']))
+        return True
+
+    def summary(self):
+        """
+        Lines with what was fetched and reused, and how many of the reused
+        stats are expected to be stale
+        """
+        counts = self.counts
+        total = counts['new'] + counts['recrawled'] + counts['reused']
+        if not total:
+            return []
+        return [
+            f'{"new repos":16} {counts["new"]:>9}',
+            f'{"recrawled":16} {counts["recrawled"]:>9}',
+            f'{"changed":16} {counts["changed"]:>9}',
+            f'{"reused":16} {counts["reused"]:>9}',
+            f'{"expected stale":16} {self.stale:>9.1f} '
+            f'({self.stale / total:.1%} of {total})']
+
+    def close(self):
+        self.db.close()
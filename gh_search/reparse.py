@@ -0,0 +1,92 @@
+"""
+Parse again the pages of an archived crawl, without using the network
+"""
+
+import logging
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+from gh_search.archive import Archive
+from gh_search.enrich import ENRICHERS
+from gh_search.parse_html import parse_links, parse_repo_lang_stats
+from gh_search.records import RepoResult, make_result
+
+
+logger = logging.getLogger(__name__)
+
+
+def _page_key(entry):
+    """
+    What identifies a distinct parse: the same content parsed the same way
+    """
+    return (
+        entry['sha256'], entry['kind'], entry.get('page_type'),
+        entry.get('gh_url'))
+
+
+def _parse_page(args):
+    archive_path, sha, kind, page_type, gh_url = args
+    content = Archive(archive_path).load(sha)
+    if kind == 'search':
+        return parse_links(content, page_type, gh_url)
+    elif kind == 'repo':
+        return parse_repo_lang_stats(content)
+    else:
+        return ENRICHERS[kind].parser(content)
+
+
+def reparse(archive_path, workers=None):
+    """
+    Parse again every page of an archive, in parallel using `workers`
+    processes (by default, one per core), and rebuild the results of the
+    crawl: the links of every archived search and, for repositories, the
+    language stats of their latest archived page (and for issues and wikis,
+    the details of their latest page, if they were enriched).
+    Every distinct page is only parsed once
+    """
+    archive = Archive(archive_path)
+    entries = [
+        entry for entry in archive.entries()
+        if entry['kind'] in ('search', 'repo') or entry['kind'] in ENRICHERS]
+    keys = list(dict.fromkeys(map(_page_key, entries)))
+    workers = workers or os.cpu_count()
+    logger.info(
+        f'parsing `{len(keys)}` distinct pages of `{len(entries)}` fetches '
+        f'with `{workers}` processes')
+
+    with ProcessPoolExecutor(workers) as pool:
+        chunksize = max(1, len(keys) // (workers * 4))
+        parsed = dict(zip(keys, pool.map(
+            _parse_page,
+            ((archive_path, *key) for key in keys),
+            chunksize=chunksize)))
+
+    repo_stats = {
+        entry['url']: parsed[_page_key(entry)]
+        for entry in entries
+        if entry['kind'] == 'repo'}
+    details = {
+        entry['url']: (ENRICHERS[entry['kind']], parsed[_page_key(entry)])
+        for entry in entries
+        if entry['kind'] in ENRICHERS}
+
+    results, seen = [], set()
+    for entry in entries:
+        if entry['kind'] != 'search':
+            continue
+        for link in parsed[_page_key(entry)]:
+            if link in seen:
+                continue
+            seen.add(link)
+            result = make_result(link, entry['page_type'])
+            if isinstance(result, RepoResult):
+                if link not in repo_stats:
+                    logger.info(f'`{link}` was never fetched, skipping it')
+                    continue
+                result.set_language_stats(repo_stats[link])
+            elif link in details:
+                enricher, page = details[link]
+                result = enricher.enrich(result, page)
+            results.append(result)
+    return results
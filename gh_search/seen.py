@@ -0,0 +1,220 @@
+"""
+Memory efficient sets of seen urls, for deduplicating very big crawls
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+
+from array import array
+
+
+MAGIC = b'GHSEEN1\n'
+INITIAL_CAPACITY = 1024
+MAX_LOAD = 0.5
+BLOOM_CAPACITY = 10_000_000
+FP_RATE = 0.001
+
+logger = logging.getLogger(__name__)
+
+
+def url_digest(url):
+    """
+    64 bit hash of a url. 0 is reserved to mark empty slots
+    """
+    digest = hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class ExactSeenSet:
+    """
+    Set of urls storing only a 64 bit digest of each one in an open addressing
+    hash table backed by an array, so each url takes between 16 and 32 bytes
+    (the table is kept between a quarter and half full) instead of a whole
+    python string.
+    It's exact as long as there are no 64 bit collisions, which with a few
+    billion urls is still very unlikely
+    """
+
+    kind = 'exact'
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        size = 1 << max(3, math.ceil(math.log2(capacity / MAX_LOAD)))
+        self.table = array('Q', bytes(8 * size))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _slot(self, digest):
+        """
+        Index of the slot holding `digest`, or of the empty slot where it
+        would go (linear probing)
+        """
+        mask = len(self.table) - 1
+        i = digest & mask
+        while (value := self.table[i]) and value != digest:
+            i = (i + 1) & mask
+        return i
+
+    def _grow(self):
+        old = self.table
+        self.table = array('Q', bytes(16 * len(old)))
+        for digest in old:
+            if digest:
+                self.table[self._slot(digest)] = digest
+
+    def __contains__(self, url):
+        return bool(self.table[self._slot(url_digest(url))])
+
+    def add(self, url):
+        """
+        Add a url and return whether it was new
+        """
+        digest = url_digest(url)
+        i = self._slot(digest)
+        if self.table[i]:
+            return False
+        self.table[i] = digest
+        self.count += 1
+        if self.count > MAX_LOAD * len(self.table):
+            self._grow()
+        return True
+
+    def memory_usage(self):
+        return self.table.itemsize * len(self.table)
+
+    def _header(self):
+        return {'kind': self.kind, 'count': self.count}
+
+    def _data(self):
+        return self.table
+
+    @classmethod
+    def _from_data(cls, header, data):
+        seen = cls.__new__(cls)
+        seen.table = array('Q')
+        seen.table.frombytes(data)
+        seen.count = header['count']
+        return seen
+
+
+class BloomSeenSet:
+    """
+    Bloom filter of urls. It uses a fixed amount of memory for the expected
+    `capacity` of urls, at the price of wrongly treating a fraction
+    `fp_rate` of new urls as already seen (but never the other way around)
+    """
+
+    kind = 'bloom'
+
+    def __init__(self, capacity=BLOOM_CAPACITY, fp_rate=FP_RATE):
+        self.n_bits = max(
+            8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.n_bits / 8))
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, url):
+        # double hashing: two 64 bit hashes are enough for all k hashes
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def __contains__(self, url):
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7))
+            for pos in self._positions(url))
+
+    def add(self, url):
+        """
+        Add a url and return whether it was (probably) new
+        """
+        new = False
+        for pos in self._positions(url):
+            byte, bit = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                new = True
+        if new:
+            self.count += 1
+            if self.count == self.capacity + 1:
+                logger.warning(
+                    'bloom filter over capacity, false positives will grow')
+        return new
+
+    def memory_usage(self):
+        return len(self.bits)
+
+    def _header(self):
+        return {
+            'kind': self.kind,
+            'count': self.count,
+            'capacity': self.capacity,
+            'fp_rate': self.fp_rate,
+            'n_bits': self.n_bits,
+            'n_hashes': self.n_hashes}
+
+    def _data(self):
+        return self.bits
+
+    @classmethod
+    def _from_data(cls, header, data):
+        seen = cls.__new__(cls)
+        seen.bits = bytearray(data)
+        for key in ('count', 'capacity', 'fp_rate', 'n_bits', 'n_hashes'):
+            setattr(seen, key, header[key])
+        return seen
+
+
+SEEN_SETS = {
+    'exact': ExactSeenSet,
+    'bloom': BloomSeenSet}
+
+
+def save_seen(seen, path):
+    """
+    Save a seen set as a magic line, a json header line and the raw table
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(json.dumps(seen._header()).encode('utf-8') + b'\n')
+        fh.write(seen._data())
+    os.replace(tmp_path, path)
+    logger.info(
+        f'saved `{len(seen)}` seen urls to `{path}` '
+        f'(`{seen.memory_usage()}` bytes)')
+
+
+def load_seen(path):
+    with open(path, 'rb') as fh:
+        if fh.readline() != MAGIC:
+            raise ValueError(f'`{path}` is not a seen urls file')
+        header = json.loads(fh.readline())
+        return SEEN_SETS[header['kind']]._from_data(header, fh.read())
+
+
+def open_seen(path=None, kind='exact', **kwargs):
+    """
+    Load the seen set in `path` if it exists, or create a new one of the given
+    `kind` (with `kwargs` as its settings)
+    """
+    if path and os.path.exists(path):
+        seen = load_seen(path)
+        if seen.kind != kind:
+            logger.warning(
+                f'`{path}` is a `{seen.kind}` seen set, not `{kind}`')
+    else:
+        seen = SEEN_SETS[kind](**kwargs)
+    logger.info(
+        f'`{len(seen)}` seen urls, using `{seen.memory_usage()}` bytes')
+    return seen
@@ -0,0 +1,179 @@
+"""
+Coordinator and workers of the multi-process sharded crawler
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import time
+
+from gh_search import metrics, parse_cache, transfer
+from gh_search.archive import set_archive
+from gh_search.fetchers import FetchError, fetch_links, fetch_lang_stats
+from gh_search.records import make_result
+from gh_search.utils import dedupe_links, set_proxy
+from gh_search.work_queue import WorkQueue
+
+
+SHARD_SIZE = 50  # repo urls per shard
+POLL_INTERVAL = 1
+
+logger = logging.getLogger(__name__)
+
+
+def coordinate(queue_dir, queries, proxies, shard_size=SHARD_SIZE):
+    """
+    Put a search shard for every `(keywords, page_type)` query in the queue.
+    The workers will then split the repo urls found by each search into
+    shards of `shard_size` urls
+    """
+    queue = WorkQueue(queue_dir)
+    queue.set_meta('proxies', proxies)
+    queue.set_meta('shard_size', shard_size)
+    for keywords, page_type in queries:
+        queue.add_shard('search', page_type, keywords)
+    logger.info(f'`{len(queries)}` searches queued in `{queue_dir}`')
+    queue.close()
+
+
+def _process_search(queue, shard, gh_url):
+    """
+    Run a search. Repo urls not seen before are queued in new shards, other
+    results are stored right away. The urls are marked as seen in the same
+    transaction, so they are never seen without being queued or stored
+    """
+    links = dedupe_links(fetch_links(shard.payload, shard.page_type, gh_url))
+    with queue.transaction():
+        links = queue.mark_seen(links)
+        if shard.page_type == 'repositories':
+            shard_size = queue.get_meta('shard_size', SHARD_SIZE)
+            for i in range(0, len(links), shard_size):
+                queue.add_shard(
+                    'repos', shard.page_type, links[i:i + shard_size])
+            queue.complete(shard.id, [])
+        else:
+            queue.complete(
+                shard.id,
+                [make_result(link, shard.page_type).to_json()
+                 for link in links])
+
+
+def _process_repos(queue, shard, gh_url):
+    """
+    Fetch the language stats of the repos of the shard. The repos that
+    can't be fetched are recorded as failures of the shard, they don't fail
+    the whole of it
+    """
+    results = [make_result(url, shard.page_type) for url in shard.payload]
+    found, failures = [], []
+    for result, stats in zip(results, fetch_lang_stats(shard.payload)):
+        if isinstance(stats, Exception):
+            logger.error(
+                f'could not retrieve data from `{result.url}`: {stats}')
+            failures.append((result.url, stats))
+        else:
+            result.set_language_stats(stats)
+            found.append(result.to_json())
+    queue.complete(shard.id, found, failures)
+
+
+SHARD_PROCESSORS = {
+    'search': _process_search,
+    'repos': _process_repos}
+
+
+def run_worker(
+        queue_dir, gh_url, proxies=None, worker=None, archive=None,
+        parse_cache_path=None):
+    """
+    Claim shards from the queue and process them until there is no work left.
+    Every worker has its own event loop and http session, and uses one of
+    its assigned `proxies` (by default, the ones given to the coordinator).
+    If an `archive` directory is given, the fetched pages are archived there,
+    and if a `parse_cache_path` is given the parse results are cached there
+    """
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    set_archive(archive)
+    parse_cache.configure(path=parse_cache_path)
+    queue = WorkQueue(queue_dir)
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+    set_proxy(proxies or queue.get_meta('proxies'))
+
+    while True:
+        if (shard := queue.claim(worker)) is None:
+            if queue.is_finished():
+                break
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        logger.info(f'worker `{worker}` processing shard `{shard.id}`')
+        try:
+            SHARD_PROCESSORS[shard.kind](queue, shard, gh_url)
+        except FetchError as e:
+            logger.error(f'shard `{shard.id}` failed, releasing it: {e}')
+            queue.release(shard.id)
+
+    queue.close()
+    metrics.log_summary()
+    for line in transfer.summary():
+        logger.info(line)
+
+
+def run_workers(
+        queue_dir, gh_url, n_workers, proxies=None, archive=None,
+        parse_cache_path=None):
+    """
+    Run `n_workers` worker processes in this machine, splitting the proxies
+    between them. Return the number of shards in every status and how many
+    workers crashed
+    """
+    if proxies is None:
+        queue = WorkQueue(queue_dir)
+        proxies = queue.get_meta('proxies')
+        queue.close()
+
+    workers = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(
+                queue_dir, gh_url,
+                proxies[i::n_workers] or [proxies[i % len(proxies)]],
+                None,
+                archive,
+                parse_cache_path))
+        for i in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    crashed = 0
+    for worker in workers:
+        worker.join()
+        if worker.exitcode:
+            logger.error(
+                f'worker `{worker.pid}` crashed, exit code: '
+                f'`{worker.exitcode}`')
+            crashed += 1
+
+    queue = WorkQueue(queue_dir)
+    counts = queue.counts()
+    failed_urls = len(list(queue.failures()))
+    queue.close()
+    logger.info(f'shards by status: {counts}')
+    if counts.get('failed'):
+        logger.error(f'`{counts["failed"]}` shards failed')
+    if failed_urls:
+        logger.error(f'`{failed_urls}` repos could not be fetched')
+    if unfinished := counts.get('pending', 0) + counts.get('claimed', 0):
+        logger.error(f'`{unfinished}` shards are not done yet')
+    return counts, crashed
+
+
+def collect(queue_dir):
+    """
+    Return all the results stored in the queue, in order
+    """
+    queue = WorkQueue(queue_dir)
+    results = list(queue.results())
+    queue.close()
+    return results
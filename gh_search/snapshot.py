@@ -0,0 +1,301 @@
+"""
+Snapshots of what a crawler node has cached (its archived pages, parse cache
+and recrawl history), to start new nodes warm instead of fetching again what
+the others already have
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import tempfile
+import time
+
+from collections import Counter
+
+from gh_search.archive import Archive
+from gh_search.enrich import ENRICHERS
+from gh_search.parse_cache import ParseCache, cache_key
+from gh_search.parse_html import (
+    PARSER_VERSION, parse_links, parse_repo_lang_stats, parse_repo_page,
+    parse_result_count)
+from gh_search.recrawl import DAY, RecrawlSchedule
+
+
+FORMAT = 'gh_search snapshot'
+VERSION = 1
+
+MANIFEST = 'manifest.json'
+INDEX = 'archive/index.jsonl.gz'
+BLOBS = 'archive/blobs/'
+PARSE_CACHE = 'parse_cache.jsonl.gz'
+RECRAWL = 'recrawl.jsonl.gz'
+
+CHUNK_SIZE = 1 << 20
+
+logger = logging.getLogger(__name__)
+
+
+def _query_param(query):
+    """
+    The `q` search parameter of a query, given as its keywords
+    """
+    return '+'.join(query.replace('+', ' ').split())
+
+
+def _select_pages(archive, since, queries):
+    """
+    Index entries to export: the ones fetched after `since` and, with
+    `queries`, only the pages of those searches and of the results they link
+    to (repos, or enriched issues and wikis), whose urls are also returned
+    """
+    entries = [
+        entry for entry in archive.entries()
+        if since is None or entry['fetched_at'] >= since]
+    if not queries:
+        return entries, None
+
+    wanted = {_query_param(query) for query in queries}
+
+    def wanted_search(entry):
+        return entry['kind'] == 'search' and \
+            entry.get('params', {}).get('q') in wanted
+
+    repos = set()
+    for entry in filter(wanted_search, entries):
+        repos.update(parse_links(
+            archive.load(entry['sha256']), entry['page_type'],
+            entry['gh_url']))
+    return [
+        entry for entry in entries
+        if wanted_search(entry)
+        or entry['kind'] != 'search' and entry['url'] in repos], repos
+
+
+def _page_cache_keys(archive, entries):
+    """
+    Parse cache keys of the results of parsing some archived pages
+    """
+    keys = set()
+    for entry in entries:
+        content = archive.load(entry['sha256'])
+        if entry['kind'] == 'search':
+            keys.add(cache_key(
+                parse_links, content, entry['page_type'], entry['gh_url']))
+            keys.add(cache_key(parse_result_count, content))
+        elif entry['kind'] == 'repo':
+            keys.add(cache_key(parse_repo_page, content))
+            keys.add(cache_key(parse_repo_lang_stats, content))
+        elif enricher := ENRICHERS.get(entry['kind']):
+            keys.add(cache_key(enricher.parser, content))
+    return keys
+
+
+def _current_version(key):
+    return key.split(':')[1] == str(PARSER_VERSION)
+
+
+def _add_jsonl(tar, name, items):
+    """
+    Add a gzipped json lines member, written to a temporary file first so
+    big caches are not held in memory. Return its sha256 and line count
+    """
+    count, digest = 0, hashlib.sha256()
+    with tempfile.TemporaryFile() as fh:
+        with gzip.GzipFile(fileobj=fh, mode='wb', mtime=0) as gz:
+            for item in items:
+                gz.write(json.dumps(item).encode('utf-8') + b'\n')
+                count += 1
+        fh.seek(0)
+        while chunk := fh.read(CHUNK_SIZE):
+            digest.update(chunk)
+        _add_file(tar, name, fh)
+    return {'sha256': digest.hexdigest(), 'entries': count}
+
+
+def _add_file(tar, name, fh):
+    info = tarfile.TarInfo(name)
+    info.size = fh.seek(0, os.SEEK_END)
+    info.mtime = int(time.time())
+    fh.seek(0)
+    tar.addfile(info, fh)
+
+
+def export_snapshot(
+        path, archive_path=None, parse_cache_path=None, recrawl_path=None,
+        max_age=None, queries=None):
+    """
+    Write a snapshot of an archive, a parse cache and a recrawl schedule
+    (the ones given) to `path`: an uncompressed tar (the archived pages are
+    already gzipped) with a gzipped json lines member for every index or
+    table, and a manifest with the format version and their sha256.
+    With `max_age` (in days), only what was fetched or parsed in that time
+    is kept. With `queries` (lists of keywords, as a string), only the pages
+    of those searches and of the repos they found, and their parse results
+    and history (this needs the archive, to know what they found).
+    Return how many of every kind of entry were exported
+    """
+    if not (archive_path or parse_cache_path or recrawl_path):
+        raise ValueError('nothing to export')
+    if queries and not archive_path:
+        raise ValueError('filtering by query needs the archive')
+    since = None if max_age is None else time.time() - max_age * DAY
+
+    members, counts = {}, Counter()
+    tmp_path = f'{path}.tmp'
+    with tarfile.open(tmp_path, 'w') as tar:
+        repos = keys = None
+        if archive_path:
+            archive = Archive(archive_path)
+            entries, repos = _select_pages(archive, since, queries)
+            members[INDEX] = _add_jsonl(tar, INDEX, entries)
+            counts['pages'] = len(entries)
+            for sha in dict.fromkeys(entry['sha256'] for entry in entries):
+                with open(archive.blob_path(sha), 'rb') as fh:
+                    _add_file(tar, f'{BLOBS}{sha}.gz', fh)
+                counts['blobs'] += 1
+            if queries:
+                keys = _page_cache_keys(archive, entries)
+
+        if parse_cache_path:
+            cache = ParseCache(max_entries=0, path=parse_cache_path)
+            members[PARSE_CACHE] = _add_jsonl(tar, PARSE_CACHE, (
+                [key, value, stored_at]
+                for key, value, stored_at in cache.items(since)
+                if _current_version(key) and (keys is None or key in keys)))
+            counts['parse results'] = members[PARSE_CACHE]['entries']
+            cache.db.close()
+
+        if recrawl_path:
+            schedule = RecrawlSchedule(recrawl_path)
+            members[RECRAWL] = _add_jsonl(tar, RECRAWL, (
+                repo for repo in schedule.history(since)
+                if repos is None or repo['url'] in repos))
+            counts['repo histories'] = members[RECRAWL]['entries']
+            schedule.close()
+
+        manifest = {
+            'format': FORMAT,
+            'version': VERSION,
+            'created_at': time.time(),
+            'parser_version': PARSER_VERSION,
+            'filters': {'max_age': max_age, 'queries': queries or []},
+            'members': members,
+            'counts': counts}
+        with tempfile.TemporaryFile() as fh:
+            fh.write(json.dumps(manifest, indent=2).encode('utf-8'))
+            _add_file(tar, MANIFEST, fh)
+    os.replace(tmp_path, path)
+    logger.info(f'snapshot written to `{path}`')
+    return counts
+
+
+def _read_manifest(tar, path):
+    try:
+        manifest = json.load(tar.extractfile(MANIFEST))
+    except (KeyError, ValueError):
+        raise ValueError(f'`{path}` is not a snapshot')
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f'`{path}` is not a snapshot')
+    if manifest['version'] != VERSION:
+        raise ValueError(
+            f'unsupported snapshot version: {manifest["version"]}')
+    return manifest
+
+
+def _check_members(tar, manifest):
+    """
+    Check that every member has the hash in the manifest, before anything is
+    imported
+    """
+    for name, member in manifest['members'].items():
+        digest = hashlib.sha256()
+        try:
+            fh = tar.extractfile(name)
+        except KeyError:
+            raise ValueError(f'`{name}` is missing from the snapshot')
+        while chunk := fh.read(CHUNK_SIZE):
+            digest.update(chunk)
+        if digest.hexdigest() != member['sha256']:
+            raise ValueError(f'`{name}` doesn\'t match its hash')
+
+
+def _read_jsonl(tar, name):
+    with gzip.open(tar.extractfile(name)) as fh:
+        for line in fh:
+            yield json.loads(line)
+
+
+def import_snapshot(
+        path, archive_path=None, parse_cache_path=None, recrawl_path=None):
+    """
+    Merge a snapshot (see `export_snapshot`) into an archive, a parse cache
+    and a recrawl schedule (the ones given, they are created if needed).
+    Every member and archived page is checked against its hash first, and
+    nothing is merged if any doesn't match. What's already there is kept:
+    pages and parse results are only added, and repo histories are only
+    replaced by ones fetched later.
+    Return how many of every kind of entry were added
+    """
+    if not (archive_path or parse_cache_path or recrawl_path):
+        raise ValueError('nothing to import into')
+
+    counts = Counter()
+    try:
+        tar = tarfile.open(path)
+    except tarfile.ReadError:
+        raise ValueError(f'`{path}` is not a snapshot')
+    with tar:
+        manifest = _read_manifest(tar, path)
+        members = manifest['members']
+        _check_members(tar, manifest)
+
+        if archive_path and INDEX in members:
+            archive = Archive(archive_path)
+            entries = list(_read_jsonl(tar, INDEX))
+            # every new blob is checked before any of them is written
+            new = {}
+            for info in tar:
+                if info.name.startswith(BLOBS):
+                    sha = info.name[len(BLOBS):].rsplit('.', 1)[0]
+                    if not archive.has_blob(sha):
+                        archive.check_blob(sha, tar.extractfile(info).read())
+                        new[sha] = info
+            missing = {
+                entry['sha256'] for entry in entries
+                if entry['sha256'] not in new
+                and not archive.has_blob(entry['sha256'])}
+            if missing:
+                raise ValueError(
+                    f'`{len(missing)}` archived pages are missing from the '
+                    'snapshot')
+            for sha, info in new.items():
+                counts['blobs'] += archive.add_blob(
+                    sha, tar.extractfile(info).read(), check=False)
+            counts['pages'] = archive.merge(entries)
+
+        if parse_cache_path and PARSE_CACHE in members:
+            if manifest['parser_version'] != PARSER_VERSION:
+                logger.warning(
+                    'the parse results in the snapshot are from parser '
+                    f'version `{manifest["parser_version"]}`, skipping them')
+            else:
+                cache = ParseCache(max_entries=0, path=parse_cache_path)
+                counts['parse results'] = cache.merge(
+                    tuple(entry) for entry in _read_jsonl(tar, PARSE_CACHE))
+                cache.db.close()
+
+        if recrawl_path and RECRAWL in members:
+            schedule = RecrawlSchedule(recrawl_path)
+            counts['repo histories'] = schedule.merge(
+                _read_jsonl(tar, RECRAWL))
+            schedule.close()
+
+    logger.info(f'snapshot `{path}` imported')
+    return counts
+
+
+def summary(counts):
+    return [f'{name:16} {count:>9}' for name, count in counts.items()]
@@ -0,0 +1,213 @@
+"""
+Compression of the responses and accounting of the bytes transferred, for
+every proxy
+"""
+
+import logging
+import threading
+import zlib
+
+from collections import defaultdict
+
+from gh_search import metrics
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+def _brotli_bounded():
+    """
+    Whether the brotli decoder can cap its output (brotli >= 1.2), which the
+    decoders need not to blow up on a brotli bomb
+    """
+    try:
+        brotli.Decompressor().process(b'', output_buffer_limit=1)
+    except (AttributeError, TypeError):
+        return False
+    return True
+
+
+if brotli and not _brotli_bounded():
+    brotli = None
+
+ACCEPT_ENCODING = 'gzip, deflate, br' if brotli else 'gzip, deflate'
+
+logger = logging.getLogger(__name__)
+
+
+class UnsupportedEncoding(Exception):
+    pass
+
+
+class _IdentityDecoder:
+
+    def decompress(self, data, max_length=0):
+        return data
+
+    def flush(self):
+        return b''
+
+
+class _DeflateDecoder:
+    """
+    `deflate` is supposed to be zlib wrapped, but some servers send raw
+    deflate data. Which one it is can be told from the first chunk
+    """
+
+    def __init__(self):
+        self.decoder = None
+
+    def decompress(self, data, max_length=0):
+        if self.decoder is None:
+            self.decoder = zlib.decompressobj()
+            try:
+                return self.decoder.decompress(data, max_length)
+            except zlib.error:
+                self.decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.decoder.decompress(data, max_length)
+
+    def flush(self):
+        return self.decoder.flush() if self.decoder else b''
+
+
+class _BrotliDecoder:
+
+    def __init__(self):
+        self.decoder = brotli.Decompressor()
+
+    def decompress(self, data, max_length=0):
+        if max_length:
+            return self.decoder.process(data, output_buffer_limit=max_length)
+        return self.decoder.process(data)
+
+    def flush(self):
+        return b''
+
+
+def decoder(encoding):
+    """
+    Streaming decoder for a `Content-Encoding`: call `decompress` with every
+    chunk as it arrives and `flush` at the end. `decompress` gives at most
+    `max_length` bytes (if it's not 0) and drops the rest of the chunk, so
+    it's only for telling that a body is too big without decompressing it
+    all
+    """
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return _IdentityDecoder()
+    elif encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        return _DeflateDecoder()
+    elif encoding == 'br' and brotli:
+        return _BrotliDecoder()
+    else:
+        raise UnsupportedEncoding(f'unsupported content encoding `{encoding}`')
+
+
+class _Stats:
+
+    __slots__ = ('requests', 'wire_bytes', 'body_bytes', 'unmeasured_bytes')
+
+    def __init__(self):
+        self.requests = 0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self.unmeasured_bytes = 0  # body bytes of unknown transferred size
+
+
+_stats = defaultdict(_Stats)
+_lock = threading.Lock()
+
+
+def record(url, proxy, wire_bytes, body_bytes, kind=None):
+    """
+    Account a response: `wire_bytes` is what was transferred (compressed) and
+    `body_bytes` the size of the decompressed body. `wire_bytes` is None if
+    it's unknown, because the response was decompressed by the http client
+    (an aiohttp session not made by `gh_search.fetchers.make_session`), and
+    then only the body is counted. If the `kind` of page (`search` or
+    `repo`) is given, its pages and bytes are counted on their own too (see
+    `gh_search.estimate`)
+    """
+    metrics.incr('transfer.body_bytes', body_bytes)
+    if wire_bytes is None:
+        logger.info(
+            f'`{url}`: `{body_bytes}` bytes, decompressed by the session')
+        metrics.incr('transfer.unmeasured_bytes', body_bytes)
+    else:
+        logger.info(
+            f'`{url}`: `{wire_bytes}` bytes transferred, `{body_bytes}` '
+            'bytes decompressed')
+        metrics.incr('transfer.wire_bytes', wire_bytes)
+        if kind:
+            metrics.incr(f'transfer.{kind}.pages')
+            metrics.incr(f'transfer.{kind}.wire_bytes', wire_bytes)
+    with _lock:
+        stats = _stats[proxy]
+        stats.requests += 1
+        stats.body_bytes += body_bytes
+        if wire_bytes is None:
+            stats.unmeasured_bytes += body_bytes
+        else:
+            stats.wire_bytes += wire_bytes
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def snapshot():
+    """
+    `{proxy: (requests, wire_bytes, body_bytes)}`
+    """
+    with _lock:
+        return {
+            proxy: (stats.requests, stats.wire_bytes, stats.body_bytes)
+            for proxy, stats in _stats.items()}
+
+
+def _saved(wire_bytes, body_bytes):
+    return 1 - wire_bytes / body_bytes if body_bytes else 0
+
+
+def summary():
+    """
+    Lines of a table with the bytes transferred through every proxy and in
+    total, and how much was saved by compression. The bodies whose
+    transferred size is unknown are left out of what was saved
+    """
+    with _lock:
+        rows = sorted(
+            (
+                (proxy, stats.requests, stats.wire_bytes, stats.body_bytes,
+                 stats.unmeasured_bytes)
+                for proxy, stats in _stats.items()),
+            key=lambda x: str(x[0]))
+    if not rows:
+        return []
+    lines = [f'{"proxy":24} {"requests":>9} {"transferred":>12} '
+             f'{"decompressed":>13} {"saved":>6}']
+    total = [0, 0, 0, 0]
+    for proxy, *row in rows:
+        requests, wire_bytes, body_bytes, unmeasured = row
+        lines.append(
+            f'{str(proxy or "direct"):24} {requests:9} {wire_bytes:12} '
+            f'{body_bytes:13} '
+            f'{_saved(wire_bytes, body_bytes - unmeasured):6.1%}')
+        total = [a + b for a, b in zip(total, row)]
+    requests, wire_bytes, body_bytes, unmeasured = total
+    lines.append(
+        f'{"total":24} {requests:9} {wire_bytes:12} {body_bytes:13} '
+        f'{_saved(wire_bytes, body_bytes - unmeasured):6.1%}')
+    if unmeasured:
+        lines.append(
+            f'`{unmeasured}` bytes were decompressed by the http session, '
+            'what was transferred for them is unknown and left out')
+    return lines
@@ -3,6 +3,9 @@ Misc helpers
 """
 
 
+import asyncio
+import contextlib
+import functools
 import json
 import logging
 import os
@@ -10,7 +13,16 @@ import random
 import re
 import sys
 
-from gh_search.fetchers import fetch_links, fetch_lang_stats
+from gh_search import deadline
+from gh_search.deadline import DeadlineExceeded
+from gh_search.fetchers import (
+    fetch_links, iter_pages_async, make_session, warm_up)
+from gh_search.output import OutputWriter
+from gh_search.parse_cache import parse
+from gh_search.parse_html import parse_repo_page
+from gh_search.planner import fetch_links_planned
+from gh_search.proxies import set_proxies
+from gh_search.records import make_result, parse_link
 
 
 logger = logging.getLogger(__name__)
@@ -20,13 +32,49 @@ def get_owner(link):
     """
     Get the owner of a given github repo link
     """
-    pattern = r'^(http(s)?://)?(www\.)?github\.com/+([^\/]+)/+.+$'
-    return re.search(pattern, link).group(4)
+    owner, _ = parse_link(link)
+    return owner
+
+
+def dedupe_links(links, seen=None):
+    """
+    Remove repeated links, keeping the order of their first appearance.
+    If a `seen` set (see `gh_search.seen`) is given, links already in it are
+    removed too. The new ones are not added to it, that's up to the caller
+    once it's done with them
+    """
+    links = dict.fromkeys(links)
+    if seen is None:
+        return list(links)
+    else:
+        return [link for link in links if link not in seen]
+
+
+def filter_results(results, owners=None, pattern=None):
+    """
+    Keep only the results owned by one of the given `owners` (github logins
+    are case insensitive) and whose url matches the given regex `pattern`
+    (a string or a compiled one). Both filters are optional
+    """
+    if owners:
+        owners = {owner.lower() for owner in owners}
+        results = [
+            result for result in results
+            if result.owner and result.owner.lower() in owners]
+    if pattern:
+        pattern = re.compile(pattern)
+        results = [result for result in results if pattern.search(result.url)]
+    return results
 
 
 def set_proxy(proxies, verbose=False):
+    """
+    Spread the requests between all the `proxies` (see `gh_search.proxies`).
+    One of them is also set as the proxy in the environment
+    """
     proxy = random.choice(proxies)
     os.environ['HTTP_PROXY'] = proxy
+    set_proxies(proxies)
     logging.getLogger(__name__).info(f'proxy set to `{proxy}`')
 
 
@@ -58,27 +106,191 @@ def read_input(infile):
     return keywords, proxies, page_type
 
 
-def write_output(result, outfile=None):
-    if outfile:
-        logger.info(f'writing to file: `{outfile}`')
-        with open(outfile, 'w') as fh:
-            json.dump(result, fh, indent=2)
-    else:
-        logger.info('writing to standard output')
-        sys.stdout.write(json.dumps(result, indent=2))
+def write_output(result, outfile=None, pretty=True):
+    """
+    Write the results as JSON (see `gh_search.output.OutputWriter`). Result
+    records are only converted to JSON objects here, a batch at a time while
+    writing them
+    """
+    with OutputWriter(outfile, pretty) as writer:
+        for record in result:
+            writer.write(record)
+
+
+async def gh_search_iter(
+        keywords, page_type, gh_url, session=None, inflight=None, split=False,
+        limit=None, owners=None, pattern=None, seen=None, schedule=None,
+        enricher=None, warm=None):
+    """
+    Search github and yield result records (see `gh_search.records`) with the
+    found links and, for repository searches, the language stats of each
+    repo, in search order as soon as each one is done. This is meant to be
+    used from code that is already running an event loop, e.g.:
 
+        async for result in gh_search_iter(keywords, 'repositories', gh_url):
+            ...
 
-def gh_search(keywords, page_type, gh_url):
-    links = fetch_links(keywords, page_type, gh_url)
+    The repo pages are fetched with the given aiohttp `session` (made with
+    `gh_search.fetchers.make_session`, or any other), so several searches
+    can share its connection pool. Without one, a session is made just for
+    this search.
+    The search pages are fetched in a thread, so they don't block the loop.
+    Meanwhile, if `warm` is given, that many connections are opened through
+    every proxy (see `gh_search.fetchers.warm_up`), so the repo pages start
+    being fetched on open connections.
+    Stopping the iteration (or cancelling the task iterating) cancels the
+    fetches that are still pending.
+    Pass the same `inflight` dict to concurrent calls (e.g. in a batch run)
+    so repos found by several searches at the same time are only fetched and
+    parsed once.
+    If `split` is set, the search is split in sub-queries to get all the
+    results instead of only the first page.
+    The results are filtered by `owners` and `pattern` (see `filter_results`)
+    before fetching anything, and if a `limit` is given only the first
+    `limit` results (in search order) are yielded.
+    If a `seen` set is given, links in it are skipped (see `dedupe_links`),
+    and the links of the results are added to it as they are yielded, so
+    the ones filtered out, left out by the `limit` or the deadline, or that
+    could not be fetched are still new for the next run.
+    If a recrawl `schedule` is given (see `gh_search.recrawl`), only the repos
+    it selects are fetched, the rest get the language stats it has stored.
+    For issue and wiki searches, the page of every result is only fetched if
+    an `enricher` is given (see `gh_search.enrich`), which adds the details
+    parsed from it to the result.
+    If the crawl deadline is reached (see `gh_search.deadline`), the
+    iteration stops early and `gh_search.deadline.expired()` is set.
+    Raise FetchError (see `gh_search.fetchers`) if the search itself can't
+    be fetched. Results whose page can't be fetched are left out.
+    """
     if page_type == "repositories":
-        return [
-            {
-                'url': link,
-                'extra': {
-                    'owner': get_owner(link),
-                    'language_stats': stats
-                }
-            }
-            for link, stats in zip(links, fetch_lang_stats(links))]
+        parser, kind = parse_repo_page, 'repo'
+    elif enricher is not None:
+        parser, kind = enricher.parser, enricher.name
     else:
-        return [{'url': link} for link in links]
+        parser = kind = None
+
+    async with contextlib.AsyncExitStack() as stack:
+        if parser is not None and session is None:
+            session = await stack.enter_async_context(make_session())
+        if parser is not None and warm:
+            warming = asyncio.ensure_future(warm_up(session, gh_url, warm))
+            stack.push_async_callback(_cancel, warming)
+
+        fetch = fetch_links_planned if split else fetch_links
+        try:
+            links = await asyncio.get_event_loop().run_in_executor(
+                None, fetch, keywords, page_type, gh_url)
+        except DeadlineExceeded:
+            links = []
+        links = dedupe_links(links, seen)
+        results = [make_result(link, page_type) for link in links]
+        results = filter_results(results, owners, pattern)
+
+        def mark_seen(result):
+            if seen is not None:
+                seen.add(result.url)
+            return result
+
+        if parser is None:
+            for result in results[:limit]:
+                yield mark_seen(result)
+            return
+
+        if schedule is not None:
+            selected = set(
+                schedule.select([result.url for result in results]))
+        else:
+            selected = {result.url for result in results}
+
+        # the pages are yielded in the same order as `results`
+        pages = iter_pages_async(
+            [result.url for result in results if result.url in selected],
+            session, inflight,
+            parser=functools.partial(parse, parser),
+            limit=limit,
+            kind=kind)
+        try:
+            found = 0
+            for result in results:
+                if limit is not None and found >= limit:
+                    break
+                if result.url not in selected:
+                    result.set_language_stats(schedule.languages(result.url))
+                    found += 1
+                    yield mark_seen(result)
+                    continue
+                try:
+                    _, page = await pages.__anext__()
+                except StopAsyncIteration:
+                    break
+                if isinstance(page, DeadlineExceeded):
+                    continue
+                elif isinstance(page, Exception):
+                    logger.error(
+                        f'could not retrieve data from `{result.url}`: '
+                        f'{page}')
+                else:
+                    if page_type != "repositories":
+                        result = enricher.enrich(result, page)
+                    else:
+                        if schedule is not None:
+                            schedule.observe(
+                                result.url, page['languages'],
+                                page['archived'])
+                        result.set_language_stats(page['languages'])
+                    found += 1
+                    yield mark_seen(result)
+        finally:
+            # make sure the pending fetches are cancelled right away
+            await pages.aclose()
+
+
+async def _cancel(task):
+    """
+    Cancel a task that may still be running and wait for it
+    """
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+class SearchResults(list):
+    """
+    The result records of `gh_search`. `incomplete` is set if the crawl
+    deadline was reached before the search was done, so some are missing
+    """
+
+    incomplete = False
+
+
+def gh_search(
+        keywords, page_type, gh_url, inflight=None, split=False, limit=None,
+        owners=None, pattern=None, on_result=None, seen=None, session=None,
+        schedule=None, enricher=None, keep=True, warm=None):
+    """
+    Run `gh_search_iter` in the current event loop and return a list with all
+    the result records (a SearchResults).
+    If `on_result` is given, it's called with every record as soon as it's
+    done, in search order (e.g. to write results while crawling), and
+    awaited if it's a coroutine function. If that's all that's needed, pass
+    `keep=False` so the records are not kept in memory (an empty list is
+    returned then).
+    If the crawl deadline is reached, the results found so far are returned,
+    flagged as `incomplete` (see SearchResults).
+    """
+    is_async = asyncio.iscoroutinefunction(on_result)
+
+    async def collect():
+        found = SearchResults()
+        async for result in gh_search_iter(
+                keywords, page_type, gh_url, session, inflight, split, limit,
+                owners, pattern, seen, schedule, enricher, warm):
+            if keep:
+                found.append(result)
+            if is_async:
+                await on_result(result)
+            elif on_result:
+                on_result(result)
+        found.incomplete = deadline.expired()
+        return found
+
+    return asyncio.get_event_loop().run_until_complete(collect())
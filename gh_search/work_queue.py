@@ -0,0 +1,232 @@
+"""
+Durable local work queue for the sharded crawler, backed by SQLite
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import time
+
+
+QUEUE_FILE = 'queue.sqlite3'
+LEASE_TIME = 600  # seconds before a claimed shard can be claimed again
+MAX_SHARD_TRIES = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    page_type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    claimed_at REAL,
+    tries INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS shards_status ON shards (status, id);
+CREATE TABLE IF NOT EXISTS seen_urls (
+    url TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS results (
+    shard_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (shard_id, position)
+);
+CREATE TABLE IF NOT EXISTS failed_urls (
+    url TEXT PRIMARY KEY,
+    shard_id INTEGER NOT NULL,
+    error TEXT NOT NULL
+);
+"""
+
+
+class Shard:
+
+    __slots__ = ('id', 'kind', 'page_type', 'payload')
+
+    def __init__(self, id, kind, page_type, payload):
+        self.id = id
+        self.kind = kind
+        self.page_type = page_type
+        self.payload = payload
+
+
+class WorkQueue:
+    """
+    Queue of shards of work living in a directory, so it survives crashes and
+    can be shared between processes (and between machines, if the directory
+    is on a file system where SQLite locking works).
+    Shards are claimed with a lease: if a worker dies without finishing a
+    shard, it can be claimed again by another one once the lease expires.
+    It uses the default rollback journal, as SQLite's WAL mode needs memory
+    shared between all the processes, so it only works within one machine
+    """
+
+    def __init__(self, path, lease_time=LEASE_TIME):
+        os.makedirs(path, exist_ok=True)
+        self.lease_time = lease_time
+        self.db = sqlite3.connect(
+            os.path.join(path, QUEUE_FILE), timeout=60, isolation_level=None)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Run everything done with the queue inside the block atomically.
+        Blocks can be nested, the inner ones are part of the outermost one
+        """
+        if self.db.in_transaction:
+            yield
+            return
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        else:
+            self.db.execute('COMMIT')
+
+    def set_meta(self, key, value):
+        self.db.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            (key, json.dumps(value)))
+
+    def get_meta(self, key, default=None):
+        row = self.db.execute(
+            'SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def add_shard(self, kind, page_type, payload):
+        cursor = self.db.execute(
+            'INSERT INTO shards (kind, page_type, payload) VALUES (?, ?, ?)',
+            (kind, page_type, json.dumps(payload)))
+        return cursor.lastrowid
+
+    def mark_seen(self, urls):
+        """
+        Remember the given urls and return the ones that had not been seen
+        before, in the same order
+        """
+        new = []
+        with self.transaction():
+            for url in urls:
+                cursor = self.db.execute(
+                    'INSERT OR IGNORE INTO seen_urls (url) VALUES (?)', (url,))
+                if cursor.rowcount:
+                    new.append(url)
+        return new
+
+    def claim(self, worker, max_tries=MAX_SHARD_TRIES):
+        """
+        Claim the oldest pending shard (or one whose lease has expired).
+        Shards whose lease expired after `max_tries` are marked as failed
+        instead, as they may be what keeps killing their workers.
+        Return None if there is nothing to claim right now
+        """
+        now = time.time()
+        with self.transaction():
+            self.db.execute(
+                """
+                UPDATE shards
+                SET status = 'failed', worker = NULL, claimed_at = NULL
+                WHERE status = 'claimed' AND claimed_at < ? AND tries >= ?
+                """,
+                (now - self.lease_time, max_tries))
+            row = self.db.execute(
+                """
+                SELECT id, kind, page_type, payload FROM shards
+                WHERE status = 'pending'
+                   OR (status = 'claimed' AND claimed_at < ?)
+                ORDER BY id LIMIT 1
+                """,
+                (now - self.lease_time,)).fetchone()
+            if row:
+                self.db.execute(
+                    """
+                    UPDATE shards
+                    SET status = 'claimed', worker = ?, claimed_at = ?,
+                        tries = tries + 1
+                    WHERE id = ?
+                    """,
+                    (worker, now, row[0]))
+
+        if row:
+            shard_id, kind, page_type, payload = row
+            return Shard(shard_id, kind, page_type, json.loads(payload))
+        else:
+            return None
+
+    def complete(self, shard_id, results, failures=()):
+        """
+        Store the results of a shard and mark it as done, atomically.
+        `failures` are the `(url, error)` of the urls of the shard that
+        could not be processed, they are kept apart (see `failures`)
+        """
+        with self.transaction():
+            self.db.executemany(
+                """
+                INSERT OR REPLACE INTO results (shard_id, position, payload)
+                VALUES (?, ?, ?)
+                """,
+                (
+                    (shard_id, i, json.dumps(result))
+                    for i, result in enumerate(results)))
+            self.db.executemany(
+                """
+                INSERT OR REPLACE INTO failed_urls (url, shard_id, error)
+                VALUES (?, ?, ?)
+                """,
+                ((url, shard_id, str(error)) for url, error in failures))
+            self.db.execute(
+                "UPDATE shards SET status = 'done' WHERE id = ?", (shard_id,))
+
+    def release(self, shard_id, max_tries=MAX_SHARD_TRIES):
+        """
+        Give a shard back after failing to process it, so it can be tried
+        again. After `max_tries` it's marked as failed
+        """
+        self.db.execute(
+            """
+            UPDATE shards
+            SET status = CASE WHEN tries >= ? THEN 'failed' ELSE 'pending' END,
+                worker = NULL, claimed_at = NULL
+            WHERE id = ?
+            """,
+            (max_tries, shard_id))
+
+    def counts(self):
+        """
+        Number of shards in every status
+        """
+        return dict(self.db.execute(
+            'SELECT status, count(*) FROM shards GROUP BY status'))
+
+    def is_finished(self):
+        counts = self.counts()
+        return not counts.get('pending') and not counts.get('claimed')
+
+    def results(self):
+        """
+        Iterate over the stored results, in shard order
+        """
+        for (payload,) in self.db.execute(
+                'SELECT payload FROM results ORDER BY shard_id, position'):
+            yield json.loads(payload)
+
+    def failures(self):
+        """
+        Iterate over the `(url, error)` of the urls that failed, in shard
+        order
+        """
+        yield from self.db.execute(
+            'SELECT url, error FROM failed_urls ORDER BY shard_id, rowid')
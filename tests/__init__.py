@@ -1,3 +1,23 @@
 from tests.parse_html import TestParseHTML  # noqa
 from tests.fetchers import TestFetchers  # noqa
 from tests.utils import TestUtils, TestReadInput, TestGHSearch  # noqa
+from tests.planner import TestPlanner  # noqa
+from tests.records import TestRecords  # noqa
+from tests.export import TestExport  # noqa
+from tests.work_queue import TestWorkQueue  # noqa
+from tests.sharded import TestSharded  # noqa
+from tests.archive import TestArchive  # noqa
+from tests.reparse import TestReparse  # noqa
+from tests.metrics import TestMetrics  # noqa
+from tests.parse_cache import TestParseCache  # noqa
+from tests.seen import TestSeen  # noqa
+from tests.deadline import TestDeadline  # noqa
+from tests.proxies import TestProxies  # noqa
+from tests.transfer import TestTransfer  # noqa
+from tests.faults import TestFaults  # noqa
+from tests.estimate import TestEstimate  # noqa
+from tests.recrawl import TestRecrawl  # noqa
+from tests.snapshot import TestSnapshot  # noqa
+from tests.enrich import TestEnrich  # noqa
+from tests.aggregate import TestAggregate  # noqa
+from tests.output import TestOutput  # noqa
@@ -0,0 +1,77 @@
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import unittest
+
+from gh_search.aggregate import Aggregator
+from gh_search.records import RepoResult
+
+
+RESULTS = [
+    RepoResult('https://github.com/foo/bar', {'Rust': 90.0, 'C': 10.0}),
+    RepoResult('https://github.com/foo/qux', {'C': 100.0}),
+    RepoResult('https://github.com/foo/empty'),
+    RepoResult('https://github.com/baz/bar', {'Go': 60.0, 'C': 40.0}),
+    RepoResult('https://github.com/nostats/bar'),
+]
+
+
+class TestAggregate(unittest.TestCase):
+
+    def setUp(self):
+        self.aggregator = Aggregator()
+        for result in RESULTS:
+            self.aggregator.add(result)
+
+    def test_owner_rows(self):
+        self.assertEqual(list(self.aggregator.owner_rows()), [
+            ('baz', 1, 'Go', 60.0),
+            ('baz', 1, 'C', 40.0),
+            ('foo', 3, 'C', 55.0),
+            ('foo', 3, 'Rust', 45.0),
+            ('nostats', 1, '', '')])
+
+    def test_language_rows(self):
+        self.assertEqual(list(self.aggregator.language_rows()), [
+            ('C', 3, 1, 50.0),
+            ('Rust', 1, 1, 30.0),
+            ('Go', 1, 1, 20.0)])
+        self.assertEqual(self.aggregator.repos, 5)
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.aggregator.write(tmpdir)
+            with open(os.path.join(tmpdir, 'owners.tsv')) as fh:
+                rows = list(csv.reader(fh, delimiter='\t'))
+            self.assertEqual(rows[0], ['owner', 'repos', 'language', 'share'])
+            self.assertEqual(rows[1], ['baz', '1', 'Go', '60.0'])
+            with open(os.path.join(tmpdir, 'languages.tsv')) as fh:
+                rows = list(csv.reader(fh, delimiter='\t'))
+            self.assertEqual(rows[1], ['C', '3', '1', '50.0'])
+
+    def test_memory(self):
+        # the same owners and languages over and over take no more memory
+        aggregator = Aggregator()
+        tracemalloc.start()
+        try:
+            for result in RESULTS * 100:
+                aggregator.add(result)
+            before = tracemalloc.get_traced_memory()[0]
+            for result in RESULTS * 10000:
+                aggregator.add(result)
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(after - before, 10000)
+
+    def test_aggregate_only_cli(self):
+        # without `--aggregate` nothing would be written at all
+        process = subprocess.run(
+            [sys.executable, 'gh_search.py', 'in.json', '--aggregate-only'],
+            capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(process.returncode, 1)
+        self.assertIn('--aggregate-only needs --aggregate', process.stderr)
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from gh_search.archive import Archive, set_archive, archive_page
+from gh_search.fetchers import fetch_links
+from gh_search.proxies import set_proxies
+from tests.mocks import MockResponse
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.environ['HTTP_PROXY'] = 'proxy.mock'
+        set_proxies(None)
+
+    def tearDown(self):
+        set_archive(None)
+        self.tmpdir.cleanup()
+
+    def test_store(self):
+        archive = Archive(self.tmpdir.name)
+        sha = archive.store('https://github.com/foo/bar', 'repo', 'foo')
+        self.assertEqual(
+            sha,
+            '2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae')
+        self.assertTrue(os.path.exists(archive.blob_path(sha)))
+        self.assertEqual(archive.load(sha), 'foo')
+
+    def test_store_dedupe(self):
+        archive = Archive(self.tmpdir.name)
+        first = archive.store('https://github.com/foo/bar', 'repo', 'foo')
+        second = archive.store('https://github.com/foo/qux', 'repo', 'foo')
+        self.assertEqual(first, second)
+        blobs = [
+            name
+            for _, _, names in os.walk(self.tmpdir.name)
+            for name in names if name.endswith('.gz')]
+        self.assertEqual(len(blobs), 1)
+        entries = list(archive.entries())
+        self.assertEqual(
+            [entry['url'] for entry in entries],
+            ['https://github.com/foo/bar', 'https://github.com/foo/qux'])
+
+    def test_find(self):
+        archive = Archive(self.tmpdir.name)
+        archive.store('https://github.com/search', 'search', 'foo', page=1)
+        archive.store('https://github.com/search', 'search', 'bar', page=2)
+        archive.store('https://github.com/search', 'search', 'qux', page=1)
+        self.assertEqual(
+            archive.find('https://github.com/search', 'search', page=1), 'qux')
+        self.assertEqual(
+            archive.find('https://github.com/search', 'search', page=2), 'bar')
+        self.assertIsNone(
+            archive.find('https://github.com/search', 'search', page=3))
+        self.assertIsNone(
+            archive.find('https://github.com/search', 'repo', page=1))
+
+    def test_entries_empty(self):
+        self.assertEqual(list(Archive(self.tmpdir.name).entries()), [])
+
+    def test_archive_page(self):
+        archive_page('https://github.com/foo/bar', 'repo', 'foo')
+        set_archive(self.tmpdir.name)
+        archive_page('https://github.com/foo/bar', 'repo', 'bar', extra=1)
+        archive = Archive(self.tmpdir.name)
+        [entry] = archive.entries()
+        self.assertEqual(entry['extra'], 1)
+        self.assertEqual(archive.load(entry['sha256']), 'bar')
+
+    @patch('requests.get')
+    def test_fetch_archived(self, get):
+        get.return_value = MockResponse('<div class="codesearch-results">')
+        set_archive(self.tmpdir.name)
+        fetch_links(['foo'], 'issues', 'https://github.com')
+        [entry] = Archive(self.tmpdir.name).entries()
+        self.assertEqual(entry['kind'], 'search')
+        self.assertEqual(entry['page_type'], 'issues')
+        self.assertEqual(entry['gh_url'], 'https://github.com')
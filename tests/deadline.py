@@ -0,0 +1,39 @@
+import logging
+import time
+import unittest
+
+from gh_search import deadline
+
+
+class TestDeadline(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        deadline.set_deadline(None)
+
+    def test_no_deadline(self):
+        deadline.set_deadline(None)
+        self.assertIsNone(deadline.time_left())
+        self.assertEqual(deadline.clamp(30), 30)
+        deadline.check()
+        self.assertFalse(deadline.expired())
+
+    def test_clamp(self):
+        deadline.set_deadline(10)
+        self.assertEqual(deadline.clamp(1), 1)
+        self.assertLessEqual(deadline.clamp(30), 10)
+        deadline.check()
+        self.assertFalse(deadline.expired())
+
+    def test_expired(self):
+        deadline.set_deadline(0.01)
+        time.sleep(0.02)
+        self.assertEqual(deadline.time_left(), 0)
+        with self.assertRaises(deadline.DeadlineExceeded):
+            deadline.check()
+        self.assertTrue(deadline.expired())
+        # a new deadline starts a new crawl
+        deadline.set_deadline(10)
+        self.assertFalse(deadline.expired())
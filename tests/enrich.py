@@ -0,0 +1,41 @@
+import unittest
+
+from gh_search.enrich import ENRICHERS, get_enricher, output_schema
+from gh_search.records import DetailResult, Result
+
+
+class TestEnrich(unittest.TestCase):
+
+    def test_get_enricher(self):
+        self.assertIsNone(get_enricher(None, 'issues'))
+        self.assertIs(get_enricher('wiki', 'wikis'), ENRICHERS['wiki'])
+        with self.assertRaisesRegex(ValueError, 'unknown'):
+            get_enricher('foo', 'issues')
+        with self.assertRaisesRegex(ValueError, 'for issues searches'):
+            get_enricher('issue', 'repositories')
+
+    def test_enrich(self):
+        result = ENRICHERS['wiki'].enrich(
+            Result('https://github.com/foo/bar/wiki/Home'),
+            {'title': 'Home', 'revisions': 3})
+        self.assertEqual(result.to_json(), {
+            'url': 'https://github.com/foo/bar/wiki/Home',
+            'extra': {'owner': 'foo', 'title': 'Home', 'revisions': 3}})
+        # the page could not be parsed
+        self.assertEqual(
+            DetailResult('https://github.com/foo/bar/wiki/Home').to_json(),
+            {'url': 'https://github.com/foo/bar/wiki/Home'})
+
+    def test_output_schema(self):
+        def extra(schema):
+            return schema['items']['properties'].get('extra')
+
+        self.assertIsNone(extra(output_schema('issues')))
+        self.assertEqual(
+            set(extra(output_schema('repositories'))['properties']),
+            {'owner', 'language_stats'})
+        for enricher in ENRICHERS.values():
+            schema = output_schema(enricher.page_type, enricher)
+            self.assertEqual(
+                set(extra(schema)['properties']),
+                {'owner', *enricher.fields})
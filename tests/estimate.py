@@ -0,0 +1,118 @@
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from gh_search import estimate
+from gh_search.archive import set_archive, archive_page
+
+
+SEARCH_PAGE = """
+    <div class="codesearch-results">
+      <div>
+        <div><h3>4,423 repository results</h3></div>
+        <ul class="repo-list">
+          <li class="repo-list-item hx_hit-repo">
+            <div class="f4"><a href="/foo/bar">foo</a></div>
+          </li>
+          <li class="repo-list-item hx_hit-repo">
+            <div class="f4"><a href="/foo/qux">foo</a></div>
+          </li>
+        </ul>
+      <div>
+    </div>
+"""
+
+PREVIOUS = {
+    'fetch.search.requests': 4,
+    'fetch.search.seconds': 8,
+    'transfer.search.pages': 2,
+    'transfer.search.wire_bytes': 20000,
+    'fetch.repo.requests': 110,
+    'fetch.repo.seconds': 11,
+    'transfer.repo.pages': 100,
+    'transfer.repo.wire_bytes': 1000000,
+}
+
+
+class TestEstimate(unittest.TestCase):
+
+    def tearDown(self):
+        set_archive(None)
+
+    def test_observed(self):
+        self.assertEqual(
+            estimate.observed({}, 'repo'),
+            (estimate.DEFAULT_LATENCY['repo'],
+             estimate.DEFAULT_PAGE_BYTES['repo'], 1))
+        self.assertEqual(
+            estimate.observed(PREVIOUS, 'search'), (2, 10000, 2))
+        self.assertEqual(
+            estimate.observed(PREVIOUS, 'repo'), (0.1, 10000, 1.1))
+
+    def test_search_pages(self):
+        self.assertEqual(estimate.search_pages(4423, False), 1)
+        self.assertEqual(estimate.search_pages(0, True), 1)
+        self.assertEqual(estimate.search_pages(500, True), 50)
+        # 5 slices take 9 probes, plus the other 438 pages
+        self.assertEqual(estimate.search_pages(4423, True), 9 + 443 - 5)
+
+    def test_phase_time(self):
+        self.assertEqual(estimate.phase_time(0, 1, 1, 1, 1), 0)
+        self.assertEqual(estimate.phase_time(1, 2, 1, 0.1, 1), 2)
+        # limited by concurrency: 10 per second
+        self.assertAlmostEqual(
+            estimate.phase_time(101, 0.1, 1, 100, 1), 10.1)
+        # limited by the rate limit: 2 proxies at 1 per second
+        self.assertAlmostEqual(
+            estimate.phase_time(101, 0.1, 10, 1, 2), 50.1)
+
+    @patch('gh_search.fetchers.fetch_search_page')
+    def test_estimate(self, fetch_search_page):
+        fetch_search_page.return_value = SEARCH_PAGE
+        plan = estimate.estimate(
+            ['foo'], 'repositories', 'https://github.com', 1)
+        fetch_search_page.assert_called_once_with(
+            ['foo'], 'repositories', 'https://github.com')
+        self.assertEqual(plan['results'], 2)
+        self.assertEqual(plan['search_requests'], 1)
+        self.assertEqual(plan['repo_requests'], 2)
+        self.assertEqual(plan['bytes'], 30000 + 2 * 40000)
+        self.assertFalse(plan['archived'])
+        self.assertFalse(plan['observed'])
+
+    @patch('gh_search.fetchers.fetch_search_page')
+    def test_estimate_split(self, fetch_search_page):
+        fetch_search_page.return_value = SEARCH_PAGE
+        plan = estimate.estimate(
+            ['foo'], 'repositories', 'https://github.com', 2, split=True,
+            limit=1000, previous=PREVIOUS)
+        self.assertEqual(plan['results'], 1000)
+        self.assertEqual(plan['search_requests'], 2 * (9 + 443 - 5))
+        self.assertEqual(plan['repo_requests'], 1100)
+        self.assertEqual(plan['bytes'], (9 + 443 - 5 + 1000) * 10000)
+        self.assertTrue(plan['observed'])
+        self.assertEqual(len(estimate.summary(plan)), 7)
+
+    @patch('gh_search.fetchers.fetch_search_page')
+    def test_estimate_issues(self, fetch_search_page):
+        fetch_search_page.return_value = SEARCH_PAGE
+        plan = estimate.estimate(['foo'], 'issues', 'https://github.com', 1)
+        self.assertEqual(plan['repo_requests'], 0)
+
+    @patch('gh_search.fetchers.fetch_search_page')
+    def test_estimate_archived(self, fetch_search_page):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            set_archive(tmpdir)
+            archive_page(
+                'https://github.com/search', 'search', SEARCH_PAGE,
+                params={'q': 'foo+bar', 'type': 'repositories'},
+                page_type='repositories', gh_url='https://github.com')
+            plan = estimate.estimate(
+                ['foo', 'bar'], 'repositories', 'https://github.com', 1)
+        fetch_search_page.assert_not_called()
+        self.assertTrue(plan['archived'])
+        self.assertEqual(plan['results'], 2)
+        self.assertIn(
+            'first search page taken from the archive',
+            estimate.summary(plan))
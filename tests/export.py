@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+from gh_search.export import (
+    LongExporter, ColumnsExporter, ColumnsReader, open_exporter)
+from gh_search.records import RepoResult
+
+
+def results():
+    return [
+        RepoResult(
+            'https://github.com/foo/bar', {'Rust': 99.9, 'C': 0.1}),
+        RepoResult('https://github.com/foo/empty'),
+        RepoResult(
+            'https://github.com/qux/bar', {'C': 50, 'Go': 50})]
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'export')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_long_exporter(self):
+        with LongExporter(self.path) as exporter:
+            for result in results():
+                exporter.write(result)
+        with open(self.path) as fh:
+            content = fh.read()
+        expected = (
+            'repo\towner\tlanguage\tpercent\n'
+            'bar\tfoo\tRust\t99.9\n'
+            'bar\tfoo\tC\t0.1\n'
+            'bar\tqux\tC\t50.0\n'
+            'bar\tqux\tGo\t50.0\n')
+        self.assertEqual(content, expected)
+
+    def test_long_exporter_csv(self):
+        with open_exporter(self.path, 'csv') as exporter:
+            exporter.write(results()[0])
+        with open(self.path) as fh:
+            self.assertEqual(
+                fh.read().splitlines(),
+                ['repo,owner,language,percent',
+                 'bar,foo,Rust,99.9',
+                 'bar,foo,C,0.1'])
+
+    def test_columns(self):
+        with ColumnsExporter(self.path) as exporter:
+            for result in results():
+                exporter.write(result)
+
+        with open(os.path.join(self.path, 'languages.txt')) as fh:
+            self.assertEqual(fh.read(), 'Rust\nC\nGo\n')
+
+        with ColumnsReader(self.path) as reader:
+            self.assertEqual(len(reader), 3)
+            self.assertEqual(list(reader.offsets), [0, 2, 2, 4])
+            self.assertEqual(list(reader.lang_ids), [0, 1, 1, 2])
+            self.assertIsInstance(reader.percents, memoryview)
+            url, owner, repo, stats = reader[0]
+            self.assertEqual(
+                (url, owner, repo),
+                ('https://github.com/foo/bar', 'foo', 'bar'))
+            self.assertAlmostEqual(stats['Rust'], 99.9, places=4)
+            self.assertAlmostEqual(stats['C'], 0.1, places=4)
+            self.assertEqual(reader[1][3], {})
+            self.assertEqual(reader[2][3], {'C': 50.0, 'Go': 50.0})
+
+    def test_columns_incremental(self):
+        exporter = ColumnsExporter(self.path)
+        with ColumnsReader(self.path) as reader:
+            self.assertEqual(len(reader), 0)
+        exporter.write(results()[2])
+        exporter.flush()
+        with ColumnsReader(self.path) as reader:
+            self.assertEqual(len(reader), 1)
+            self.assertEqual(reader[0][3], {'C': 50.0, 'Go': 50.0})
+        exporter.close()
+
+    def test_columns_bad_version(self):
+        ColumnsExporter(self.path).close()
+        with open(os.path.join(self.path, 'meta.json'), 'w') as fh:
+            fh.write('{"version": 0, "byteorder": "little"}')
+        with self.assertRaises(ValueError):
+            ColumnsReader(self.path)
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import unittest
+
+from unittest.mock import patch
+
+from benchmarks.fake_github import FakeGitHub, Faults
+from gh_search import fetchers, metrics
+from gh_search.fetchers import (
+    fetch_links, fetch_lang_stats, handshake_summary, iter_pages_async,
+    make_session, warm_up)
+from gh_search.proxies import set_proxies
+
+
+class TestFaults(unittest.TestCase):
+    """
+    The fetchers against a local fake github that misbehaves
+    """
+
+    def setUp(self):
+        set_proxies([None])
+        # the fake github is local, no proxy must be used (aiohttp takes them
+        # from the environment)
+        environ = patch.dict('os.environ')
+        environ.start()
+        self.addCleanup(environ.stop)
+        for name in ('HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy'):
+            os.environ.pop(name, None)
+
+    @patch.object(fetchers, 'BACKOFF_BASE', 0.001)
+    def test_fetch_lang_stats_faults(self):
+        faults = Faults(error_rate=0.1, reset_rate=0.05, trickle_rate=0.1,
+                        trickle_time=0.05)
+        with FakeGitHub(repos=50, faults=faults) as gh:
+            links = fetch_links(['foo'], 'repositories', gh.url)
+            stats = fetch_lang_stats(links)
+        self.assertEqual(len(stats), 50)
+        for lang_stats in stats:
+            self.assertEqual(set(lang_stats), {'Python', 'Shell'})
+        self.assertEqual(len(gh.ok_paths), 51)
+        self.assertGreater(gh.wasted_requests(), 0)
+        self.assertEqual(
+            gh.wasted_requests(), gh.stats['503'] + gh.stats['reset'])
+
+    @patch.object(fetchers, 'BACKOFF_BASE', 0.001)
+    @patch.object(fetchers, 'BLOCKING_BACKOFF', False)
+    @patch('time.sleep')
+    def test_fetch_lang_stats_async_backoff(self, sleep):
+        with FakeGitHub(repos=20, faults=Faults(error_rate=0.2)) as gh:
+            stats = fetch_lang_stats(
+                [f'{gh.url}/user{i}/repo{i}' for i in range(20)])
+        self.assertEqual(len(stats), 20)
+        self.assertGreater(gh.stats['503'], 0)
+        sleep.assert_not_called()
+
+    @patch('time.sleep')
+    def test_fetch_links_reset(self, sleep):
+        with FakeGitHub(repos=3, faults=Faults(reset_rate=1)) as gh:
+            sleep.side_effect = lambda _: setattr(gh.faults, 'reset_rate', 0)
+            links = fetch_links(['foo'], 'repositories', gh.url)
+        self.assertEqual(len(links), 3)
+        self.assertEqual(gh.stats['reset'], 1)
+        self.assertEqual(sleep.call_count, 1)
+
+    @patch.object(fetchers, 'MAX_CONCURRENCY', 3)
+    @patch.dict(fetchers._handshakes, clear=True)
+    def test_warm_up(self):
+        metrics.reset()
+        set_proxies([None, '127.0.0.1:1'])  # nothing listens there
+
+        async def crawl(gh):
+            async with make_session() as session:
+                handshakes = await warm_up(session, gh.url, 3)
+                set_proxies([None])
+                urls = [f'{gh.url}/user{i}/repo{i}' for i in range(10)]
+                pages = [
+                    page async for _, page in iter_pages_async(urls, session)]
+            return handshakes, pages
+
+        with FakeGitHub(repos=10) as gh:
+            handshakes, pages = asyncio.get_event_loop().run_until_complete(
+                crawl(gh))
+        self.assertEqual(len(handshakes[None]), 3)
+        self.assertTrue(all(seconds > 0 for seconds in handshakes[None]))
+        self.assertEqual(handshakes['127.0.0.1:1'], [None, None, None])
+        self.assertEqual(metrics.get('warm_up.connections'), 3)
+        self.assertEqual(metrics.get('warm_up.failures'), 3)
+        # the pages were fetched on the connections that were already open
+        self.assertTrue(all(isinstance(page, bytes) for page in pages))
+        self.assertEqual(metrics.get('fetch.connections'), 3)
+
+        lines = handshake_summary()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1].split()[:3], ['127.0.0.1:1', '0', '3'])
+        self.assertEqual(lines[2].split()[:3], ['direct', '3', '0'])
@@ -1,28 +1,37 @@
 import asyncio
+import gzip
 import logging
 import os
+import time
 import unittest
 
 from unittest.mock import patch, MagicMock
 
-from asynctest import CoroutineMock
+import aiohttp
+import requests
 
+from gh_search import deadline, fetchers, metrics, transfer
 from gh_search.fetchers import (
-    fetch_links, fetch_many_pages_async, fetch_lang_stats)
-
-
-class MockResponse:
-    def __init__(self, content, status_code=200):
-        self.content = content.encode('utf-8')
-        self.status_code = status_code
+    CONNECT_TIMEOUT, READ_TIMEOUT, FetchError, InflightBytes, ResponseTooLarge,
+    fetch_links, fetch_many_pages_async, fetch_lang_stats, inflight_bytes,
+    iter_pages_async,
+    utf8_body)
+from gh_search.proxies import (
+    FAILURE_THRESHOLD, MIN_RETRIES, RETRY_RATIO, get_pool, set_proxies)
+from tests.mocks import MockResponse, mock_get, mock_response
 
 
 class TestFetchers(unittest.TestCase):
 
     def setUp(self):
         os.environ['HTTP_PROXY'] = 'proxy.mock'
+        set_proxies(None)
+        transfer.reset()
         logging.getLogger().setLevel(logging.CRITICAL)
 
+    def tearDown(self):
+        deadline.set_deadline(None)
+
     @patch('requests.get')
     def test_fetch_links(self, get):
         get.return_value = MockResponse("""
@@ -52,10 +61,18 @@ class TestFetchers(unittest.TestCase):
             'https://github.com')
         self.assertEqual(expected, result)
 
+    @patch('requests.get')
+    def test_fetch_links_page(self, get):
+        get.return_value = MockResponse('<div class="codesearch-results">')
+        fetch_links(['foo', 'bar'], 'repositories', 'https://github.com')
+        self.assertNotIn('p', get.call_args[1]['params'])
+        fetch_links(['foo', 'bar'], 'repositories', 'https://github.com', 3)
+        self.assertEqual(get.call_args[1]['params']['p'], 3)
+
     @patch('requests.get')
     def test_fetch_links_error(self, get):
         get.return_value = MockResponse("mock", 404)
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(FetchError):
             fetch_links(['foo', 'bar'], 'repositories', 'https://github.com')
 
     @patch('time.sleep')  # I am pathing sleep to speed things up
@@ -93,71 +110,504 @@ class TestFetchers(unittest.TestCase):
         self.assertEqual(get.call_count, 3)
         self.assertEqual(sleep.call_count, 2)
 
+    @patch('time.sleep')
+    @patch('requests.get')
+    def test_fetch_links_timeout(self, get, sleep):
+        get.side_effect = [
+            requests.Timeout('too slow'),
+            requests.ConnectionError('refused'),
+            MockResponse('<div class="codesearch-results">')]
+        result = fetch_links(['foo'], 'repositories', 'https://github.com')
+        self.assertEqual(result, [])
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(
+            get.call_args[1]['timeout'], (CONNECT_TIMEOUT, READ_TIMEOUT))
+
+    @patch('gh_search.fetchers.RETRY_BUDGET', 0)
+    @patch('time.sleep')
+    @patch('requests.get')
+    def test_fetch_links_retry_budget(self, get, sleep):
+        get.return_value = MockResponse("just keep waiting...", 429)
+        with self.assertRaises(FetchError):
+            fetch_links(['foo', 'bar'], 'repositories', 'https://github.com')
+        self.assertEqual(get.call_count, 1)
+        sleep.assert_not_called()
+
+    @patch('requests.get')
+    def test_fetch_links_deadline(self, get):
+        deadline.set_deadline(0)
+        with self.assertRaises(deadline.DeadlineExceeded):
+            fetch_links(['foo', 'bar'], 'repositories', 'https://github.com')
+        get.assert_not_called()
+        self.assertTrue(deadline.expired())
+
+    @patch('time.sleep')
+    @patch('requests.get')
+    def test_fetch_links_deadline_backoff(self, get, sleep):
+        # don't wait if the deadline is sooner than the next try
+        deadline.set_deadline(0.5)
+        get.return_value = MockResponse("just keep waiting...", 429)
+        with self.assertRaises(deadline.DeadlineExceeded):
+            fetch_links(['foo', 'bar'], 'repositories', 'https://github.com')
+        self.assertEqual(get.call_count, 1)
+        sleep.assert_not_called()
+        self.assertLessEqual(get.call_args[1]['timeout'][1], 0.5)
+
     @patch('time.sleep')
     @patch('requests.get')
     def test_fetch_links_backoff_error(self, get, sleep):
         get.return_value = MockResponse("just keep waiting...", 429)
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(FetchError):
             fetch_links(['foo', 'bar'], 'repositories', 'https://github.com')
-        self.assertEqual(get.call_count, 10)
+        # the proxy is not tried any more once its circuit breaker opens
+        self.assertEqual(get.call_count, FAILURE_THRESHOLD)
         self.assertEqual(sleep.call_count, 10)
 
+    @patch('time.sleep')
+    @patch('requests.get')
+    def test_fetch_links_proxy_breaker(self, get, sleep):
+        def search(url, params, proxies, **kwargs):
+            if proxies['https'] == 'http://bad.mock':
+                raise requests.ConnectionError('refused')
+            return MockResponse('<div class="codesearch-results">')
+
+        get.side_effect = search
+        set_proxies(['good.mock', 'bad.mock'])
+        for _ in range(20):
+            fetch_links(['foo'], 'repositories', 'https://github.com')
+        bad = [
+            call for call in get.call_args_list
+            if call[1]['proxies']['https'] == 'http://bad.mock']
+        self.assertLessEqual(len(bad), FAILURE_THRESHOLD)
+        self.assertEqual(get.call_count - len(bad), 20)
+
+    @patch('time.sleep')
+    @patch('requests.get')
+    def test_fetch_links_retry_budget_crawl(self, get, sleep):
+        # many proxies, so no circuit breaker opens and only the crawl retry
+        # budget stops the retries
+        set_proxies([f'{i}.mock' for i in range(100)])
+        get.return_value = MockResponse("just keep waiting...", 503)
+        for _ in range(3):
+            with self.assertRaises(FetchError):
+                fetch_links(['foo'], 'repositories', 'https://github.com')
+        retries = int(MIN_RETRIES + 3 * RETRY_RATIO)
+        self.assertEqual(get.call_count, 3 + retries)
+
+    @patch.object(fetchers, 'BACKOFF_BASE', 0.001)
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_retry_budget(self, get):
+        # once the crawl retry budget is used up, failing pages are given up
+        # on one by one, the rest are still fetched
+        set_proxies([f'{i}.mock' for i in range(100)])
+        urls = [
+            f'https://github.com/{"bad" if i % 2 else "foo"}/{i}'
+            for i in range(20)]
+        get.side_effect = mock_get(
+            {url: ('good', 0) for url in urls},
+            {url: 503 for url in urls if '/bad/' in url})
+        loop = asyncio.get_event_loop()
+        result = loop.run_until_complete(fetch_many_pages_async(urls, loop))
+        self.assertEqual(result[::2], [b'good'] * 10)
+        self.assertTrue(all(
+            isinstance(page, FetchError) and page.status == 503
+            for page in result[1::2]))
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_cancel_trial(self, get):
+        async def no_response(*args):
+            await asyncio.sleep(60)
+
+        get.return_value.__aenter__.side_effect = no_response
+        set_proxies(['foo.mock'], failure_threshold=1, reset_timeout=60)
+        pool = get_pool()
+        pool.record('foo.mock', ok=False)
+        pool.breakers['foo.mock'].opened_at -= 60
+        loop = asyncio.get_event_loop()
+        # the trial request is cancelled before it's done
+        with self.assertRaises(asyncio.TimeoutError):
+            loop.run_until_complete(asyncio.wait_for(
+                fetch_many_pages_async(['https://github.com/foo/bar'], loop),
+                0.05))
+        self.assertEqual(pool.acquire(), 'foo.mock')
+
     @patch('aiohttp.ClientSession.get')
     def test_fetch_many_pages_async(self, get):
-        get.return_value.__aenter__.return_value.status = 200
-        get.return_value.__aenter__.return_value.text = CoroutineMock(side_effect=['foo', 'bar'])  # noqa
+        get.return_value.__aenter__.return_value = mock_response(
+            200, 'foo', 'bar')
         loop = asyncio.get_event_loop()
         task = fetch_many_pages_async(
             ['https://github.com/foo/bar', 'https://github.com/foo/qux'],
             loop)
         result = loop.run_until_complete(task)
-        self.assertEqual(['foo', 'bar'], result)
+        self.assertEqual([b'foo', b'bar'], result)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_coalesce(self, get):
+        get.return_value.__aenter__.return_value = mock_response(
+            200, 'foo', 'bar')
+        loop = asyncio.get_event_loop()
+        task = fetch_many_pages_async(
+            ['https://github.com/foo/bar', 'https://github.com/foo/bar'],
+            loop)
+        result = loop.run_until_complete(task)
+        self.assertEqual([b'foo', b'foo'], result)
+        self.assertEqual(get.call_count, 1)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_shared_inflight(self, get):
+        get.side_effect = mock_get({
+            'https://github.com/foo/bar': ('foo', 0.01),
+            'https://github.com/foo/qux': ('bar', 0.01)})
+        loop = asyncio.get_event_loop()
+        inflight = {}
+        first, second = loop.run_until_complete(asyncio.gather(
+            fetch_many_pages_async(
+                ['https://github.com/foo/bar'], loop, inflight),
+            fetch_many_pages_async(
+                ['https://github.com/foo/bar', 'https://github.com/foo/qux'],
+                loop, inflight)))
+        self.assertEqual([b'foo'], first)
+        self.assertEqual([b'foo', b'bar'], second)
+        self.assertEqual(get.call_count, 2)
+        # finished fetches are not kept
+        self.assertEqual(inflight, {})
+
+    @patch('time.sleep')
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_shared_inflight_error(self, get, sleep):
+        get.return_value.__aenter__.return_value = mock_response(404, 'foo')
+        loop = asyncio.get_event_loop()
+        inflight = {}
+        [first] = loop.run_until_complete(fetch_many_pages_async(
+            ['https://github.com/foo/bar'], loop, inflight))
+        self.assertIsInstance(first, FetchError)
+        # a later call fetches it again instead of getting the same error
+        get.return_value.__aenter__.return_value = mock_response(200, 'foo')
+        second = loop.run_until_complete(fetch_many_pages_async(
+            ['https://github.com/foo/bar'], loop, inflight))
+        self.assertEqual(second, [b'foo'])
+        self.assertEqual(get.call_count, 2)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_parser(self, get):
+        get.return_value.__aenter__.return_value = mock_response(
+            200, 'foo', 'bar')
+        parser = MagicMock(side_effect=bytes.upper)
+        loop = asyncio.get_event_loop()
+        task = fetch_many_pages_async(
+            ['https://github.com/foo/bar', 'https://github.com/foo/bar'],
+            loop, parser=parser)
+        result = loop.run_until_complete(task)
+        self.assertEqual([b'FOO', b'FOO'], result)
+        self.assertEqual(parser.call_count, 1)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_limit(self, get):
+        get.side_effect = mock_get({
+            'https://github.com/foo/bar': ('foo', 0),
+            'https://github.com/foo/qux': ('bar', 0),
+            'https://github.com/foo/baz': ('baz', 60)})
+        loop = asyncio.get_event_loop()
+        task = fetch_many_pages_async(
+            ['https://github.com/foo/bar',
+             'https://github.com/foo/qux',
+             'https://github.com/foo/baz'],
+            loop, limit=2)
+        start = time.monotonic()
+        result = loop.run_until_complete(task)
+        self.assertEqual([b'foo', b'bar', None], result)
+        self.assertLess(time.monotonic() - start, 10)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_limit_order(self, get):
+        get.side_effect = mock_get({
+            'https://github.com/foo/bar': ('foo', 0.05),
+            'https://github.com/foo/qux': ('bar', 0),
+            'https://github.com/foo/baz': ('baz', 60)})
+        loop = asyncio.get_event_loop()
+        task = fetch_many_pages_async(
+            ['https://github.com/foo/bar',
+             'https://github.com/foo/qux',
+             'https://github.com/foo/baz'],
+            loop, limit=1)
+        result = loop.run_until_complete(task)
+        # the second one finished before the first, but it's not needed
+        self.assertEqual([b'foo', None, None], result)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_callback(self, get):
+        get.side_effect = mock_get({
+            'https://github.com/foo/bar': ('foo', 0.05),
+            'https://github.com/foo/qux': ('bar', 0)})
+        done = []
+        loop = asyncio.get_event_loop()
+        task = fetch_many_pages_async(
+            ['https://github.com/foo/bar', 'https://github.com/foo/qux'],
+            loop, callback=lambda i, page: done.append((i, page)))
+        result = loop.run_until_complete(task)
+        self.assertEqual([b'foo', b'bar'], result)
+        self.assertEqual([(0, b'foo'), (1, b'bar')], done)
 
     @patch('aiohttp.ClientSession.get')
     def test_fetch_many_pages_async_error(self, get):
-        get.return_value.__aenter__.return_value.status = 404
-        get.return_value.__aenter__.return_value.text = CoroutineMock(return_value='foo')  # noqa
+        get.return_value.__aenter__.return_value = mock_response(404, 'foo')
         loop = asyncio.get_event_loop()
         task = fetch_many_pages_async(['https://github.com/foo/bar'], loop)
-        with self.assertRaises(SystemExit):
-            loop.run_until_complete(task)
+        [error] = loop.run_until_complete(task)
+        self.assertIsInstance(error, FetchError)
+        self.assertEqual(error.status, 404)
 
+    @patch.object(fetchers, 'BLOCKING_BACKOFF', True)
     @patch('time.sleep')
     @patch('aiohttp.ClientSession.get')
     def test_fetch_many_pages_async_backoff(self, get, sleep):
         get.return_value.__aenter__.side_effect = [
-            MagicMock(
-                status=429,
-                text=CoroutineMock(return_value='wait for it')),
-            MagicMock(
-                status=503,
-                text=CoroutineMock(return_value='wait more')),
-            MagicMock(
-                status=200,
-                text=CoroutineMock(return_value="good"))]
+            mock_response(429, 'wait for it'),
+            mock_response(503, 'wait more'),
+            mock_response(200, 'good')]
         loop = asyncio.get_event_loop()
         task = fetch_many_pages_async(['https://github.com/foo/bar'], loop)
         result = loop.run_until_complete(task)
-        self.assertEqual(result, ["good"])
+        self.assertEqual(result, [b"good"])
         self.assertEqual(get.call_count, 3)
         self.assertEqual(sleep.call_count, 2)
 
+    @patch.object(fetchers, 'BLOCKING_BACKOFF', True)
     @patch('time.sleep')
     @patch('aiohttp.ClientSession.get')
     def test_fetch_many_pages_async_backoff_error(self, get, sleep):
-        get.return_value.__aenter__.return_value.text = CoroutineMock(return_value="just keep waiting...")  # noqa
-        get.return_value.__aenter__.return_value.status = 429
+        get.return_value.__aenter__.return_value = mock_response(
+            429, 'just keep waiting...')
         loop = asyncio.get_event_loop()
         task = fetch_many_pages_async(['https://github.com/foo/bar'], loop)
-        with self.assertRaises(SystemExit):
-            loop.run_until_complete(task)
-        self.assertEqual(get.call_count, 10)
+        [error] = loop.run_until_complete(task)
+        self.assertIsInstance(error, FetchError)
+        self.assertEqual(get.call_count, FAILURE_THRESHOLD)
         self.assertEqual(sleep.call_count, 10)
 
+    @patch.object(fetchers, 'BLOCKING_BACKOFF', True)
+    @patch('time.sleep')
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_network_error(self, get, sleep):
+        get.return_value.__aenter__.side_effect = [
+            aiohttp.ClientConnectionError('refused'),
+            asyncio.TimeoutError(),
+            mock_response(200, 'good')]
+        loop = asyncio.get_event_loop()
+        task = fetch_many_pages_async(['https://github.com/foo/bar'], loop)
+        self.assertEqual(loop.run_until_complete(task), [b'good'])
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_deadline(self, get):
+        get.side_effect = mock_get({
+            'https://github.com/foo/bar': ('foo', 0),
+            'https://github.com/foo/qux': ('bar', 60)})
+        loop = asyncio.get_event_loop()
+        deadline.set_deadline(0.1)
+        start = time.time()
+        task = fetch_many_pages_async(
+            ['https://github.com/foo/bar', 'https://github.com/foo/qux'],
+            loop)
+        result = loop.run_until_complete(task)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual([b'foo', None], result)
+        self.assertTrue(deadline.expired())
+
+    @patch('gh_search.fetchers.CHUNK_SIZE', 4)
+    @patch('gh_search.fetchers.MAX_BODY_SIZE', 10)
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_too_large(self, get):
+        response = mock_response(200, 'x' * 100)
+        chunks = []
+        iter_chunked = response.content.iter_chunked
+
+        async def read_chunks(size):
+            async for chunk in iter_chunked(size):
+                chunks.append(chunk)
+                yield chunk
+
+        response.content.iter_chunked = read_chunks
+        get.return_value.__aenter__.return_value = response
+        metrics.reset()
+        loop = asyncio.get_event_loop()
+        [result] = loop.run_until_complete(fetch_many_pages_async(
+            ['https://github.com/foo/bar'], loop))
+        self.assertIsInstance(result, ResponseTooLarge)
+        # it stops reading as soon as it goes over the limit
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(metrics.get('fetch.too_large'), 1)
+        self.assertEqual(inflight_bytes.used, 0)
+
+        # or without reading anything if the length is known
+        response.content_length = 100
+        [result] = loop.run_until_complete(fetch_many_pages_async(
+            ['https://github.com/foo/bar'], loop))
+        self.assertIsInstance(result, ResponseTooLarge)
+        self.assertEqual(len(chunks), 3)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_charset(self, get):
+        response = mock_response(200, 'foo')
+        response.charset = 'latin-1'
+        response.content.iter_chunked = lambda size: chunks()
+
+        async def chunks():
+            yield 'caf\xe9'.encode('latin-1')
+
+        get.return_value.__aenter__.return_value = response
+        loop = asyncio.get_event_loop()
+        result = loop.run_until_complete(fetch_many_pages_async(
+            ['https://github.com/foo/bar'], loop))
+        self.assertEqual(result, ['caf\xe9'.encode('utf-8')])
+
+    def test_utf8_body(self):
+        data = 'caf\xe9'.encode('utf-8')
+        self.assertIs(utf8_body(data), data)
+        self.assertIs(utf8_body(data, 'UTF8'), data)
+        self.assertIs(utf8_body(data, 'no-such-charset'), data)
+        self.assertEqual(utf8_body(b'caf\xe9', 'iso-8859-1'), data)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_gzip(self, get):
+        page = '<div>' + 'foo ' * 1000 + '</div>'
+        data = gzip.compress(page.encode('utf-8'))
+
+        async def chunks():
+            for i in range(0, len(data), 100):
+                yield data[i:i + 100]
+
+        response = mock_response(200, '')
+        response.headers = {'Content-Encoding': 'gzip'}
+        response.content.iter_chunked = lambda size: chunks()
+        get.return_value.__aenter__.return_value = response
+        loop = asyncio.get_event_loop()
+        result = loop.run_until_complete(fetch_many_pages_async(
+            ['https://github.com/foo/bar'], loop))
+        self.assertEqual(result, [page.encode('utf-8')])
+        self.assertTrue(get.call_args[1]['headers']['Accept-Encoding']
+                        .startswith('gzip, deflate'))
+        self.assertEqual(
+            transfer.snapshot(), {'proxy.mock': (1, len(data), len(page))})
+
+    @patch.object(fetchers, 'MAX_BODY_SIZE', 1000)
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_gzip_bomb(self, get):
+        data = gzip.compress(b'\0' * 10 * 1024 * 1024)
+        response = mock_response(200, '')
+        response.headers = {'Content-Encoding': 'gzip'}
+        response.content.iter_chunked = lambda size: chunks()
+
+        async def chunks():
+            yield data
+
+        decompressed = []
+        decoder = transfer.decoder
+
+        class Spy:
+            def __init__(self, encoding):
+                self.decoder = decoder(encoding)
+
+            def decompress(self, data, max_length=0):
+                out = self.decoder.decompress(data, max_length)
+                decompressed.append(len(out))
+                return out
+
+        get.return_value.__aenter__.return_value = response
+        loop = asyncio.get_event_loop()
+        with patch.object(transfer, 'decoder', Spy):
+            [result] = loop.run_until_complete(fetch_many_pages_async(
+                ['https://github.com/foo/bar'], loop))
+        self.assertIsInstance(result, ResponseTooLarge)
+        # only what it takes to go over the limit is decompressed
+        self.assertEqual(decompressed, [1001])
+
+    @patch('aiohttp.ClientSession.get')
+    def test_iter_pages_async_own_session(self, get):
+        get.return_value.__aenter__.return_value = mock_response(200, 'foo')
+        metrics.reset()
+
+        async def fetch():
+            # a session of the caller, which decompresses the pages itself
+            async with aiohttp.ClientSession() as session:
+                return [
+                    page async for _, page in iter_pages_async(
+                        ['https://github.com/foo/bar'], session)]
+
+        result = asyncio.get_event_loop().run_until_complete(fetch())
+        self.assertEqual(result, [b'foo'])
+        # what was transferred is unknown, only the body is counted
+        self.assertEqual(transfer.snapshot(), {'proxy.mock': (1, 0, 3)})
+        self.assertEqual(metrics.get('transfer.wire_bytes'), 0)
+
+    @patch('requests.get')
+    def test_fetch_links_transfer(self, get):
+        get.return_value = MockResponse('<div class="codesearch-results">')
+        get.return_value.raw = MagicMock(tell=MagicMock(return_value=10))
+        fetch_links(['foo'], 'repositories', 'https://github.com')
+        self.assertTrue(get.call_args[1]['headers']['Accept-Encoding']
+                        .startswith('gzip, deflate'))
+        self.assertEqual(transfer.snapshot(), {'proxy.mock': (1, 10, 32)})
+
+    def test_inflight_bytes(self):
+        budget = InflightBytes(10)
+        admitted = []
+
+        async def request(i):
+            await budget.admit(6)
+            admitted.append(i)
+
+        async def run():
+            await request(0)  # there is room
+            tasks = [asyncio.ensure_future(request(i)) for i in (1, 2)]
+            await asyncio.sleep(0.01)
+            self.assertEqual(admitted, [0])  # backpressure
+            # the page is kept, but no other read is going on
+            budget.finish(6, kept=6)
+            await asyncio.sleep(0.01)
+            self.assertEqual(admitted, [0, 1])
+            budget.release(6)  # the page is handed over
+            await asyncio.sleep(0.01)
+            self.assertEqual(admitted, [0, 1])
+            budget.finish(6)
+            await asyncio.gather(*tasks)
+
+        asyncio.get_event_loop().run_until_complete(run())
+        self.assertEqual(admitted, [0, 1, 2])
+        self.assertEqual((budget.used, budget.reading), (6, 1))
+
+    @patch.object(fetchers, 'MAX_BODY_SIZE', 10)
+    @patch('aiohttp.ClientSession.get')
+    def test_fetch_many_pages_async_inflight_bytes(self, get):
+        budget = InflightBytes(20)
+        pages = {
+            f'https://github.com/foo/{i}': ('foo', 0.05 if i == 0 else 0.01)
+            for i in range(8)}
+        get.side_effect = mock_get(pages)
+        reading, used = [], []
+        add = budget.add
+        budget.add = lambda n: (add(n), reading.append(budget.reading))
+        loop = asyncio.get_event_loop()
+        with patch.object(fetchers, 'inflight_bytes', budget):
+            result = loop.run_until_complete(fetch_many_pages_async(
+                list(pages), loop,
+                callback=lambda i, page: used.append(budget.used)))
+        self.assertEqual(result, [b'foo'] * 8)
+        # reads of unknown length reserve MAX_BODY_SIZE, so two fit at a time
+        self.assertEqual(max(reading), 2)
+        # the pages done before the slow first one stay counted until they
+        # are handed over
+        self.assertGreater(used[0], 0)
+        self.assertEqual((budget.used, budget.reading), (0, 0))
+
     @patch('aiohttp.ClientSession.get')
     def test_fetch_lang_stats(self, get):
-        get.return_value.__aenter__.return_value.status = 200
-        get.return_value.__aenter__.return_value.text = CoroutineMock(side_effect=[  # noqa
+        get.return_value.__aenter__.return_value = mock_response(
+            200,
             """
                 <div>
                   <h2>Languages</h2>
@@ -183,8 +633,7 @@ class TestFetchers(unittest.TestCase):
                     </li>
                   </ul>
                 </div>
-            """
-        ])
+            """)
         expected = [{'Rust': 100.0}, {'Go': 100.0}]
         result = list(fetch_lang_stats([
             'https://github.com/foo/bar', 'https://github.com/foo/qux']))
@@ -0,0 +1,43 @@
+import json
+import os
+import tempfile
+import unittest
+
+from gh_search import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_incr(self):
+        self.assertEqual(metrics.get('foo'), 0)
+        metrics.incr('foo')
+        metrics.incr('foo', 2)
+        metrics.incr('bar')
+        self.assertEqual(metrics.get('foo'), 3)
+        self.assertEqual(metrics.snapshot(), {'bar': 1, 'foo': 3})
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_set_max(self):
+        metrics.set_max('foo', 3)
+        metrics.set_max('foo', 1)
+        self.assertEqual(metrics.get('foo'), 3)
+        metrics.set_max('foo', 5)
+        self.assertEqual(metrics.get('foo'), 5)
+
+    def test_dump(self):
+        metrics.incr('foo')
+        with tempfile.NamedTemporaryFile(mode='w+') as fh:
+            metrics.dump(fh.name)
+            self.assertEqual(json.load(fh), {'foo': 1})
+
+    def test_load(self):
+        metrics.incr('foo', 2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'metrics.json')
+            self.assertEqual(metrics.load(path), {})
+            metrics.dump(path)
+            self.assertEqual(metrics.load(path), {'foo': 2})
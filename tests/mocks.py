@@ -0,0 +1,58 @@
+"""
+Mock http responses shared by the tests
+"""
+
+import asyncio
+
+from unittest.mock import MagicMock
+
+
+class MockResponse:
+    """
+    Mock for a `requests` response
+    """
+
+    def __init__(self, content, status_code=200):
+        self.content = content.encode('utf-8')
+        self.status_code = status_code
+
+
+def mock_response(status, *texts, delay=0):
+    """
+    Mock for an aiohttp response streaming each of the `texts` in turn (one
+    per request, the last one is repeated) after the given delay in seconds
+    """
+    texts = list(texts)
+
+    def iter_chunked(size):
+        text = texts.pop(0) if len(texts) > 1 else texts[0]
+
+        async def chunks():
+            await asyncio.sleep(delay)
+            data = text.encode('utf-8')
+            for i in range(0, len(data), size):
+                yield data[i:i + size]
+
+        return chunks()
+
+    return MagicMock(
+        status=status, charset='utf-8', content_length=None, headers={},
+        content=MagicMock(iter_chunked=iter_chunked))
+
+
+def mock_get(pages, statuses=None):
+    """
+    Mock for `aiohttp.ClientSession.get` returning, for each url, the text
+    in `pages` after the given delay in seconds (`pages` maps urls to
+    `(text, delay)`), with its status in `statuses` (200 by default)
+    """
+    statuses = statuses or {}
+
+    def get(url, **kwargs):
+        text, delay = pages[url]
+        response = MagicMock()
+        response.__aenter__.return_value = mock_response(
+            statuses.get(url, 200), text, delay=delay)
+        return response
+
+    return get
@@ -0,0 +1,120 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from unittest.mock import patch, MagicMock
+
+from gh_search import output
+from gh_search.output import SERIALIZERS, OutputWriter, get_serializer
+from gh_search.records import RepoResult, Result, to_json
+
+
+RECORDS = [
+    RepoResult('https://github.com/foo/bar', {'Rust': 47.2, 'C': 52.8}),
+    RepoResult('https://github.com/foo/qux'),
+    Result('https://github.com/foo/bar/issues/1'),
+    Result('https://github.com/föö/bar/issues/2'),
+    Result('https://github.com/foo/\U0001f600/issues/3'),
+    RepoResult('https://github.com/foo/baz', {'Go': 100.0}),
+]
+
+
+class TestOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'out.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, records, **kwargs):
+        with OutputWriter(self.path, **kwargs) as writer:
+            for record in records:
+                writer.write(record)
+        with open(self.path, encoding='utf-8') as fh:
+            return fh.read()
+
+    def test_get_serializer(self):
+        self.assertIn(get_serializer().name, SERIALIZERS)
+        self.assertEqual(get_serializer('json').name, 'json')
+        with self.assertRaises(ValueError):
+            get_serializer('foo')
+
+    def test_pretty(self):
+        expected = json.dumps(RECORDS, indent=2, default=to_json)
+        for name in SERIALIZERS:
+            for batch_size in (1, 2, 100):
+                self.assertEqual(
+                    self.write(
+                        RECORDS, serializer=name, batch_size=batch_size),
+                    expected)
+
+    def test_compact(self):
+        for name in SERIALIZERS:
+            output = self.write(
+                RECORDS, pretty=False, serializer=name, batch_size=2)
+            self.assertNotIn(' ', output)
+            self.assertEqual(
+                json.loads(output), [record.to_json() for record in RECORDS])
+
+    def test_empty(self):
+        for pretty in (True, False):
+            self.assertEqual(self.write([], pretty=pretty), '[]')
+
+    def test_stdout(self):
+        with io.StringIO() as buf:
+            with contextlib.redirect_stdout(buf):
+                with OutputWriter(pretty=False) as writer:
+                    writer.write('foo')
+            self.assertEqual(buf.getvalue(), '["foo"]')
+
+    def test_stdout_encoding(self):
+        code = (
+            'from gh_search.output import OutputWriter;'
+            'writer = OutputWriter(pretty=False);'
+            'writer.write("jos\\xe9");'
+            'writer.close()')
+        output = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, check=True,
+            env={**os.environ, 'PYTHONIOENCODING': 'ascii'}).stdout
+        self.assertEqual(output, b'["jos\\u00e9"]')
+
+    @patch.object(output, 'MAX_BATCHES', 1)
+    def test_write_async(self):
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.001)
+
+        async def run(writer):
+            ticker = asyncio.ensure_future(tick())
+            for record in RECORDS:
+                await writer.write_async(record)
+            ticker.cancel()
+
+        serializer = get_serializer('json')
+        dumps = serializer.dumps
+        with OutputWriter(self.path, batch_size=1) as writer:
+            writer.serializer = MagicMock(
+                dumps=lambda *args: time.sleep(0.05) or dumps(*args))
+            asyncio.get_event_loop().run_until_complete(run(writer))
+        # the loop kept running while waiting for the slow writer
+        self.assertGreater(len(ticks), 10)
+        with open(self.path, encoding='utf-8') as fh:
+            self.assertEqual(
+                fh.read(), json.dumps(RECORDS, indent=2, default=to_json))
+
+    def test_error(self):
+        for name in SERIALIZERS:
+            with self.assertRaises(TypeError):
+                self.write(['foo', object()], serializer=name, batch_size=1)
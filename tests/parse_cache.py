@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+from unittest.mock import MagicMock
+
+from gh_search import metrics, parse_cache
+from gh_search.parse_cache import MISSING, ParseCache, cache_key, parse
+
+
+def mock_parser(return_value):
+    parser = MagicMock(return_value=return_value)
+    parser.__name__ = 'mock_parser'
+    return parser
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        parse_cache.configure()
+        self.tmpdir.cleanup()
+
+    def test_cache_key(self):
+        parser = mock_parser(None)
+        self.assertEqual(
+            cache_key(parser, 'foo'), cache_key(parser, 'foo'))
+        self.assertNotEqual(
+            cache_key(parser, 'foo'), cache_key(parser, 'bar'))
+        self.assertNotEqual(
+            cache_key(parser, 'foo', 'issues'),
+            cache_key(parser, 'foo', 'wikis'))
+
+    def test_lru(self):
+        cache = ParseCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIs(cache.get('b'), MISSING)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(metrics.get('parse_cache.memory_hits'), 3)
+        self.assertEqual(metrics.get('parse_cache.misses'), 1)
+
+    def test_copies(self):
+        cache = ParseCache()
+        cache.put('a', {'Rust': 100.0})
+        cache.get('a')['Rust'] = 0
+        self.assertEqual(cache.get('a'), {'Rust': 100.0})
+
+    def test_disk(self):
+        path = os.path.join(self.tmpdir.name, 'cache.sqlite3')
+        ParseCache(path=path).put('a', ['foo'])
+        cache = ParseCache(path=path)
+        self.assertEqual(cache.get('a'), ['foo'])
+        self.assertEqual(cache.get('a'), ['foo'])
+        self.assertEqual(metrics.get('parse_cache.disk_hits'), 1)
+        self.assertEqual(metrics.get('parse_cache.memory_hits'), 1)
+
+    def test_parse(self):
+        parser = mock_parser({'Rust': 100.0})
+        parse_cache.configure()
+        self.assertEqual(parse(parser, 'foo'), {'Rust': 100.0})
+        self.assertEqual(parse(parser, 'foo'), {'Rust': 100.0})
+        self.assertEqual(parser.call_count, 1)
+        parse(parser, 'bar')
+        self.assertEqual(parser.call_count, 2)
+
+    def test_parse_none(self):
+        parser = mock_parser(None)
+        parse_cache.configure()
+        self.assertIsNone(parse(parser, 'foo'))
+        self.assertIsNone(parse(parser, 'foo'))
+        self.assertEqual(parser.call_count, 1)
+
+    def test_parse_disabled(self):
+        parser = mock_parser([])
+        parse_cache.configure(max_entries=0)
+        parse(parser, 'foo')
+        parse(parser, 'foo')
+        self.assertEqual(parser.call_count, 2)
@@ -4,8 +4,9 @@ import logging
 from bs4 import BeautifulSoup
 
 from gh_search.parse_html import (
-    get_link, get_repo_hits, get_issue_hits, get_wiki_hits, parse_links,
-    parse_lang_stat, parse_repo_lang_stats)
+    get_link, get_repo_hits, get_issue_hits, get_wiki_hits, make_soup,
+    parse_links, parse_result_count, parse_lang_stat, parse_repo_lang_stats,
+    parse_repo_page, parse_issue_page, parse_wiki_page)
 
 
 class TestParseHTML(unittest.TestCase):
@@ -352,6 +353,43 @@ class TestParseHTML(unittest.TestCase):
         result = parse_links(mock, 'repositories', 'https://github.com')
         self.assertEqual([], result)
 
+    def test_parse_result_count(self):
+        mock = """
+            <div class="codesearch-results">
+              <div>
+                <div>
+                  <h3>Sort options</h3>
+                  <h3>
+                    4,423 repository results
+                  </h3>
+                </div>
+                <ul class="repo-list">
+                </ul>
+              <div>
+            </div>
+        """
+        self.assertEqual(4423, parse_result_count(mock))
+
+        mock = """
+            <div class="codesearch-results">
+              <div>
+                <h3>12 issues</h3>
+              <div>
+            </div>
+        """
+        self.assertEqual(12, parse_result_count(mock))
+
+    def test_parse_result_count_none(self):
+        mock = """
+            <div class="codesearch-results">
+              <div>
+                <h3>We couldn't find any repositories matching 'foo'</h3>
+              <div>
+            </div>
+        """
+        self.assertEqual(0, parse_result_count(mock))
+        self.assertIsNone(parse_result_count("<div></div>"))
+
     def test_parse_lang_stat(self):
         mock = """
             <li>
@@ -479,3 +517,87 @@ class TestParseHTML(unittest.TestCase):
             </div>
         """
         self.assertEqual({}, parse_repo_lang_stats(mock))
+
+    def test_parse_repo_page(self):
+        mock = """
+            <div class="flash flash-warn flash-full">
+              This repository has been archived by the owner. It is now
+              read-only.
+            </div>
+            <div>
+              <h2>Languages</h2>
+              <ul>
+                <li><a><span>Go</span><span>100%</span></a></li>
+              </ul>
+            </div>
+        """
+        self.assertEqual(
+            parse_repo_page(mock),
+            {'languages': {'Go': 100.0}, 'archived': True})
+        self.assertEqual(
+            parse_repo_page('<div class="flash flash-warn">foo</div>'),
+            {'languages': {}, 'archived': False})
+
+    def test_parse_bytes(self):
+        # pages come from the fetchers as utf-8 bytes, never sniffed
+        mock = """
+            <div>
+              <h2>Languages</h2>
+              <ul>
+                <li><a><span>Emacs Lisp</span><span>100%</span></a></li>
+              </ul>
+            </div>
+            <p>éè</p>
+        """
+        self.assertEqual(
+            parse_repo_lang_stats(mock.encode('utf-8')),
+            {'Emacs Lisp': 100.0})
+        # a broken page still parses
+        self.assertEqual(make_soup(b'<p>\xff</p>').p.string, '\ufffd')
+
+    def test_parse_issue_page(self):
+        mock = """
+            <div class="gh-header">
+              <h1 class="gh-header-title">
+                <span class="js-issue-title markdown-title">
+                  Crash on start
+                </span>
+                <span>#42</span>
+              </h1>
+              <div class="gh-header-meta">
+                <span class="State State--closed" title="Status: Closed">
+                  Closed
+                </span>
+                foo opened this issue on 1 Jan 2021 · 1,024 comments
+              </div>
+            </div>
+            <div class="sidebar">
+              <a class="IssueLabel" data-name="bug">bug</a>
+              <a class="IssueLabel">help wanted</a>
+              <a class="IssueLabel" data-name="bug">bug</a>
+            </div>
+        """
+        self.assertEqual(parse_issue_page(mock), {
+            'title': 'Crash on start',
+            'state': 'closed',
+            'labels': ['bug', 'help wanted'],
+            'comments': 1024})
+        self.assertEqual(parse_issue_page("""
+            <div class="gh-header">
+              <h1 class="gh-header-title">Foo</h1>
+            </div>
+        """), {'title': 'Foo', 'state': None, 'labels': [], 'comments': 0})
+        self.assertIsNone(parse_issue_page('<div></div>'))
+
+    def test_parse_wiki_page(self):
+        mock = """
+            <div class="gh-header">
+              <h1 class="gh-header-title">Home</h1>
+              <div class="gh-header-meta">
+                foo edited this page on 1 Jan 2021 · 3 revisions
+              </div>
+            </div>
+        """
+        self.assertEqual(
+            parse_wiki_page(mock), {'title': 'Home', 'revisions': 3})
+        self.assertIsNone(parse_wiki_page('<div></div>'))
@@ -0,0 +1,186 @@
+import logging
+import os
+import unittest
+
+from datetime import date
+from unittest.mock import patch
+
+from gh_search.fetchers import FetchError
+from gh_search.planner import (
+    GH_EPOCH, MAX_RESULTS, split_slice, slice_qualifiers, plan_slices,
+    fetch_links_planned, _dimensions)
+from gh_search.proxies import set_proxies
+from tests.mocks import MockResponse
+
+
+def search_page(count, hrefs):
+    items = '\n'.join(
+        f"""
+        <li class="repo-list-item hx_hit-repo">
+          <div class="f4"><a href="{href}">foo</a></div>
+        </li>
+        """
+        for href in hrefs)
+    return f"""
+        <div class="codesearch-results">
+          <div>
+            <div><h3>{count:,} repository results</h3></div>
+            <ul class="repo-list">{items}</ul>
+          </div>
+        </div>
+    """
+
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['HTTP_PROXY'] = 'proxy.mock'
+        set_proxies(None)
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    def test_split_slice(self):
+        self.assertEqual(
+            split_slice(((0, 9), (0, None))),
+            (((0, 4), (0, None)), ((5, 9), (0, None))))
+        self.assertEqual(
+            split_slice(((3, 3), (0, None))),
+            (((3, 3), (0, 9)), ((3, 3), (10, None))))
+        self.assertEqual(
+            split_slice(((3, 3), (10, None))),
+            (((3, 3), (10, 29)), ((3, 3), (30, None))))
+        self.assertIsNone(split_slice(((3, 3), (4, 4))))
+
+    def test_slice_qualifiers(self):
+        dimensions = _dimensions('repositories')
+        today = date.today().toordinal()
+        self.assertEqual(
+            slice_qualifiers(((GH_EPOCH.toordinal(), today), (0, None)),
+                             dimensions),
+            [])
+        self.assertEqual(
+            slice_qualifiers(
+                ((date(2010, 1, 1).toordinal(), date(2010, 6, 30).toordinal()),
+                 (10, None)),
+                dimensions),
+            ['created:2010-01-01..2010-06-30', 'stars:>=10'])
+        self.assertEqual(
+            slice_qualifiers(((GH_EPOCH.toordinal(), today), (0, 9)),
+                             dimensions),
+            ['stars:0..9'])
+
+    def test_dimensions(self):
+        day = date(2010, 1, 1).toordinal()
+        for page_type, names in [
+                ('repositories', ['created', 'stars']),
+                ('issues', ['created']),
+                ('wikis', ['updated'])]:
+            dimensions = _dimensions(page_type)
+            self.assertEqual([name for name, *_ in dimensions], names)
+            full = tuple((lo, hi) for _, lo, hi, _ in dimensions)
+            one_day = ((day, day),) + full[1:]
+            self.assertEqual(
+                slice_qualifiers(one_day, dimensions)[0],
+                f'{names[0]}:2010-01-01..2010-01-01')
+            # only repos can be split beyond a single day (by stars)
+            self.assertEqual(
+                split_slice(one_day) is not None,
+                page_type == 'repositories')
+        with self.assertRaises(ValueError):
+            _dimensions('foo')
+
+    @patch('requests.get')
+    def test_plan_slices_small(self, get):
+        get.return_value = MockResponse(search_page(3, ['/a', '/b', '/c']))
+        result = plan_slices(['foo'], 'repositories', 'https://github.com')
+        expected = [(
+            [], 3,
+            ['https://github.com/a',
+             'https://github.com/b',
+             'https://github.com/c'])]
+        self.assertEqual(result, expected)
+        self.assertEqual(get.call_count, 1)
+
+    @patch('requests.get')
+    def test_plan_slices_refine(self, get):
+        def search(url, params, **kwargs):
+            # the full query is too big, each half of it fits
+            if params['q'] == 'foo':
+                return MockResponse(search_page(MAX_RESULTS + 1, ['/a']))
+            elif '2008-01-01' in params['q']:
+                return MockResponse(search_page(5, ['/a']))
+            else:
+                return MockResponse(search_page(7, ['/b']))
+
+        get.side_effect = search
+        result = plan_slices(['foo'], 'repositories', 'https://github.com')
+        self.assertEqual(len(result), 2)
+        (first_q, first_count, first_links), (second_q, second_count, _) = \
+            result
+        self.assertEqual(len(first_q), 1)
+        self.assertTrue(first_q[0].startswith('created:2008-01-01..'))
+        self.assertEqual(first_count, 5)
+        self.assertEqual(first_links, ['https://github.com/a'])
+        self.assertEqual(second_count, 7)
+        self.assertEqual(get.call_count, 3)
+
+    @patch('requests.get')
+    def test_plan_slices_wikis(self, get):
+        queries = []
+
+        def search(url, params, **kwargs):
+            queries.append(params['q'])
+            count = MAX_RESULTS + 1 if params['q'] == 'foo' else 5
+            return MockResponse(search_page(count, []))
+
+        get.side_effect = search
+        result = plan_slices(['foo'], 'wikis', 'https://github.com')
+        self.assertEqual([count for _, count, _ in result], [5, 5])
+        # wikis can only be searched by update date
+        self.assertTrue(all('updated:' in query for query in queries[1:]))
+        self.assertFalse(any('created:' in query for query in queries))
+
+    @patch('requests.get')
+    def test_fetch_links_planned(self, get):
+        def search(url, params, **kwargs):
+            if params['q'] == 'foo':
+                return MockResponse(search_page(MAX_RESULTS + 1, ['/a']))
+            elif '2008-01-01' in params['q']:
+                page = params.get('p', 1)
+                hrefs = {1: ['/a', '/b'], 2: ['/c']}[page]
+                return MockResponse(search_page(12, hrefs))
+            else:
+                return MockResponse(search_page(2, ['/c', '/d']))
+
+        get.side_effect = search
+        result = fetch_links_planned(
+            ['foo'], 'repositories', 'https://github.com')
+        expected = [
+            'https://github.com/a',
+            'https://github.com/b',
+            'https://github.com/c',
+            'https://github.com/d']
+        self.assertEqual(result, expected)
+        self.assertEqual(get.call_count, 4)
+
+    @patch('requests.get')
+    def test_plan_slices_error(self, get):
+        get.return_value = MockResponse("mock", 404)
+        with self.assertRaises(FetchError):
+            plan_slices(['foo'], 'repositories', 'https://github.com')
+
+    @patch('requests.get')
+    def test_fetch_links_planned_error(self, get):
+        # the second page of the first slice and the second slice fail
+        def search(url, params, **kwargs):
+            if params['q'] == 'foo':
+                return MockResponse(search_page(MAX_RESULTS + 1, ['/a']))
+            elif '2008-01-01' in params['q'] and 'p' not in params:
+                return MockResponse(search_page(12, ['/a', '/b']))
+            else:
+                return MockResponse('mock', 404)
+
+        get.side_effect = search
+        result = fetch_links_planned(
+            ['foo'], 'repositories', 'https://github.com')
+        self.assertEqual(
+            result, ['https://github.com/a', 'https://github.com/b'])
@@ -0,0 +1,95 @@
+import logging
+import unittest
+
+from unittest.mock import patch
+
+from gh_search.proxies import (
+    CLOSED, OPEN, HALF_OPEN, CircuitBreaker, NoProxyAvailable, ProxyPool,
+    RetryBudget, proxy_url)
+
+
+class TestProxies(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    @patch('time.monotonic')
+    def test_circuit_breaker(self, monotonic):
+        monotonic.return_value = 0
+        breaker = CircuitBreaker('foo', failure_threshold=2, reset_timeout=10)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_success()  # only failures in a row count
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+        # after the timeout, a single trial request goes through
+        monotonic.return_value = 10
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+        monotonic.return_value = 20
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    @patch('time.monotonic')
+    def test_circuit_breaker_trial(self, monotonic):
+        monotonic.return_value = 0
+        breaker = CircuitBreaker('foo', failure_threshold=1, reset_timeout=10)
+        breaker.record_failure()
+        monotonic.return_value = 10
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        # the trial was cancelled, another request gets to be the trial
+        breaker.release_trial()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        # or it was lost, and another one goes after a while
+        monotonic.return_value = 19
+        self.assertFalse(breaker.allow())
+        monotonic.return_value = 20
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+
+        # releasing doesn't change a closed breaker
+        breaker.record_success()
+        breaker.release_trial()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_pool(self):
+        pool = ProxyPool(['foo', 'bar'], failure_threshold=1)
+        self.assertIn(pool.acquire(), ['foo', 'bar'])
+        pool.record('foo', ok=False)
+        self.assertEqual(pool.states(), {'foo': OPEN, 'bar': CLOSED})
+        for _ in range(10):
+            self.assertEqual(pool.acquire(), 'bar')
+        pool.record('bar', ok=False)
+        with self.assertRaises(NoProxyAvailable):
+            pool.acquire()
+
+    def test_retry_budget(self):
+        budget = RetryBudget(ratio=0.5, min_retries=1)
+        for _ in range(4):
+            budget.first_attempt()
+        self.assertEqual(
+            [budget.allow_retry() for _ in range(4)],
+            [True, True, True, False])
+        budget.first_attempt()
+        budget.first_attempt()
+        self.assertTrue(budget.allow_retry())
+        self.assertFalse(budget.allow_retry())
+
+    def test_proxy_url(self):
+        self.assertEqual(proxy_url('1.2.3.4:8080'), 'http://1.2.3.4:8080')
+        self.assertEqual(proxy_url('socks5://foo:1'), 'socks5://foo:1')
+        self.assertIsNone(proxy_url(None))
@@ -0,0 +1,78 @@
+import json
+import unittest
+
+from gh_search.records import (
+    LanguageTable, Result, RepoResult, make_result, parse_link, to_json)
+
+
+class TestRecords(unittest.TestCase):
+
+    def test_parse_link(self):
+        self.assertEqual(parse_link('github.com//foo/bar'), ('foo', 'bar'))
+        self.assertEqual(
+            parse_link('https://github.com/foo/bar/issues/1'), ('foo', 'bar'))
+        self.assertEqual(
+            parse_link('https://www.github.com/foo/bar/wiki/qux'),
+            ('foo', 'bar'))
+        self.assertEqual(
+            parse_link('https://gitlab.com/foo/bar'), (None, None))
+
+    def test_language_table(self):
+        languages = LanguageTable()
+        self.assertEqual(languages.id('Rust'), 0)
+        self.assertEqual(languages.id('Go'), 1)
+        self.assertEqual(languages.id('Rust'), 0)
+        self.assertEqual(languages.name(1), 'Go')
+        self.assertEqual(len(languages), 2)
+
+    def test_result(self):
+        result = Result('https://github.com/foo/bar/issues/1')
+        self.assertEqual(result.owner, 'foo')
+        self.assertEqual(result.repo, 'bar')
+        self.assertEqual(
+            result.to_json(), {'url': 'https://github.com/foo/bar/issues/1'})
+        with self.assertRaises(AttributeError):
+            result.extra = {}
+
+    def test_repo_result(self):
+        languages = LanguageTable()
+        result = RepoResult(
+            'https://github.com/foo/bar',
+            {'CSS': 52, 'JavaScript': 47.2, 'HTML': 0.8},
+            languages)
+        self.assertEqual(list(result.lang_ids), [0, 1, 2])
+        self.assertEqual(
+            result.language_stats(languages),
+            {'CSS': 52.0, 'JavaScript': 47.2, 'HTML': 0.8})
+
+    def test_repo_result_to_json(self):
+        result = RepoResult('https://github.com/foo/bar')
+        self.assertEqual(
+            result.to_json(),
+            {
+                'url': 'https://github.com/foo/bar',
+                'extra': {'owner': 'foo', 'language_stats': {}}})
+        result.set_language_stats({'Rust': 99.9, 'C': 0.1})
+        self.assertEqual(
+            result.to_json()['extra']['language_stats'],
+            {'Rust': 99.9, 'C': 0.1})
+
+    def test_make_result(self):
+        self.assertIsInstance(
+            make_result('https://github.com/foo/bar', 'repositories'),
+            RepoResult)
+        result = make_result('https://github.com/foo/bar/wiki', 'wikis')
+        self.assertIsInstance(result, Result)
+        self.assertNotIsInstance(result, RepoResult)
+
+    def test_to_json(self):
+        records = [
+            Result('https://github.com/foo/bar/issues/1'),
+            {'url': 'https://github.com/foo/qux/issues/2'}]
+        self.assertEqual(
+            json.loads(json.dumps(records, default=to_json)),
+            [
+                {'url': 'https://github.com/foo/bar/issues/1'},
+                {'url': 'https://github.com/foo/qux/issues/2'}])
+        with self.assertRaises(TypeError):
+            json.dumps([object()], default=to_json)
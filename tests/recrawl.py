@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+from gh_search import recrawl
+from gh_search.recrawl import DAY, RecrawlSchedule
+
+
+class TestRecrawl(unittest.TestCase):
+
+    def test_change_rate(self):
+        # a repo seen once is assumed to change about weekly
+        once = recrawl.change_rate(1, 0, 0)
+        self.assertAlmostEqual(
+            recrawl.next_interval(once) / DAY, 4.4, places=1)
+        # never seen changing in a month of daily fetches
+        stable = recrawl.change_rate(31, 0, 30 * DAY)
+        self.assertLess(stable, once / 5)
+        # changing every time
+        busy = recrawl.change_rate(31, 30, 30 * DAY)
+        self.assertGreater(busy, 1 / DAY)
+        self.assertGreater(busy, recrawl.change_rate(11, 10, 10 * DAY))
+
+    def test_next_interval(self):
+        self.assertEqual(recrawl.next_interval(1), recrawl.MIN_INTERVAL)
+        self.assertEqual(recrawl.next_interval(1e-12), recrawl.MAX_INTERVAL)
+        self.assertEqual(
+            recrawl.next_interval(1, archived=True),
+            recrawl.ARCHIVED_INTERVAL)
+
+    def test_stale_probability(self):
+        self.assertEqual(recrawl.stale_probability(1 / DAY, 0), 0)
+        self.assertAlmostEqual(
+            recrawl.stale_probability(1 / DAY, DAY), 0.632, places=3)
+
+    def test_select(self):
+        schedule = RecrawlSchedule()
+        schedule.observe('foo', {'Go': 100.0}, now=0)
+        schedule.observe('bar', {'Go': 100.0}, now=0)
+        self.assertEqual(
+            schedule.select(['foo', 'bar', 'qux'], now=0), ['qux'])
+        self.assertEqual(
+            schedule.select(['foo', 'bar', 'qux'], now=30 * DAY),
+            ['qux', 'foo', 'bar'])
+        self.assertEqual(schedule.counts['reused'], 2)
+        self.assertEqual(schedule.counts['new'], 2)
+        self.assertEqual(schedule.counts['recrawled'], 2)
+
+    def test_select_budget(self):
+        schedule = RecrawlSchedule(budget=1)
+        # bar changes every time, foo never does
+        for i, now in enumerate(range(0, 10 * DAY, DAY)):
+            schedule.observe('foo', {'Go': 100.0}, now=now)
+            schedule.observe('bar', {'Go': float(i)}, now=now)
+        self.assertEqual(
+            schedule.select(['foo', 'bar'], now=60 * DAY), ['bar'])
+        # the budget is for the whole run
+        self.assertEqual(schedule.select(['foo'], now=60 * DAY), [])
+        self.assertGreater(schedule.stale, 0.9)
+        self.assertEqual(len(schedule.summary()), 5)
+
+    def test_observe(self):
+        schedule = RecrawlSchedule()
+        self.assertIsNone(schedule.languages('foo'))
+        schedule.observe('foo', {'Go': 100.0}, now=0)
+        schedule.observe('foo', {'Go': 100.0}, now=DAY)
+        schedule.observe('foo', {'Go': 90.0, 'C': 10.0}, now=2 * DAY)
+        self.assertEqual(schedule.languages('foo'), {'Go': 90.0, 'C': 10.0})
+        self.assertEqual(schedule.counts['changed'], 1)
+        self.assertEqual(
+            schedule.db.execute(
+                'SELECT changed_at FROM changes WHERE url = ?',
+                ('foo',)).fetchall(),
+            [(0,), (2 * DAY,)])
+
+    def test_observe_archived(self):
+        schedule = RecrawlSchedule()
+        schedule.observe('foo', {'Go': 100.0}, now=0)
+        schedule.observe('bar', {'Go': 100.0}, archived=True, now=0)
+        self.assertEqual(
+            schedule.select(['foo', 'bar'], now=30 * DAY), ['foo'])
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'recrawl', 'schedule.db')
+            schedule = RecrawlSchedule(path)
+            schedule.observe('foo', {'Go': 100.0}, now=0)
+            schedule.close()
+            schedule = RecrawlSchedule(path)
+            self.assertEqual(schedule.languages('foo'), {'Go': 100.0})
+            self.assertEqual(schedule.select(['foo'], now=0), [])
+            schedule.close()
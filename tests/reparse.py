@@ -0,0 +1,89 @@
+import tempfile
+import unittest
+
+from gh_search.archive import Archive
+from gh_search.reparse import reparse
+
+
+SEARCH_PAGE = """
+    <div class="codesearch-results">
+      <div>
+        <ul class="repo-list">
+          <li class="repo-list-item hx_hit-repo">
+            <div class="f4"><a href="/foo/bar">foo</a></div>
+          </li>
+          <li class="repo-list-item hx_hit-repo">
+            <div class="f4"><a href="/foo/qux">foo</a></div>
+          </li>
+        </ul>
+      <div>
+    </div>
+"""
+
+
+def repo_page(language):
+    return f"""
+        <div>
+          <h2>Languages</h2>
+          <ul>
+            <li><a><span>{language}</span><span>100%</span></a></li>
+          </ul>
+        </div>
+    """
+
+
+class TestReparse(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.archive = Archive(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_reparse(self):
+        for _ in range(2):
+            self.archive.store(
+                'https://github.com/search', 'search', SEARCH_PAGE,
+                page_type='repositories', gh_url='https://github.com')
+        self.archive.store(
+            'https://github.com/foo/bar', 'repo', repo_page('C'))
+        self.archive.store(
+            'https://github.com/foo/bar', 'repo', repo_page('Rust'))
+        result = [record.to_json() for record in reparse(self.tmpdir.name, 1)]
+        # foo/qux was never fetched
+        expected = [{
+            'url': 'https://github.com/foo/bar',
+            'extra': {'owner': 'foo', 'language_stats': {'Rust': 100.0}}}]
+        self.assertEqual(result, expected)
+
+    def test_reparse_issues(self):
+        self.archive.store(
+            'https://github.com/search', 'search',
+            """
+            <div class="codesearch-results">
+              <div class="issue-list">
+                <div class="issue-list-item hx_hit-issue">
+                  <div class="f4"><a href="/foo/bar/issues/1">foo</a></div>
+                </div>
+              </div>
+            </div>
+            """,
+            page_type='issues', gh_url='https://github.com')
+        result = [record.to_json() for record in reparse(self.tmpdir.name, 1)]
+        self.assertEqual(
+            result, [{'url': 'https://github.com/foo/bar/issues/1'}])
+
+        self.archive.store(
+            'https://github.com/foo/bar/issues/1', 'issue',
+            '<div class="gh-header"><h1 class="gh-header-title">Foo</h1>'
+            '</div>')
+        result = [record.to_json() for record in reparse(self.tmpdir.name, 1)]
+        self.assertEqual(result, [{
+            'url': 'https://github.com/foo/bar/issues/1',
+            'extra': {
+                'owner': 'foo', 'title': 'Foo', 'state': None, 'labels': [],
+                'comments': 0}}])
+
+    def test_reparse_empty(self):
+        self.assertEqual(reparse(self.tmpdir.name, 1), [])
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from gh_search.seen import (
+    ExactSeenSet, BloomSeenSet, url_digest, save_seen, load_seen, open_seen)
+
+
+URLS = [f'https://github.com/foo/bar{i}' for i in range(1000)]
+
+
+class TestSeen(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'seen')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_url_digest(self):
+        self.assertEqual(url_digest(URLS[0]), url_digest(URLS[0]))
+        self.assertNotEqual(url_digest(URLS[0]), url_digest(URLS[1]))
+        self.assertLess(url_digest(URLS[0]), 2**64)
+
+    def test_exact(self):
+        seen = ExactSeenSet(capacity=8)
+        self.assertTrue(all(map(seen.add, URLS)))
+        self.assertFalse(any(map(seen.add, URLS)))
+        self.assertEqual(len(seen), len(URLS))
+        self.assertIn(URLS[10], seen)
+        self.assertNotIn('https://github.com/foo/qux', seen)
+        self.assertLessEqual(seen.memory_usage(), 32 * len(URLS))
+
+    def test_bloom(self):
+        seen = BloomSeenSet(capacity=len(URLS), fp_rate=0.01)
+        new = sum(map(seen.add, URLS))
+        self.assertGreater(new, len(URLS) * 0.95)
+        self.assertTrue(all(url in seen for url in URLS))
+        self.assertFalse(any(map(seen.add, URLS)))
+        false_positives = sum(
+            f'https://github.com/qux/foo{i}' in seen for i in range(1000))
+        self.assertLess(false_positives, 50)
+        # about 9.6 bits per url for a 1% false positive rate
+        self.assertLess(seen.memory_usage(), 1.25 * len(URLS))
+
+    def test_save_load(self):
+        for seen in (ExactSeenSet(), BloomSeenSet(capacity=100)):
+            seen.add(URLS[0])
+            save_seen(seen, self.path)
+            loaded = load_seen(self.path)
+            self.assertIs(type(loaded), type(seen))
+            self.assertEqual(len(loaded), 1)
+            self.assertIn(URLS[0], loaded)
+            self.assertNotIn(URLS[1], loaded)
+            self.assertTrue(loaded.add(URLS[1]))
+
+    def test_load_bad_file(self):
+        with open(self.path, 'w') as fh:
+            fh.write('foo\n')
+        with self.assertRaises(ValueError):
+            load_seen(self.path)
+
+    def test_open_seen(self):
+        seen = open_seen(self.path, 'bloom', fp_rate=0.1)
+        self.assertIsInstance(seen, BloomSeenSet)
+        seen.add(URLS[0])
+        save_seen(seen, self.path)
+        self.assertIn(URLS[0], open_seen(self.path, 'bloom'))
+        self.assertIsInstance(open_seen(), ExactSeenSet)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from gh_search.sharded import coordinate, run_worker, run_workers, collect
+from gh_search.work_queue import WorkQueue
+from tests.mocks import MockResponse, mock_get, mock_response
+
+
+SEARCH_PAGE = """
+    <div class="codesearch-results">
+      <div>
+        <ul class="repo-list">
+          <li class="repo-list-item hx_hit-repo">
+            <div class="f4"><a href="/foo/bar">foo</a></div>
+          </li>
+          <li class="repo-list-item hx_hit-repo">
+            <div class="f4"><a href="/foo/qux">foo</a></div>
+          </li>
+        </ul>
+      <div>
+    </div>
+"""
+
+REPO_PAGE = """
+    <div>
+      <h2>Languages</h2>
+      <ul>
+        <li><a><span>Rust</span><span>100%</span></a></li>
+      </ul>
+    </div>
+"""
+
+
+class TestSharded(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_crawl(self, get, async_get):
+        get.return_value = MockResponse(SEARCH_PAGE)
+        async_get.return_value.__aenter__.return_value = mock_response(
+            200, REPO_PAGE)
+
+        # both searches find the same repos, they are only fetched once
+        coordinate(
+            self.tmpdir.name,
+            [(['foo'], 'repositories'), (['bar'], 'repositories')],
+            ['proxy.mock'],
+            shard_size=1)
+        run_worker(self.tmpdir.name, 'https://github.com', worker='test')
+
+        self.assertEqual(os.environ['HTTP_PROXY'], 'proxy.mock')
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(async_get.call_count, 2)
+        queue = WorkQueue(self.tmpdir.name)
+        self.assertEqual(queue.counts(), {'done': 4})
+        queue.close()
+        self.assertEqual(collect(self.tmpdir.name), [
+            {
+                'url': 'https://github.com/foo/bar',
+                'extra': {'owner': 'foo', 'language_stats': {'Rust': 100.0}}
+            },
+            {
+                'url': 'https://github.com/foo/qux',
+                'extra': {'owner': 'foo', 'language_stats': {'Rust': 100.0}}
+            }])
+
+    @patch('requests.get')
+    def test_crawl_issues(self, get):
+        get.return_value = MockResponse("""
+            <div class="codesearch-results">
+              <div class="issue-list">
+                <div class="issue-list-item hx_hit-issue">
+                  <div class="f4"><a href="/foo/bar/issues/1">foo</a></div>
+                </div>
+              </div>
+            </div>
+        """)
+        coordinate(self.tmpdir.name, [(['foo'], 'issues')], ['proxy.mock'])
+        run_worker(self.tmpdir.name, 'https://github.com')
+        self.assertEqual(
+            collect(self.tmpdir.name),
+            [{'url': 'https://github.com/foo/bar/issues/1'}])
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_crawl_repo_error(self, get, async_get):
+        get.return_value = MockResponse(SEARCH_PAGE)
+        async_get.side_effect = mock_get(
+            {
+                'https://github.com/foo/bar': (REPO_PAGE, 0),
+                'https://github.com/foo/qux': (REPO_PAGE, 0)},
+            {'https://github.com/foo/qux': 404})
+
+        coordinate(
+            self.tmpdir.name, [(['foo'], 'repositories')], ['proxy.mock'])
+        run_worker(self.tmpdir.name, 'https://github.com')
+
+        # the repo that can't be fetched doesn't fail the whole shard
+        queue = WorkQueue(self.tmpdir.name)
+        self.assertEqual(queue.counts(), {'done': 2})
+        self.assertEqual(
+            [url for url, _ in queue.failures()],
+            ['https://github.com/foo/qux'])
+        queue.close()
+        self.assertEqual(collect(self.tmpdir.name), [{
+            'url': 'https://github.com/foo/bar',
+            'extra': {'owner': 'foo', 'language_stats': {'Rust': 100.0}}}])
+
+    @patch('time.sleep')
+    @patch('requests.get')
+    def test_crawl_error(self, get, sleep):
+        get.return_value = MockResponse("mock", 404)
+        coordinate(self.tmpdir.name, [(['foo'], 'issues')], ['proxy.mock'])
+        run_worker(self.tmpdir.name, 'https://github.com')
+        queue = WorkQueue(self.tmpdir.name)
+        self.assertEqual(queue.counts(), {'failed': 1})
+        queue.close()
+
+    @patch('requests.get')
+    def test_run_workers_crash(self, get):
+        get.side_effect = RuntimeError('crash')
+        coordinate(self.tmpdir.name, [(['foo'], 'issues')], ['proxy.mock'])
+        with patch('sys.stderr'):  # the worker's traceback
+            counts, crashed = run_workers(
+                self.tmpdir.name, 'https://github.com', 1)
+        self.assertEqual(crashed, 1)
+        # its shard is left claimed until the lease expires
+        self.assertEqual(counts, {'claimed': 1})
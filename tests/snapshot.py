@@ -0,0 +1,199 @@
+import os
+import sqlite3
+import tarfile
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from gh_search import parse_cache
+from gh_search.archive import Archive
+from gh_search.parse_cache import ParseCache, parse
+from gh_search.parse_html import parse_links, parse_repo_page
+from gh_search.recrawl import DAY, RecrawlSchedule
+from gh_search.snapshot import export_snapshot, import_snapshot
+
+
+SEARCH_PAGE = """
+    <div class="codesearch-results">
+      <div>
+        <ul class="repo-list">
+          <li class="repo-list-item hx_hit-repo">
+            <div class="f4"><a href="/foo/bar">foo</a></div>
+          </li>
+        </ul>
+      <div>
+    </div>
+"""
+
+REPO_PAGE = """
+    <div>
+      <h2>Languages</h2>
+      <ul>
+        <li><a><span>Rust</span><span>100%</span></a></li>
+      </ul>
+    </div>
+"""
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.snapshot = self.path('snapshot.tar')
+
+    def tearDown(self):
+        parse_cache.configure()
+        self.tmpdir.cleanup()
+
+    def path(self, *names):
+        return os.path.join(self.tmpdir.name, *names)
+
+    def crawl(self, node, query='foo', repo='https://github.com/foo/bar'):
+        """
+        Fill the caches of a node as a crawl would
+        """
+        archive = Archive(self.path(node, 'archive'))
+        archive.store(
+            'https://github.com/search', 'search', SEARCH_PAGE,
+            params={'q': query, 'type': 'repositories'},
+            page_type='repositories', gh_url='https://github.com')
+        archive.store(repo, 'repo', REPO_PAGE)
+        parse_cache.configure(path=self.path(node, 'parse_cache'))
+        parse(parse_links, SEARCH_PAGE, 'repositories', 'https://github.com')
+        parse(parse_repo_page, REPO_PAGE)
+        schedule = RecrawlSchedule(self.path(node, 'recrawl'))
+        schedule.observe(repo, {'Rust': 100.0}, now=0)
+        schedule.close()
+
+    def stores(self, node):
+        return {
+            'archive_path': self.path(node, 'archive'),
+            'parse_cache_path': self.path(node, 'parse_cache'),
+            'recrawl_path': self.path(node, 'recrawl')}
+
+    def test_roundtrip(self):
+        self.crawl('old')
+        counts = export_snapshot(self.snapshot, **self.stores('old'))
+        self.assertEqual(counts, {
+            'pages': 2, 'blobs': 2, 'parse results': 2, 'repo histories': 1})
+
+        counts = import_snapshot(self.snapshot, **self.stores('new'))
+        self.assertEqual(counts, {
+            'pages': 2, 'blobs': 2, 'parse results': 2, 'repo histories': 1})
+        archive = Archive(self.path('new', 'archive'))
+        self.assertEqual(
+            archive.find('https://github.com/foo/bar', 'repo'), REPO_PAGE)
+        cache = ParseCache(path=self.path('new', 'parse_cache'))
+        self.assertEqual(len(list(cache.items())), 2)
+        schedule = RecrawlSchedule(self.path('new', 'recrawl'))
+        self.assertEqual(
+            schedule.languages('https://github.com/foo/bar'), {'Rust': 100.0})
+        schedule.close()
+
+        # importing it again adds nothing
+        counts = import_snapshot(self.snapshot, **self.stores('new'))
+        self.assertEqual(sum(counts.values()), 0)
+
+    def test_merge(self):
+        self.crawl('old')
+        self.crawl('new', repo='https://github.com/foo/qux')
+        # the new node fetched foo/bar later
+        schedule = RecrawlSchedule(self.path('new', 'recrawl'))
+        schedule.observe('https://github.com/foo/bar', {'C': 100.0}, now=DAY)
+        schedule.close()
+
+        export_snapshot(self.snapshot, **self.stores('old'))
+        counts = import_snapshot(self.snapshot, **self.stores('new'))
+        self.assertEqual(counts['pages'], 2)
+        self.assertEqual(counts['repo histories'], 0)
+        archive = Archive(self.path('new', 'archive'))
+        self.assertEqual(len(list(archive.entries())), 4)
+        schedule = RecrawlSchedule(self.path('new', 'recrawl'))
+        self.assertEqual(
+            schedule.languages('https://github.com/foo/bar'), {'C': 100.0})
+        self.assertEqual(len(schedule.db.execute(
+            'SELECT * FROM changes WHERE url = ?',
+            ('https://github.com/foo/bar',)).fetchall()), 2)
+        schedule.close()
+
+    def test_max_age(self):
+        self.crawl('old')
+        with patch('time.time', return_value=1e12):
+            counts = export_snapshot(
+                self.snapshot, **self.stores('old'), max_age=1)
+        self.assertEqual(sum(counts.values()), 0)
+
+    def test_queries(self):
+        self.crawl('old')
+        self.crawl('old', query='bar', repo='https://github.com/bar/bar')
+        counts = export_snapshot(
+            self.snapshot, **self.stores('old'), queries=['foo'])
+        # bar/bar wasn't found by the search for foo
+        self.assertEqual(counts, {
+            'pages': 2, 'blobs': 2, 'parse results': 2, 'repo histories': 1})
+        with self.assertRaises(ValueError):
+            export_snapshot(
+                self.snapshot, parse_cache_path=self.path('old', 'cache'),
+                queries=['foo'])
+
+    def test_corrupt(self):
+        self.crawl('old')
+        export_snapshot(self.snapshot, **self.stores('old'))
+        # flip a byte of the last member, the manifest goes after it
+        with tarfile.open(self.snapshot) as tar:
+            member = tar.getmember('recrawl.jsonl.gz')
+        with open(self.snapshot, 'r+b') as fh:
+            fh.seek(member.offset_data + 20)
+            byte = fh.read(1)
+            fh.seek(-1, os.SEEK_CUR)
+            fh.write(bytes([byte[0] ^ 0xff]))
+        with self.assertRaisesRegex(ValueError, 'match its hash'):
+            import_snapshot(self.snapshot, **self.stores('new'))
+        self.assertFalse(os.path.exists(self.path('new', 'recrawl')))
+
+        with open(self.snapshot, 'w') as fh:
+            fh.write('foo')
+        with self.assertRaisesRegex(ValueError, 'not a snapshot'):
+            import_snapshot(self.snapshot, **self.stores('new'))
+
+    def test_import_corrupt_blob(self):
+        self.crawl('old')
+        export_snapshot(self.snapshot, **self.stores('old'))
+        # flip a byte of the last blob, the first one is fine
+        with tarfile.open(self.snapshot) as tar:
+            blobs = [
+                info for info in tar if info.name.startswith('archive/blobs/')]
+        with open(self.snapshot, 'r+b') as fh:
+            fh.seek(blobs[-1].offset_data + 20)
+            byte = fh.read(1)
+            fh.seek(-1, os.SEEK_CUR)
+            fh.write(bytes([byte[0] ^ 0xff]))
+        with self.assertRaisesRegex(ValueError, 'corrupt|match its hash'):
+            import_snapshot(self.snapshot, **self.stores('new'))
+        # none of the blobs was written
+        self.assertEqual(
+            [names for _, _, names in os.walk(self.path('new', 'archive'))
+             if names], [])
+
+    def test_corrupt_blob(self):
+        archive = Archive(self.path('archive'))
+        sha = archive.store('https://github.com/foo/bar', 'repo', REPO_PAGE)
+        with self.assertRaisesRegex(ValueError, 'match its hash'):
+            archive.add_blob(sha.replace(sha[0], 'x'), archive.read_blob(sha))
+        with self.assertRaisesRegex(ValueError, 'corrupt'):
+            archive.add_blob('x' * 64, b'foo')
+
+    def test_old_parse_cache(self):
+        path = self.path('parse_cache')
+        db = sqlite3.connect(path)
+        db.execute(
+            'CREATE TABLE parse_cache '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        db.execute("INSERT INTO parse_cache VALUES ('a', '1')")
+        db.commit()
+        db.close()
+        cache = ParseCache(path=path)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual([key for key, _, _ in cache.items(since=0)], ['b'])
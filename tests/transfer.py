@@ -0,0 +1,82 @@
+import gzip
+import logging
+import unittest
+import zlib
+
+from gh_search import transfer
+
+
+def decode(decoder, data, chunk_size=7):
+    out = b''.join(
+        decoder.decompress(data[i:i + chunk_size])
+        for i in range(0, len(data), chunk_size))
+    return out + decoder.flush()
+
+
+class TestTransfer(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger().setLevel(logging.CRITICAL)
+        transfer.reset()
+
+    def test_decoder(self):
+        body = b'<div>foo</div>' * 100
+        self.assertEqual(decode(transfer.decoder(None), body), body)
+        self.assertEqual(decode(transfer.decoder('identity'), body), body)
+        self.assertEqual(
+            decode(transfer.decoder('gzip'), gzip.compress(body)), body)
+        self.assertEqual(
+            decode(transfer.decoder('deflate'), zlib.compress(body)), body)
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        raw_deflate = raw.compress(body) + raw.flush()
+        self.assertEqual(
+            decode(transfer.decoder('Deflate'), raw_deflate), body)
+        with self.assertRaises(transfer.UnsupportedEncoding):
+            transfer.decoder('compress')
+
+    def test_decoder_max_length(self):
+        bomb = b'\0' * 10 * 1024 * 1024
+        self.assertEqual(
+            len(transfer.decoder('gzip').decompress(gzip.compress(bomb), 100)),
+            100)
+        self.assertEqual(
+            len(transfer.decoder('deflate').decompress(
+                zlib.compress(bomb), 100)),
+            100)
+
+    @unittest.skipUnless(transfer.brotli, 'brotli is not installed')
+    def test_decoder_brotli(self):
+        body = b'<div>foo</div>' * 100
+        self.assertIn('br', transfer.ACCEPT_ENCODING)
+        self.assertEqual(
+            decode(transfer.decoder('br'), transfer.brotli.compress(body)),
+            body)
+        bomb = transfer.brotli.compress(b'\0' * 10 * 1024 * 1024)
+        self.assertEqual(
+            len(transfer.decoder('br').decompress(bomb, 100)), 100)
+
+    def test_summary(self):
+        self.assertEqual(transfer.summary(), [])
+        transfer.record('foo', 'proxy.mock', 25, 100)
+        transfer.record('bar', 'proxy.mock', 25, 100)
+        transfer.record('qux', None, 100, 100)
+        self.assertEqual(transfer.snapshot(), {
+            'proxy.mock': (2, 50, 200),
+            None: (1, 100, 100)})
+        header, direct, proxy, total = transfer.summary()
+        self.assertTrue(direct.startswith('direct'))
+        self.assertTrue(proxy.endswith('75.0%'))
+        self.assertEqual(total.split()[:4], ['total', '3', '150', '300'])
+        self.assertTrue(total.endswith('50.0%'))
+
+    def test_summary_unmeasured(self):
+        transfer.record('foo', 'proxy.mock', 25, 100)
+        # decompressed by the session, the transferred size is unknown
+        transfer.record('bar', 'proxy.mock', None, 100)
+        self.assertEqual(transfer.snapshot(), {'proxy.mock': (2, 25, 200)})
+        header, proxy, total, note = transfer.summary()
+        # only what's known is counted as saved
+        self.assertTrue(proxy.endswith('75.0%'))
+        self.assertTrue(total.endswith('75.0%'))
+        self.assertIn(
+            '`100` bytes were decompressed by the http session', note)
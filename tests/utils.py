@@ -1,23 +1,45 @@
+import asyncio
 import contextlib
 import io
 import logging
 import os
+import re
+import subprocess
+import sys
 import tempfile
 import textwrap
+import time
 import unittest
 
 from unittest.mock import patch, mock_open
 
-from asynctest import CoroutineMock
-
+from gh_search import deadline, metrics
+from gh_search.enrich import ENRICHERS
+from gh_search.fetchers import FetchError, make_session
+from gh_search.proxies import set_proxies
+from gh_search.recrawl import RecrawlSchedule
+from gh_search.records import Result
+from gh_search.seen import ExactSeenSet
 from gh_search.utils import (
-    get_owner, set_proxy, read_input, write_output, gh_search)
+    get_owner, dedupe_links, filter_results, set_proxy, read_input,
+    write_output, gh_search, gh_search_iter)
+from tests.mocks import MockResponse, mock_get, mock_response
 
 
-class MockResponse:
-    def __init__(self, content, status_code=200):
-        self.content = content.encode('utf-8')
-        self.status_code = status_code
+SEARCH_PAGE = """
+    <div class="codesearch-results">
+      <div>
+        <ul class="repo-list">
+          <li class="repo-list-item hx_hit-repo">
+            <div class="f4"><a href="/foo/bar">foo</a></div>
+          </li>
+          <li class="repo-list-item hx_hit-repo">
+            <div class="f4"><a href="/foo/qux">foo</a></div>
+          </li>
+        </ul>
+      <div>
+    </div>
+"""
 
 
 class TestUtils(unittest.TestCase):
@@ -36,6 +58,80 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(get_owner('https://www.github.com/foo/bar'), 'foo')
         self.assertEqual(get_owner('www.github.com/foo/bar'), 'foo')
 
+    def test_lazy_imports(self):
+        # the heavy dependencies are only loaded when they are used
+        code = (
+            'import sys, gh_search.utils, gh_search.sharded;'
+            'import gh_search.reparse;'
+            'print(" ".join(sorted({"aiohttp", "bs4", "requests"} & '
+            'set(sys.modules))))')
+        output = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True,
+            check=True).stdout
+        self.assertEqual(output.strip(), '')
+
+    def test_dedupe_links(self):
+        links = [
+            'https://github.com/foo/bar',
+            'https://github.com/foo/qux',
+            'https://github.com/foo/bar',
+            'https://github.com/bar/foo']
+        expected = [
+            'https://github.com/foo/bar',
+            'https://github.com/foo/qux',
+            'https://github.com/bar/foo']
+        self.assertEqual(dedupe_links(links), expected)
+        self.assertEqual(dedupe_links([]), [])
+
+    def test_dedupe_links_seen(self):
+        seen = ExactSeenSet()
+        seen.add('https://github.com/foo/bar')
+        links = [
+            'https://github.com/foo/bar',
+            'https://github.com/foo/qux',
+            'https://github.com/foo/qux']
+        self.assertEqual(
+            dedupe_links(links, seen), ['https://github.com/foo/qux'])
+        # it's up to the caller to add the new ones
+        self.assertNotIn('https://github.com/foo/qux', seen)
+
+    def test_filter_results(self):
+        results = [
+            Result('https://github.com/foo/bar'),
+            Result('https://github.com/Foo/qux'),
+            Result('https://github.com/bar/foo'),
+            Result('https://github.com/qux/bar-rs')]
+
+        def urls(results):
+            return [result.url for result in results]
+
+        self.assertEqual(filter_results(results), results)
+        self.assertEqual(
+            urls(filter_results(results, owners=['foo'])),
+            ['https://github.com/foo/bar', 'https://github.com/Foo/qux'])
+        self.assertEqual(
+            urls(filter_results(results, pattern=r'/bar')),
+            ['https://github.com/foo/bar',
+             'https://github.com/bar/foo',
+             'https://github.com/qux/bar-rs'])
+        self.assertEqual(
+            urls(filter_results(
+                results, owners=['foo', 'qux'], pattern=r'bar')),
+            ['https://github.com/foo/bar', 'https://github.com/qux/bar-rs'])
+        self.assertEqual(
+            urls(filter_results(results, pattern=re.compile(r'-rs$'))),
+            ['https://github.com/qux/bar-rs'])
+
+    def test_invalid_match_cli(self):
+        # reported before searching anything, instead of a traceback
+        process = subprocess.run(
+            [sys.executable, 'gh_search.py', 'in.json', '--match=('],
+            capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(process.returncode, 1)
+        self.assertIn('invalid match: `(`', process.stderr)
+        self.assertNotIn('Traceback', process.stderr)
+
     def test_set_proxy(self):
         proxies = [
             '188.28.254.196',
@@ -112,6 +208,13 @@ class TestReadInput(unittest.TestCase):
         write_output(['foo'], outfile.name)
         self.assertEqual(outfile.read(), '[\n  "foo"\n]')
 
+    def test_write_output_records(self):
+        outfile = tempfile.NamedTemporaryFile(mode='w+')
+        write_output([Result('https://github.com/foo/bar')], outfile.name)
+        self.assertEqual(
+            outfile.read(),
+            '[\n  {\n    "url": "https://github.com/foo/bar"\n  }\n]')
+
     def test_write_output_stdout(self):
         with io.StringIO() as buf:
             with contextlib.redirect_stdout(buf):
@@ -121,6 +224,23 @@ class TestReadInput(unittest.TestCase):
 
 class TestGHSearch(unittest.TestCase):
 
+    def setUp(self):
+        set_proxies(None)
+
+    def tearDown(self):
+        deadline.set_deadline(None)
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_deadline(self, get, async_get):
+        deadline.set_deadline(0)
+        result = gh_search(['foo', 'bar'], 'repositories', 'http://github.com')
+        self.assertEqual(result, [])
+        self.assertTrue(result.incomplete)
+        self.assertTrue(deadline.expired())
+        get.assert_not_called()
+        async_get.assert_not_called()
+
     @patch('aiohttp.ClientSession.get')
     @patch('requests.get')
     def test_gh_search(self, get, async_get):
@@ -135,9 +255,8 @@ class TestGHSearch(unittest.TestCase):
               <div>
             </div>
         """)
-        async_get.return_value.__aenter__.return_value.status = 200
-        async_get.return_value.__aenter__.return_value.text = CoroutineMock(
-            return_value="""
+        async_get.return_value.__aenter__.return_value = mock_response(
+            200, """
                 <div>
                   <h2>Languages</h2>
                   <ul>
@@ -152,11 +271,88 @@ class TestGHSearch(unittest.TestCase):
             """
         )
         result = gh_search(['foo', 'bar'], 'repositories', 'http://github.com')
+        self.assertFalse(result.incomplete)
+        result = [record.to_json() for record in result]
         expected = [{
             'url': 'http://github.com/foo/bar',
             'extra': {'owner': 'foo', 'language_stats': {'Rust': 100.0}}}]
         self.assertEqual(result, expected)
 
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_fetch_error(self, get, async_get):
+        get.return_value = MockResponse(SEARCH_PAGE)
+        async_get.side_effect = mock_get(
+            {
+                'http://github.com/foo/bar': ('<div></div>', 0),
+                'http://github.com/foo/qux': ('<div></div>', 0)},
+            {'http://github.com/foo/bar': 404})
+        result = gh_search(['foo'], 'repositories', 'http://github.com')
+        self.assertEqual(
+            [record.url for record in result], ['http://github.com/foo/qux'])
+
+        get.return_value = MockResponse('', 404)
+        with self.assertRaises(FetchError):
+            gh_search(['foo'], 'repositories', 'http://github.com')
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_duplicates(self, get, async_get):
+        get.return_value = MockResponse("""
+            <div class="codesearch-results">
+              <div>
+                <ul class="repo-list">
+                  <li class="repo-list-item hx_hit-repo">
+                    <div class="f4"><a href="/foo/bar">foo</a></div>
+                  </li>
+                  <li class="repo-list-item hx_hit-repo">
+                    <div class="f4"><a href="/foo/bar">foo</a></div>
+                  </li>
+                </ul>
+              <div>
+            </div>
+        """)
+        async_get.return_value.__aenter__.return_value = mock_response(
+            200, "<div></div>")
+        result = gh_search(['foo', 'bar'], 'repositories', 'http://github.com')
+        result = [record.to_json() for record in result]
+        expected = [{
+            'url': 'http://github.com/foo/bar',
+            'extra': {'owner': 'foo', 'language_stats': {}}}]
+        self.assertEqual(result, expected)
+        self.assertEqual(async_get.call_count, 1)
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_limit(self, get, async_get):
+        get.return_value = MockResponse("""
+            <div class="codesearch-results">
+              <div>
+                <ul class="repo-list">
+                  <li class="repo-list-item hx_hit-repo">
+                    <div class="f4"><a href="/foo/bar">foo</a></div>
+                  </li>
+                  <li class="repo-list-item hx_hit-repo">
+                    <div class="f4"><a href="/qux/bar">foo</a></div>
+                  </li>
+                  <li class="repo-list-item hx_hit-repo">
+                    <div class="f4"><a href="/foo/qux">foo</a></div>
+                  </li>
+                </ul>
+              <div>
+            </div>
+        """)
+        async_get.return_value.__aenter__.return_value = mock_response(
+            200, "<div></div>")
+        result = gh_search(
+            ['foo', 'bar'], 'repositories', 'http://github.com',
+            limit=1, owners=['foo'])
+        result = [record.to_json() for record in result]
+        expected = [{
+            'url': 'http://github.com/foo/bar',
+            'extra': {'owner': 'foo', 'language_stats': {}}}]
+        self.assertEqual(result, expected)
+
     @patch('requests.get')
     def test_gh_search_issue(self, get):
         get.return_value = MockResponse("""
@@ -179,5 +375,205 @@ class TestGHSearch(unittest.TestCase):
             </div>
         """)
         result = gh_search(['foo', 'bar'], 'issues', 'http://github.com')
+        result = [record.to_json() for record in result]
         expected = [{'url': 'http://github.com/mock'}]
         self.assertEqual(result, expected)
+
+    @patch('requests.get')
+    def test_gh_search_on_result(self, get):
+        get.return_value = MockResponse("""
+            <div class="codesearch-results">
+              <div>
+                <div id="issue-rearch-results">
+                  <div class="issue-list">
+                    <div>
+                      <div class="issue-list-item hx_hit-issue">
+                        <div>
+                          <div class="f4">
+                            <a href="/mock">foo</a>
+                          </div>
+                        </div>
+                      </div>
+                    </div>
+                  </div>
+                </div>
+              </div>
+            </div>
+        """)
+        done = []
+        result = gh_search(
+            ['foo', 'bar'], 'issues', 'http://github.com',
+            on_result=done.append)
+        self.assertEqual(result, done)
+        self.assertEqual(len(done), 1)
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_iter(self, get, async_get):
+        get.return_value = MockResponse(SEARCH_PAGE)
+        async_get.side_effect = mock_get({
+            'http://github.com/foo/bar': ('<div></div>', 0),
+            'http://github.com/foo/qux': ('<div></div>', 0)})
+
+        async def search():
+            async with make_session() as session:
+                found = [
+                    result.url async for result in gh_search_iter(
+                        ['foo'], 'repositories', 'http://github.com',
+                        session)]
+                # the session belongs to the caller, it's not closed
+                self.assertFalse(session.closed)
+            return found
+
+        result = asyncio.get_event_loop().run_until_complete(search())
+        self.assertEqual(
+            result, ['http://github.com/foo/bar', 'http://github.com/foo/qux'])
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_schedule(self, get, async_get):
+        get.return_value = MockResponse(SEARCH_PAGE)
+        # only the new repo is fetched
+        async_get.side_effect = mock_get({
+            'http://github.com/foo/qux': ('<div></div>', 0)})
+        schedule = RecrawlSchedule()
+        schedule.observe('http://github.com/foo/bar', {'Go': 100.0})
+        result = gh_search(
+            ['foo'], 'repositories', 'http://github.com', schedule=schedule)
+        self.assertEqual(
+            [(record.url, record.language_stats()) for record in result],
+            [('http://github.com/foo/bar', {'Go': 100.0}),
+             ('http://github.com/foo/qux', {})])
+        self.assertEqual(async_get.call_count, 1)
+        self.assertEqual(schedule.languages('http://github.com/foo/qux'), {})
+        self.assertEqual(schedule.counts['reused'], 1)
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_keep(self, get, async_get):
+        get.return_value = MockResponse(SEARCH_PAGE)
+        async_get.side_effect = mock_get({
+            'http://github.com/foo/bar': ('<div></div>', 0),
+            'http://github.com/foo/qux': ('<div></div>', 0)})
+        found = []
+        result = gh_search(
+            ['foo'], 'repositories', 'http://github.com',
+            on_result=found.append, keep=False)
+        self.assertEqual(result, [])
+        self.assertEqual(
+            [record.url for record in found],
+            ['http://github.com/foo/bar', 'http://github.com/foo/qux'])
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_seen(self, get, async_get):
+        get.return_value = MockResponse(SEARCH_PAGE)
+        async_get.side_effect = mock_get({
+            'http://github.com/foo/bar': ('<div></div>', 0),
+            'http://github.com/foo/qux': ('<div></div>', 0)})
+        seen = ExactSeenSet()
+        result = gh_search(
+            ['foo'], 'repositories', 'http://github.com', limit=1, seen=seen)
+        self.assertEqual(len(result), 1)
+        # only the result found is seen, the one left out is still new
+        self.assertIn('http://github.com/foo/bar', seen)
+        self.assertNotIn('http://github.com/foo/qux', seen)
+
+        result = gh_search(
+            ['foo'], 'repositories', 'http://github.com', seen=seen)
+        self.assertEqual(
+            [record.url for record in result], ['http://github.com/foo/qux'])
+        self.assertIn('http://github.com/foo/qux', seen)
+
+    @patch('gh_search.utils.warm_up')
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_warm(self, get, async_get, warm_up):
+        get.return_value = MockResponse(SEARCH_PAGE)
+        async_get.side_effect = mock_get({
+            'http://github.com/foo/bar': ('<div></div>', 0),
+            'http://github.com/foo/qux': ('<div></div>', 0)})
+        warmed = []
+
+        async def warm(session, gh_url, connections):
+            warmed.append((gh_url, connections))
+            await asyncio.sleep(10)  # still warming up when it's done
+
+        warm_up.side_effect = warm
+        result = gh_search(
+            ['foo'], 'repositories', 'http://github.com', warm=2)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(warmed, [('http://github.com', 2)])
+
+        # nothing to warm up for if no page is fetched
+        gh_search(['foo'], 'issues', 'http://github.com', warm=2)
+        self.assertEqual(len(warmed), 1)
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_enrich(self, get, async_get):
+        get.return_value = MockResponse("""
+            <div class="codesearch-results">
+              <div class="issue-list">
+                <div class="issue-list-item hx_hit-issue">
+                  <div class="f4"><a href="/foo/bar/issues/1">foo</a></div>
+                </div>
+              </div>
+            </div>
+        """)
+        async_get.return_value.__aenter__.return_value = mock_response(
+            200, """
+                <div class="gh-header">
+                  <h1 class="gh-header-title">Foo</h1>
+                  <div class="gh-header-meta">
+                    <span class="State State--open">Open</span> 2 comments
+                  </div>
+                </div>
+            """)
+        result = gh_search(['foo'], 'issues', 'http://github.com')
+        self.assertEqual(
+            [record.to_json() for record in result],
+            [{'url': 'http://github.com/foo/bar/issues/1'}])
+        async_get.assert_not_called()
+
+        metrics.reset()
+        result = gh_search(
+            ['foo'], 'issues', 'http://github.com',
+            enricher=ENRICHERS['issue'])
+        self.assertEqual([record.to_json() for record in result], [{
+            'url': 'http://github.com/foo/bar/issues/1',
+            'extra': {
+                'owner': 'foo', 'title': 'Foo', 'state': 'open',
+                'labels': [], 'comments': 2}}])
+        self.assertEqual(metrics.get('fetch.issue.requests'), 1)
+        self.assertEqual(metrics.get('transfer.issue.pages'), 1)
+
+    @patch('aiohttp.ClientSession.get')
+    @patch('requests.get')
+    def test_gh_search_iter_cancel(self, get, async_get):
+        get.return_value = MockResponse(SEARCH_PAGE)
+        async_get.side_effect = mock_get({
+            'http://github.com/foo/bar': ('<div></div>', 0),
+            'http://github.com/foo/qux': ('<div></div>', 60)})
+
+        async def search():
+            found = []
+            async for result in gh_search_iter(
+                    ['foo'], 'repositories', 'http://github.com'):
+                found.append(result.url)
+            return found
+
+        async def cancel_soon():
+            task = asyncio.ensure_future(search())
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # nothing is left running
+            self.assertEqual(
+                {t for t in asyncio.all_tasks() if not t.done()},
+                {asyncio.current_task()})
+
+        start = time.time()
+        asyncio.get_event_loop().run_until_complete(cancel_soon())
+        self.assertLess(time.time() - start, 5)
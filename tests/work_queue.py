@@ -0,0 +1,102 @@
+import tempfile
+import unittest
+
+from gh_search.work_queue import WorkQueue
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(self.tmpdir.name)
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmpdir.cleanup()
+
+    def test_meta(self):
+        self.assertIsNone(self.queue.get_meta('proxies'))
+        self.queue.set_meta('proxies', ['foo', 'bar'])
+        self.assertEqual(self.queue.get_meta('proxies'), ['foo', 'bar'])
+
+    def test_claim(self):
+        first = self.queue.add_shard('search', 'repositories', ['foo'])
+        second = self.queue.add_shard('search', 'issues', ['bar'])
+        shard = self.queue.claim('worker')
+        self.assertEqual(
+            (shard.id, shard.kind, shard.page_type, shard.payload),
+            (first, 'search', 'repositories', ['foo']))
+        self.assertEqual(self.queue.claim('worker').id, second)
+        self.assertIsNone(self.queue.claim('worker'))
+        self.assertFalse(self.queue.is_finished())
+
+    def test_claim_expired_lease(self):
+        queue = WorkQueue(self.tmpdir.name, lease_time=-1)
+        shard_id = queue.add_shard('search', 'repositories', ['foo'])
+        self.assertEqual(queue.claim('worker').id, shard_id)
+        # the first worker died, so another one can claim it
+        self.assertEqual(queue.claim('other').id, shard_id)
+        queue.close()
+
+    def test_claim_expired_lease_tries(self):
+        queue = WorkQueue(self.tmpdir.name, lease_time=-1)
+        queue.add_shard('search', 'repositories', ['foo'])
+        queue.claim('worker', max_tries=2)
+        queue.claim('other', max_tries=2)
+        # it killed both workers, so it's not tried again
+        self.assertIsNone(queue.claim('third', max_tries=2))
+        self.assertEqual(queue.counts(), {'failed': 1})
+        self.assertTrue(queue.is_finished())
+        queue.close()
+
+    def test_complete(self):
+        first = self.queue.add_shard('repos', 'repositories', ['foo'])
+        second = self.queue.add_shard('repos', 'repositories', ['bar'])
+        self.queue.claim('worker')
+        self.queue.claim('worker')
+        self.queue.complete(second, [{'url': 'c'}])
+        self.queue.complete(first, [{'url': 'a'}, {'url': 'b'}])
+        self.assertTrue(self.queue.is_finished())
+        self.assertEqual(self.queue.counts(), {'done': 2})
+        self.assertEqual(
+            list(self.queue.results()),
+            [{'url': 'a'}, {'url': 'b'}, {'url': 'c'}])
+
+    def test_release(self):
+        shard_id = self.queue.add_shard('repos', 'repositories', ['foo'])
+        self.queue.claim('worker')
+        self.queue.release(shard_id, max_tries=2)
+        self.assertEqual(self.queue.counts(), {'pending': 1})
+        self.queue.claim('worker')
+        self.queue.release(shard_id, max_tries=2)
+        self.assertEqual(self.queue.counts(), {'failed': 1})
+        self.assertTrue(self.queue.is_finished())
+
+    def test_mark_seen(self):
+        self.assertEqual(self.queue.mark_seen(['a', 'b']), ['a', 'b'])
+        self.assertEqual(self.queue.mark_seen(['b', 'c', 'a']), ['c'])
+
+    def test_complete_failures(self):
+        shard_id = self.queue.add_shard('repos', 'repositories', ['a', 'b'])
+        self.queue.claim('worker')
+        self.queue.complete(
+            shard_id, [{'url': 'a'}], [('b', ValueError('not found'))])
+        self.assertEqual(self.queue.counts(), {'done': 1})
+        self.assertEqual(list(self.queue.results()), [{'url': 'a'}])
+        self.assertEqual(list(self.queue.failures()), [('b', 'not found')])
+
+    def test_transaction(self):
+        shard_id = self.queue.add_shard('search', 'repositories', ['foo'])
+        self.queue.claim('worker')
+        with self.assertRaises(RuntimeError):
+            with self.queue.transaction():
+                self.queue.mark_seen(['a'])
+                self.queue.add_shard('repos', 'repositories', ['a'])
+                raise RuntimeError
+        # nothing of it was kept
+        self.assertEqual(self.queue.counts(), {'claimed': 1})
+        with self.queue.transaction():
+            self.assertEqual(self.queue.mark_seen(['a']), ['a'])
+            self.queue.add_shard('repos', 'repositories', ['a'])
+            self.queue.complete(shard_id, [])
+        self.assertEqual(self.queue.counts(), {'done': 1, 'pending': 1})